@@ -7,16 +7,13 @@ from fastapi.security.api_key import APIKey
 from jugalbandi.core import (
   Language,
   MediaFormat,
+  AudioFormat,
   IncorrectInputException,
-  SpeechProcessor as SpeechProcessorEnum
-)
-from jugalbandi.translator import Translator
-from jugalbandi.speech_processor import (
-  SpeechProcessor,
-  AzureSpeechProcessor,
-  GoogleSpeechProcessor,
-  DhruvaSpeechProcessor
+  SpeechProcessor as SpeechProcessorEnum,
+  client_registry,
 )
+from jugalbandi.translator import Translator, CachingTranslator
+from jugalbandi.speech_processor import SpeechProcessor
 from jugalbandi.audio_converter import convert_to_wav_with_ffmpeg
 from jugalbandi.tenant import TenantRepository
 from jugalbandi.document_collection import (
@@ -46,6 +43,7 @@ from .server_helper import (
     verify_access_token,
     get_document_repository,
     get_speech_processor,
+    get_single_speech_processor,
     get_translator,
     User,
 )
@@ -101,6 +99,18 @@ app.add_middleware(
 )
 
 Instrumentator().instrument(app).expose(app)
+
+
+@app.on_event("startup")
+async def startup():
+    await client_registry.startup()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await client_registry.shutdown()
+
+
 # app.add_middleware(ApiKeyMiddleware, tenant_repository=get_tenant_repository())
 
 
@@ -303,12 +313,14 @@ async def query_with_voice_input_gpt3_5(
     query_text: str = "",
     audio_url: str = "",
     prompt: str = "",
+    audio_format: AudioFormat = AudioFormat.MP3,
 ) -> QueryResponse:
     return await langchain_qa_engine.query(
         query=query_text,
         speech_query_url=audio_url,
         input_language=input_language,
         output_format=output_format,
+        audio_format=audio_format,
         prompt=prompt,
         source_text_filtering=False,
     )
@@ -328,12 +340,14 @@ async def query_with_voice_input_gpt4(
     query_text: str = "",
     audio_url: str = "",
     prompt: str = "",
+    audio_format: AudioFormat = AudioFormat.MP3,
 ) -> QueryResponse:
     return await langchain_qa_engine.query(
         query=query_text,
         speech_query_url=audio_url,
         input_language=input_language,
         output_format=output_format,
+        audio_format=audio_format,
         prompt=prompt,
     )
 
@@ -403,6 +417,28 @@ async def get_source_document(
     return answer
 
 
+@app.get("/translation-cache-stats", include_in_schema=False)
+async def get_translation_cache_stats(
+    authorization: Annotated[User, Depends(verify_access_token)],
+    translator: Annotated[CachingTranslator, Depends(get_translator)],
+):
+    stats = translator.stats()
+    return {
+        "memory_hits": stats.memory_hits,
+        "store_hits": stats.store_hits,
+        "misses": stats.misses,
+        "memory_size": stats.memory_size,
+        "hit_ratio": stats.hit_ratio,
+    }
+
+
+@app.get("/client-stats", include_in_schema=False)
+async def get_client_stats(
+    authorization: Annotated[User, Depends(verify_access_token)],
+):
+    return {name: vars(stats) for name, stats in client_registry.stats().items()}
+
+
 # Testing STT endpoint
 @app.get(
     "/speech-to-text",
@@ -415,12 +451,7 @@ async def get_speech_to_text(
     language: Language,
     speech_processor_enum: SpeechProcessorEnum
 ):
-    if speech_processor_enum.value == "Azure":
-        speech_processor = AzureSpeechProcessor()
-    elif speech_processor_enum.value == "Google":
-        speech_processor = GoogleSpeechProcessor()
-    else:
-        speech_processor = DhruvaSpeechProcessor()
+    speech_processor = await get_single_speech_processor(speech_processor_enum)
 
     wav_data = await convert_to_wav_with_ffmpeg(speech_query_url)
     text = await speech_processor.speech_to_text(wav_data, language)
@@ -437,17 +468,14 @@ async def get_text_to_speech(
     authorization: Annotated[User, Depends(verify_access_token)],
     text_query: str,
     language: Language,
-    speech_processor_enum: SpeechProcessorEnum
+    speech_processor_enum: SpeechProcessorEnum,
+    audio_format: AudioFormat = AudioFormat.MP3,
 ):
-    if speech_processor_enum.value == "Azure":
-        speech_processor = AzureSpeechProcessor()
-    elif speech_processor_enum.value == "Google":
-        speech_processor = GoogleSpeechProcessor()
-    else:
-        speech_processor = DhruvaSpeechProcessor()
+    speech_processor = await get_single_speech_processor(speech_processor_enum)
 
     print(text_query)
-    audio_bytes = await speech_processor.text_to_speech(text_query, language)
+    audio_bytes = await speech_processor.text_to_speech(text_query, language,
+                                                        audio_format=audio_format)
     audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
     return {"audio_bytes": audio_base64}
 
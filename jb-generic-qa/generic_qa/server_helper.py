@@ -6,6 +6,7 @@ from fastapi import HTTPException, Depends, status, Security
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.security.api_key import APIKeyHeader
 from pydantic import BaseModel
+from jugalbandi.core import SpeechProcessor as SpeechProcessorEnum
 from jugalbandi.core.caching import aiocached
 from jugalbandi.core.errors import QuotaExceededException, UnAuthorisedException
 from jugalbandi.document_collection import (
@@ -22,6 +23,7 @@ from jugalbandi.qa import (
     LangchainQAModel,
 )
 from jugalbandi.speech_processor import (
+    SpeechProcessor,
     CompositeSpeechProcessor,
     DhruvaSpeechProcessor,
     GoogleSpeechProcessor,
@@ -32,7 +34,14 @@ from jugalbandi.translator import (
     GoogleTranslator,
     DhruvaTranslator,
     AzureTranslator,
+    CachingTranslator,
     Translator,
+    translation_store_from_env,
+)
+from jugalbandi.storage import (
+    caching_storage_from_env,
+    compressed_storage_from_env,
+    content_addressed_storage_from_env,
 )
 from jugalbandi.auth_token.token import decode_token
 from jugalbandi.feedback import QAFeedbackRepository, FeedbackRepository
@@ -72,9 +81,11 @@ async def verify_access_token(token: Annotated[str, Depends(reusable_oauth)]):
 async def get_document_repository() -> DocumentRepository:
     # TODO: Rename the env variable
     return DocumentRepository(LocalStorage(os.environ["DOCUMENT_LOCAL_STORAGE_PATH"]),
-                              AzureStorage(os.environ["AZURE_BLOB_ACCOUNT_URL"],
-                              os.environ["AZURE_BLOB_CONTAINER"],
-                              os.environ["AZURE_BLOB_BASE_URL"]))
+                              caching_storage_from_env(compressed_storage_from_env(
+                                  content_addressed_storage_from_env(
+                                      AzureStorage(os.environ["AZURE_BLOB_ACCOUNT_URL"],
+                                                   os.environ["AZURE_BLOB_CONTAINER"],
+                                                   os.environ["AZURE_BLOB_BASE_URL"])))))
 
 
 async def get_document_collection(
@@ -86,16 +97,31 @@ async def get_document_collection(
     return document_repository.get_collection(uuid_number)
 
 
+@aiocached(cache={})
 async def get_speech_processor():
     return CompositeSpeechProcessor(DhruvaSpeechProcessor(),
                                     AzureSpeechProcessor(),
                                     GoogleSpeechProcessor())
 
 
-async def get_translator():
-    return CompositeTranslator(AzureTranslator(),
-                               DhruvaTranslator(),
-                               GoogleTranslator())
+@aiocached(cache={})
+async def get_single_speech_processor(
+    speech_processor_enum: SpeechProcessorEnum,
+) -> SpeechProcessor:
+    if speech_processor_enum.value == "Azure":
+        return AzureSpeechProcessor()
+    elif speech_processor_enum.value == "Google":
+        return GoogleSpeechProcessor()
+    else:
+        return DhruvaSpeechProcessor()
+
+
+@aiocached(cache={})
+async def get_translator() -> CachingTranslator:
+    return CachingTranslator(CompositeTranslator(AzureTranslator(),
+                                                 DhruvaTranslator(),
+                                                 GoogleTranslator()),
+                             store=translation_store_from_env())
 
 
 async def get_gpt_index_qa_engine(
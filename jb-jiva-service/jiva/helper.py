@@ -3,17 +3,28 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError
 from jugalbandi.core.caching import aiocached
 from jugalbandi.auth_token.token import decode_token, decode_refresh_token
-from jugalbandi.legal_library import LegalLibrary
-from jugalbandi.storage import GoogleStorage
+from jugalbandi.legal_library import LegalLibrary, QueryClassifier
+from jugalbandi.library import PageRenderService
+from jugalbandi.storage import (
+    GoogleStorage,
+    Storage,
+    StorageReader,
+    caching_storage_from_env,
+    compressed_storage_from_env,
+    content_addressed_storage_from_env,
+)
 from jugalbandi.translator import (
+    CachingTranslator,
     CompositeTranslator,
     GoogleTranslator,
     DhruvaTranslator,
+    translation_store_from_env,
 )
 from jugalbandi.jiva_repository import JivaRepository
 from .model import User
-from typing import Annotated
+from typing import Annotated, AsyncIterator, Optional, Tuple
 import os
+import re
 import openai
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, Email, To, Content
@@ -31,16 +42,31 @@ async def get_jiva_repo() -> JivaRepository:
     return jiva_repo
 
 
-@aiocached(cache={})
-async def get_library() -> LegalLibrary:
+def library_store() -> Storage:
+    """The store of the library, for the service and the tools writing to it
+    alike, so that they deduplicate and compress files the same way."""
     bucket_name = os.environ["JIVA_LIBRARY_BUCKET"]
     library_path = os.environ["JIVA_LIBRARY_PATH"]
     google_storage = GoogleStorage(bucket_name, library_path)
-    return LegalLibrary(id="jiva", store=google_storage)
+    return caching_storage_from_env(
+        compressed_storage_from_env(content_addressed_storage_from_env(google_storage))
+    )
+
+
+@aiocached(cache={})
+async def get_library() -> LegalLibrary:
+    return LegalLibrary(id="jiva", store=library_store())
+
 
+@aiocached(cache={})
+async def get_page_render_service() -> PageRenderService:
+    return PageRenderService(await get_library())
 
-async def get_translator():
-    return CompositeTranslator(GoogleTranslator(), DhruvaTranslator())
+
+@aiocached(cache={})
+async def get_translator() -> CachingTranslator:
+    return CachingTranslator(CompositeTranslator(GoogleTranslator(), DhruvaTranslator()),
+                             store=translation_store_from_env())
 
 
 async def verify_access_token(
@@ -183,7 +209,7 @@ async def send_email(
     print(response.headers)
 
 
-async def classify_query(query: str) -> str:
+async def _classify_query_with_llm(query: str) -> str:
     system_rules = (
         """
         Given a query, classify it as either a descriptive search (questions) or a non-descriptive search (commands).
@@ -199,3 +225,46 @@ async def classify_query(query: str) -> str:
         ],
     )
     return res["choices"][0]["message"]["content"]
+
+
+# rules first, the LLM only for queries they cannot tell apart confidently
+query_classifier = QueryClassifier(fallback=_classify_query_with_llm)
+
+
+async def classify_query(query: str) -> str:
+    return (await query_classifier.classify(query)).value
+
+
+_byte_range_pattern = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Byte range [start, end) of a single-range ``Range`` header, None to
+    send the whole file. Malformed and multi-range headers are ignored."""
+    if range_header is None:
+        return None
+    match = _byte_range_pattern.match(range_header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # suffix range, the last N bytes
+        start, end = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        end = size if last == "" else min(int(last) + 1, size)
+    if start >= size or start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+async def stream_reader(reader: StorageReader) -> AsyncIterator[bytes]:
+    async with reader:
+        async for chunk in reader:
+            yield chunk
@@ -1,15 +1,37 @@
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from jugalbandi.core import client_registry
 
 
 def create_app(**kwargs):
     app = FastAPI()
     add_cors(app)
     mount_routes(app)
+    add_client_lifecycle(app)
     return app
 
 
+def add_client_lifecycle(app):
+    # Provider clients are shared across requests, open them once and
+    # close them with the app.
+    @app.on_event("startup")
+    async def startup():
+        await client_registry.startup()
+        # the search index is loaded before the first query needs it
+        from .helper import get_library
+        library = await get_library()
+        await library.index_service.start()
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        from .helper import get_library, get_page_render_service
+        library = await get_library()
+        await library.index_service.shutdown()
+        (await get_page_render_service()).shutdown()
+        await client_registry.shutdown()
+
+
 def mount_routes(app):
     from .user_api import user_app
     from .auth_api import auth_app
@@ -1,10 +1,8 @@
-from io import BytesIO
-import httpx
 import re
 import json
 from typing import Annotated, Optional
-from fastapi import Depends, FastAPI, Response
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, Header, HTTPException, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from jugalbandi.jiva_repository import JivaRepository
 from .model import (
     DocumentInfo,
@@ -23,19 +21,20 @@ from .helper import (
   get_jiva_repo,
   verify_access_token,
   get_library,
+  get_page_render_service,
   get_translator,
-  classify_query
+  classify_query,
+  parse_range_header,
+  stream_reader,
 )
 from .model import User
 from fastapi.middleware.cors import CORSMiddleware
-from jugalbandi.library import DocumentMetaData
+from jugalbandi.library import DocumentMetaData, PageNumberError, PageRenderService
 from jugalbandi.legal_library.legal_library import LegalLibrary, ActMetaData
 from jugalbandi.translator import Translator
 from jugalbandi.core.language import Language
-from PIL import Image
 from typing import Dict, List
 from datetime import datetime
-import fitz
 
 user_app = FastAPI()
 
@@ -125,31 +124,56 @@ async def query_testing(
 async def get_document(
     authorization: Annotated[User, Depends(verify_access_token)],
     jiva_library: Annotated[LegalLibrary, Depends(get_library)],
+    page_render_service: Annotated[PageRenderService, Depends(get_page_render_service)],
     document_id: str,
     page_number: Optional[str] = None,
+    dpi: Optional[int] = None,
+    range_header: Annotated[Optional[str], Header(alias="Range")] = None,
+    if_none_match: Annotated[Optional[str], Header(alias="If-None-Match")] = None,
 ) -> Response:
-    catalog = await jiva_library.catalog()
-    document = catalog[document_id]
-    pdf_url = document.public_url
-    response = httpx.get(pdf_url)
-    buffer = BytesIO(response.content)
+    document = jiva_library.get_document(document_id)
 
     if page_number is not None:
-        page_no = int(page_number)
-        pdf_document = fitz.open(stream=buffer.read(), filetype="pdf")
-        if page_no < 1 or page_no > pdf_document.page_count:
-            raise ValueError("Invalid page number")
-
-        page = pdf_document.load_page(page_no - 1)
-        pix = page.get_pixmap()
-        image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-        image_buffer = BytesIO()
-        image.save(image_buffer, format="PNG")
-        image_buffer.seek(0)
-        return Response(content=image_buffer.read(), media_type="image/png")
+        # rendered once, then served from the page cache
+        if dpi is not None and not 36 <= dpi <= 300:
+            raise HTTPException(status_code=400, detail="dpi must be between 36 and 300")
+        if not page_number.isdigit() or int(page_number) < 1:
+            raise HTTPException(
+                status_code=400, detail="page_number must be a positive integer"
+            )
+        try:
+            page = await page_render_service.render(document_id, int(page_number), dpi=dpi)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Document not found")
+        except PageNumberError:
+            raise HTTPException(status_code=404, detail="Page not found")
+        # revalidated, a rewritten document renders to new pages
+        headers = {"ETag": page.etag, "Cache-Control": "private, no-cache"}
+        if if_none_match is not None and page.etag in if_none_match:
+            return Response(status_code=304, headers=headers)
+        return Response(content=page.content, media_type=page.media_type, headers=headers)
+
+    # the PDF is streamed from the store, optionally only the requested range
+    try:
+        size = await document.document_size()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Document not found")
+    byte_range = parse_range_header(range_header, size)
+    headers = {"Accept-Ranges": "bytes"}
+    if byte_range is None:
+        start, end, status_code = 0, size, 200
     else:
-        return Response(content=buffer.read(), media_type="application/pdf")
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    headers["Content-Length"] = str(end - start)
+    reader = await document.open_document(start=start, end=end)
+    return StreamingResponse(
+        stream_reader(reader),
+        status_code=status_code,
+        media_type="application/pdf",
+        headers=headers,
+    )
 
 
 @user_app.get(
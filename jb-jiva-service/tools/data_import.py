@@ -5,24 +5,35 @@ from jugalbandi.library import (
   DocumentMetaData,
   DocumentSupportingMetadata,
   DocumentFormat,
-  Document
+  Document,
+  MetadataTransaction,
+  PageRenderService,
 )
-from jugalbandi.storage import GoogleStorage
+from jiva.helper import library_store
 from PIL import Image
 from io import BytesIO
-import httpx
+import aiofiles
 import os
 import fitz
 import asyncio
+import time
+import uuid
 import openpyxl
 import json
 import gspread
 import re
 import csv
 from oauth2client.service_account import ServiceAccountCredentials
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
-from jugalbandi.translator import GoogleTranslator
+from jugalbandi.translator import (
+  CachingTranslator,
+  GoogleTranslator,
+  Translator,
+  translation_store_from_env,
+)
 from jugalbandi.core.language import Language
 
 
@@ -109,66 +120,99 @@ async def set_meta_data(raw_meta_data: dict) -> DocumentMetaData:
 
 # Function to upload bare pdf act document to cloud storage and return Document object
 async def upload_file(jiva_library: Library, document_file_path: str, document_meta_data: DocumentMetaData):
-    file = open(document_file_path, "rb")
-    file_bytes_content = file.read()
-    file.close()
+    async with aiofiles.open(document_file_path, "rb") as file:
+        file_bytes_content = await file.read()
     document: Document = await jiva_library.add_document(document_meta_data, file_bytes_content)
-    await document.make_public()
     return document
 
 
-# Function to upload thumbnail image (1st page of act) to cloud storage
-async def upload_thumbnail(document: Document):
-    document_meta_data = await document.read_metadata()
-    response = httpx.get(document_meta_data.public_url)
-    buffer = BytesIO(response.content)
-    pdf_document = fitz.open(stream=buffer.read(), filetype="pdf")
-    page = pdf_document.load_page(0)
-    pix = page.get_pixmap()
-    print("AFTER pixmap")
+# Function to render the thumbnail image (1st page of act), runs in the process pool
+def render_thumbnail(document_file_path: str) -> bytes:
+    with fitz.open(document_file_path) as pdf_document:
+        page = pdf_document.load_page(0)
+        pix = page.get_pixmap()
     image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
     image_buffer = BytesIO()
     image.save(image_buffer, format="PNG")
-    image_buffer.seek(0)
+    return image_buffer.getvalue()
+
+
+# Function to upload thumbnail image to cloud storage
+async def upload_thumbnail(document: Document, thumbnail: bytes, transaction: Optional[MetadataTransaction] = None):
+    document_meta_data = await document.read_metadata()
     document_supporting_metadata = DocumentSupportingMetadata(doc_id=document.id,
                                                               name="thumbnail.png",
                                                               original_file_name=document_meta_data.original_file_name,
                                                               extra_data={})
-    document_meta_data = await document.write_supporting_document(document_supporting_metadata,
-                                                                  "thumbnail.png",
-                                                                  image_buffer.read())
+    await document.write_supporting_document(document_supporting_metadata,
+                                             "thumbnail.png",
+                                             thumbnail,
+                                             transaction=transaction)
     await document.make_public(file_path="thumbnail.png",
-                               file_type=LibraryFileType.SUPPORTING)
+                               file_type=LibraryFileType.SUPPORTING,
+                               transaction=transaction)
 
 
-# Function to upload sections json file to cloud storage for each document
-async def upload_section(document: Document):
-    document_meta_data = await document.read_metadata()
-    original_file_name = document_meta_data.original_file_name
-    print("Original File Name:", original_file_name)
-    excel_file_path = os.environ["SECTIONS_EXCEL_PATH"]
-    workbook = openpyxl.load_workbook(excel_file_path)
-
-    section_list = []
+# Function to read the sections of all documents from the sections excel file, runs in the process pool
+def read_sections_workbook(excel_file_path: str) -> Dict[str, List[Dict[str, str]]]:
+    workbook = openpyxl.load_workbook(excel_file_path, read_only=True)
+    sections: Dict[str, List[Dict[str, str]]] = {}
     for sheet_name in workbook.sheetnames:
         sheet = workbook[sheet_name]
-        first_cell_value = sheet.cell(row=1, column=1).value
-        if first_cell_value == original_file_name:
-            for row_index, row in enumerate(sheet.iter_rows(values_only=True), start=1):
-                if row_index == 2:
-                    keys = row
-                elif row_index > 2:
-                    section_data = {}
-                    for col_index, cell_value in enumerate(row):
-                        section_data[keys[col_index]] = str(cell_value).strip()
-                    section_list.append(section_data)
+        rows = sheet.iter_rows(values_only=True)
+        first_row = next(rows, None)
+        if first_row is None:
+            continue
+        section_list = sections.setdefault(first_row[0], [])
+        keys = next(rows, None)
+        for row in rows:
+            section_list.append({keys[col_index]: str(cell_value).strip()
+                                 for col_index, cell_value in enumerate(row)})
+    workbook.close()
+    return sections
+
 
+# Function to upload sections json file to cloud storage for each document
+async def upload_section(document: Document, section_list: List[Dict[str, str]]):
     json_data = json.dumps(section_list)
     section_bytes_data = json_data.encode('utf-8')
     await document.write_sections(section_bytes_data)
 
 
-# Function to upload all documents along with their sections & metadata in given csv file to cloud storage
+IMPORT_STEPS = ["upload", "public", "thumbnail", "sections", "recorded"]
+
+
+# Completed import steps per document file, saved after every step so that an interrupted import resumes
+class ImportCheckpoint:
+    def __init__(self, checkpoint_path: str):
+        self.checkpoint_path = checkpoint_path
+        self.documents: Dict[str, Dict] = {}
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r") as checkpoint_file:
+                self.documents = json.load(checkpoint_file)
+        self._lock = asyncio.Lock()
+
+    def document_id(self, file_name: str) -> Optional[str]:
+        return self.documents.get(file_name, {}).get("document_id")
+
+    def is_done(self, file_name: str, step: str) -> bool:
+        return step in self.documents.get(file_name, {}).get("steps", [])
+
+    async def record(self, file_name: str, document_id: str, step: Optional[str] = None):
+        async with self._lock:
+            entry = self.documents.setdefault(file_name, {"document_id": document_id, "steps": []})
+            if step is not None and step not in entry["steps"]:
+                entry["steps"].append(step)
+            temp_path = f"{self.checkpoint_path}.tmp"
+            async with aiofiles.open(temp_path, "w") as checkpoint_file:
+                await checkpoint_file.write(json.dumps(self.documents))
+            os.replace(temp_path, self.checkpoint_path)
+
+
+# Function to upload all documents along with their sections & metadata in given csv file to cloud storage.
+# IMPORT_CONCURRENCY documents are imported at a time, thumbnails and sections are prepared in a pool of
+# IMPORT_PROCESSES processes and the completed steps are kept in IMPORT_CHECKPOINT_PATH: running it again
+# after a failure continues with the steps that did not complete.
 async def act_uploading_process(jiva_library: Library, csv_file_name: str):
     raw_meta_data = []
     with open(csv_file_name, "r") as csv_input:
@@ -176,74 +220,132 @@ async def act_uploading_process(jiva_library: Library, csv_file_name: str):
         for row in reader:
             raw_meta_data.append(dict(row))
 
-    counter = 1
     base_act_path = os.environ["ACTS_PATH"]
-    for meta_data in raw_meta_data:
-        file_path = os.path.join(base_act_path, meta_data["File Name"])
-        document_meta_data = await set_meta_data(meta_data)
-        document = await upload_file(jiva_library, file_path, document_meta_data)
-        print("\nFile Count:", counter)
-        print("Document ID:", document.id)
-        print("Document Title:", document_meta_data.title)
-        await upload_thumbnail(document)
-        await upload_section(document)
-        with open("tools/docs_meta_data.csv", "a", newline="") as csv_output:
-            writer = csv.DictWriter(csv_output, fieldnames=["Document ID", "Document Title", "Document File Name"])
-            writer.writerow({
-                "Document ID": document.id,
-                "Document Title": document_meta_data.title,
-                "Document File Name": document_meta_data.original_file_name,
-            })
-        counter += 1
+    checkpoint = ImportCheckpoint(os.getenv("IMPORT_CHECKPOINT_PATH", "tools/import_checkpoint.json"))
+    semaphore = asyncio.Semaphore(int(os.getenv("IMPORT_CONCURRENCY", "8")))
+    csv_lock = asyncio.Lock()
+    loop = asyncio.get_running_loop()
+    start_time = time.monotonic()
+    counter = 0
+    failed = []
+
+    with ProcessPoolExecutor(max_workers=int(os.getenv("IMPORT_PROCESSES", str(os.cpu_count() or 1)))) as executor:
+        sections = await loop.run_in_executor(executor, read_sections_workbook, os.environ["SECTIONS_EXCEL_PATH"])
+
+        async def import_document(meta_data: dict):
+            file_name = meta_data["File Name"]
+            if checkpoint.is_done(file_name, "recorded"):
+                return
+            async with semaphore:
+                try:
+                    await import_document_steps(meta_data)
+                except Exception as e:
+                    # the other documents go on, the next run retries this one
+                    print(f"\nFailed to import {file_name}: {e!r}")
+                    failed.append(file_name)
+
+        async def import_document_steps(meta_data: dict):
+            nonlocal counter
+            file_name = meta_data["File Name"]
+            file_path = os.path.join(base_act_path, file_name)
+            # the id is kept before uploading, a retry overwrites the same document
+            document_id = checkpoint.document_id(file_name) or str(uuid.uuid1())
+            await checkpoint.record(file_name, document_id)
+            document_meta_data = await set_meta_data(meta_data)
+            document_meta_data.id = document_id
+            document = jiva_library.get_document(document_id)
+            if not checkpoint.is_done(file_name, "upload"):
+                document = await upload_file(jiva_library, file_path, document_meta_data)
+                await checkpoint.record(file_name, document_id, "upload")
+            steps = [step for step in ["public", "thumbnail"] if not checkpoint.is_done(file_name, step)]
+            if steps:
+                # the public urls and the thumbnail go to the metadata in one write
+                async with document.metadata_transaction() as transaction:
+                    if "public" in steps:
+                        await document.make_public(transaction=transaction)
+                    if "thumbnail" in steps:
+                        thumbnail = await loop.run_in_executor(executor, render_thumbnail, file_path)
+                        await upload_thumbnail(document, thumbnail, transaction)
+                for step in steps:
+                    await checkpoint.record(file_name, document_id, step)
+            if not checkpoint.is_done(file_name, "sections"):
+                await upload_section(document, sections.get(file_name, []))
+                await checkpoint.record(file_name, document_id, "sections")
+            async with csv_lock:
+                with open("tools/docs_meta_data.csv", "a", newline="") as csv_output:
+                    writer = csv.DictWriter(csv_output, fieldnames=["Document ID", "Document Title", "Document File Name"])
+                    writer.writerow({
+                        "Document ID": document_id,
+                        "Document Title": document_meta_data.title,
+                        "Document File Name": document_meta_data.original_file_name,
+                    })
+                await checkpoint.record(file_name, document_id, "recorded")
+            counter += 1
+            minutes = (time.monotonic() - start_time) / 60
+            print(f"\nFile Count: {counter} ({counter / minutes:.1f} documents/minute)")
+            print("Document ID:", document_id)
+            print("Document Title:", document_meta_data.title)
+
+        async with asyncio.TaskGroup() as task_group:
+            for meta_data in raw_meta_data:
+                task_group.create_task(import_document(meta_data))
+
+    # documents whose catalog update was interrupted are added back
+    await jiva_library.rebuild_catalog()
+    minutes = (time.monotonic() - start_time) / 60
+    if failed:
+        print(f"\n{len(failed)} documents failed, run again to resume:", ", ".join(failed))
+    print(f"Imported {counter} documents in {minutes:.1f} minutes "
+          f"({counter / minutes if minutes > 0 else 0:.1f} documents/minute)")
 
 
 # Function to translate certain metadata fields to Kannada & Hindi
-async def translate_meta_data(jiva_library: Library, translator: GoogleTranslator):
+async def translate_meta_data(jiva_library: Library, translator: Translator):
     catalog = await jiva_library.catalog()
     with open("tools/docs_meta_data.csv", "r") as csv_input:
         reader = csv.DictReader(csv_input)
-        counter = 1
-        for row in reader:
-            cat = row["Document ID"]
+        doc_ids = [row["Document ID"] for row in reader]
+    titles = [catalog[cat].title for cat in doc_ids]
+    legal_act_titles = [catalog[cat].extra_data["legal_act_title"] for cat in doc_ids]
+    legal_ministries = [catalog[cat].extra_data["legal_ministry"] for cat in doc_ids]
+
+    # Translate every distinct field value in a few batched requests per language
+    texts = list(dict.fromkeys(text for text in titles + legal_act_titles + legal_ministries if text != ""))
+    print("Translating", len(texts), "distinct values for", len(doc_ids), "documents")
+    kn_texts, hi_texts = await asyncio.gather(
+        translator.translate_batch(texts, Language.EN, Language.KN),
+        translator.translate_batch(texts, Language.EN, Language.HI),
+    )
+    kn_translations = dict(zip(texts, kn_texts))
+    hi_translations = dict(zip(texts, hi_texts))
+    kn_translations[""] = ""
+    hi_translations[""] = ""
+
+    with open("tools/translated_new_meta_data.csv", "a", newline="") as csv_output:
+        writer = csv.DictWriter(csv_output, fieldnames=["Document ID", "Title", "Legal Act Title",
+                                                        "Legal Ministry", "Title in Kannada", "Legal Act Title in Kannada",
+                                                        "Legal Ministry in Kannada", "Title in Hindi", "Legal Act Title in Hindi",
+                                                        "Legal Ministry in Hindi"])
+        for counter, (cat, title, legal_act_title, legal_ministry) in enumerate(
+                zip(doc_ids, titles, legal_act_titles, legal_ministries), start=1):
             print("\nFile Count:", counter)
             print("Document ID:", cat)
-            meta_data = catalog[cat]
-            title = meta_data.title
-            legal_act_title = meta_data.extra_data["legal_act_title"]
-            legal_ministry = meta_data.extra_data["legal_ministry"]
-            kn_translated_title = await translator.translate_text(title, Language.EN, Language.KN)
-            hi_translated_title = await translator.translate_text(title, Language.EN, Language.HI)
-            kn_translated_legal_act_title = await translator.translate_text(legal_act_title, Language.EN, Language.KN)
-            hi_translated_legal_act_title = await translator.translate_text(legal_act_title, Language.EN, Language.HI)
-            if legal_ministry != "":
-                kn_translated_legal_ministry = await translator.translate_text(legal_ministry, Language.EN, Language.KN)
-                hi_translated_legal_ministry = await translator.translate_text(legal_ministry, Language.EN, Language.HI)
-            else:
-                kn_translated_legal_ministry = ""
-                hi_translated_legal_ministry = ""
-            with open("tools/translated_new_meta_data.csv", "a", newline="") as csv_output:
-                writer = csv.DictWriter(csv_output, fieldnames=["Document ID", "Title", "Legal Act Title",
-                                                                "Legal Ministry", "Title in Kannada", "Legal Act Title in Kannada",
-                                                                "Legal Ministry in Kannada", "Title in Hindi", "Legal Act Title in Hindi",
-                                                                "Legal Ministry in Hindi"])
-                writer.writerow({
-                    "Document ID": cat,
-                    "Title": title,
-                    "Legal Act Title": legal_act_title,
-                    "Legal Ministry": legal_ministry,
-                    "Title in Kannada": kn_translated_title,
-                    "Legal Act Title in Kannada": kn_translated_legal_act_title,
-                    "Legal Ministry in Kannada": kn_translated_legal_ministry,
-                    "Title in Hindi": hi_translated_title,
-                    "Legal Act Title in Hindi": hi_translated_legal_act_title,
-                    "Legal Ministry in Hindi": hi_translated_legal_ministry
-                })
-            counter += 1
+            writer.writerow({
+                "Document ID": cat,
+                "Title": title,
+                "Legal Act Title": legal_act_title,
+                "Legal Ministry": legal_ministry,
+                "Title in Kannada": kn_translations[title],
+                "Legal Act Title in Kannada": kn_translations[legal_act_title],
+                "Legal Ministry in Kannada": kn_translations[legal_ministry],
+                "Title in Hindi": hi_translations[title],
+                "Legal Act Title in Hindi": hi_translations[legal_act_title],
+                "Legal Ministry in Hindi": hi_translations[legal_ministry]
+            })
 
 
 # Function to update translated metadata fields in DocumentMetaData object for each document and upload it to cloud storage
 async def update_translated_metadata(jiva_library: Library):
-    catalog = await jiva_library.catalog()
     with open("tools/translated_new_meta_data.csv", "r") as csv_input:
         reader = csv.DictReader(csv_input)
         counter = 1
@@ -252,36 +354,73 @@ async def update_translated_metadata(jiva_library: Library):
             print("\nFile Count:", counter)
             print("Document ID:", cat)
             document: Document = jiva_library.get_document(cat)
-            meta_data = catalog[cat]
-            meta_data.translated_data = {
-                "title": {
+            async with document.metadata_transaction() as transaction:
+                transaction.set_translated_data("title", {
                     "Kannada": row["Title in Kannada"],
                     "Hindi": row["Title in Hindi"]
-                },
-                "legal_act_title": {
+                })
+                transaction.set_translated_data("legal_act_title", {
                     "Kannada": row["Legal Act Title in Kannada"],
                     "Hindi": row["Legal Act Title in Hindi"]
-                },
-                "legal_ministry": {
+                })
+                transaction.set_translated_data("legal_ministry", {
                     "Kannada": row["Legal Ministry in Kannada"],
                     "Hindi": row["Legal Ministry in Hindi"]
-                }
-            }
-            await document.write_metadata(meta_data)
+                })
             counter += 1
 
 
+# Function to pre-seed the translation cache with translations already stored in the catalog
+async def seed_translation_cache(jiva_library: Library, translator: CachingTranslator):
+    catalog = await jiva_library.catalog()
+    entries = []
+    for meta_data in catalog.values():
+        source_texts = {
+            "title": meta_data.title,
+            "legal_act_title": meta_data.extra_data.get("legal_act_title", ""),
+            "legal_ministry": meta_data.extra_data.get("legal_ministry", ""),
+        }
+        for field_name, translations in meta_data.translated_data.items():
+            source_text = source_texts.get(field_name, "")
+            for language_value, translated_text in translations.items():
+                entries.append((source_text, Language.EN, Language(language_value), translated_text))
+    await translator.seed(entries)
+    print("Translation cache seeded with", len(entries), "entries")
+
+
+async def translate_catalog_meta_data(jiva_library: Library):
+    translator = CachingTranslator(GoogleTranslator(), store=translation_store_from_env())
+    await seed_translation_cache(jiva_library, translator)
+    await translate_meta_data(jiva_library=jiva_library, translator=translator)
+    print("Translation cache stats:", translator.stats())
+    await translator.shutdown()
+
+
+# Function to render the page images of the uploaded documents ahead of their first preview
+async def prerender_pages(jiva_library: Library):
+    page_render_service = PageRenderService(jiva_library)
+    with open("tools/docs_meta_data.csv", "r") as csv_input:
+        reader = csv.DictReader(csv_input)
+        doc_ids = [row["Document ID"] for row in reader]
+    for counter, doc_id in enumerate(doc_ids, start=1):
+        page_count = await page_render_service.prerender(doc_id)
+        print("\nFile Count:", counter)
+        print("Document ID:", doc_id)
+        print("Pages rendered:", page_count)
+    page_render_service.shutdown()
+
+
 if __name__ == "__main__":
     load_dotenv()
-    jiva_library = Library(id="jiva",
-                           store=GoogleStorage(
-                                bucket_name=os.environ["JIVA_LIBRARY_BUCKET"],
-                                base_path=os.environ["JIVA_LIBRARY_PATH"]))
+    # the same stack of stores as the service reads the library through
+    jiva_library = Library(id="jiva", store=library_store())
     # Run the below command once separately for converting given sheet to csv file
     # convert_google_sheets_meta_data_to_csv(required_sheet_name="Data_Anmol")
     # Run the below command once separately for uploading docs in given csv file
     # asyncio.run(act_uploading_process(jiva_library=jiva_library, csv_file_name="Data_Anmol.csv"))
     # Run the below command once separately for translating metadata
-    # asyncio.run(translate_meta_data(jiva_library=jiva_library, translator=GoogleTranslator()))
+    # asyncio.run(translate_catalog_meta_data(jiva_library=jiva_library))
+    # Run the below command once separately for rendering the page images of uploaded docs
+    # asyncio.run(prerender_pages(jiva_library=jiva_library))
     # Run the below command once separately to add translated fields to metadata
     asyncio.run(update_translated_metadata(jiva_library=jiva_library))
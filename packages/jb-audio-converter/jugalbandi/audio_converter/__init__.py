@@ -1,3 +1,13 @@
-from .converter import convert_to_wav, convert_to_wav_with_ffmpeg
+from .converter import (
+    convert_to_wav,
+    convert_to_wav_with_ffmpeg,
+    convert_wav_bytes_to_mp3_bytes,
+    encode_wav_bytes,
+)
 
-__all__ = ["convert_to_wav", "convert_to_wav_with_ffmpeg"]
+__all__ = [
+    "convert_to_wav",
+    "convert_to_wav_with_ffmpeg",
+    "convert_wav_bytes_to_mp3_bytes",
+    "encode_wav_bytes",
+]
@@ -1,4 +1,6 @@
+import asyncio
 import tempfile
+import weakref
 from io import BytesIO
 import subprocess
 from typing import Optional
@@ -8,6 +10,18 @@ import aiofiles
 import aiofiles.os
 import httpx
 from pydub import AudioSegment
+from jugalbandi.core import AudioFormat, InternalServerException
+
+# ffmpeg output options per format, none of them resample so the source
+# sample rate (8 kHz for most TTS voices) is kept.
+_ENCODER_ARGS = {
+    AudioFormat.MP3: ["-codec:a", "libmp3lame", "-q:a", "4", "-f", "mp3"],
+    AudioFormat.MP3_LOW_BITRATE: ["-codec:a", "libmp3lame", "-ac", "1", "-b:a", "32k",
+                                  "-f", "mp3"],
+    AudioFormat.OGG_OPUS: ["-codec:a", "libopus", "-ac", "1", "-b:a", "24k",
+                           "-application", "voip", "-f", "ogg"],
+}
+_encoder_semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
 
 
 def _is_url(string) -> bool:
@@ -91,7 +105,40 @@ async def convert_to_wav_with_ffmpeg(
 def convert_wav_bytes_to_mp3_bytes(wav_bytes: bytes) -> bytes:
     wav_file = BytesIO(wav_bytes)
     wav_audio = AudioSegment.from_file(wav_file, format="wav")
-    wav_audio = wav_audio.set_frame_rate(44100)
     mp3_file = BytesIO()
     wav_audio.export(mp3_file, format="mp3")
     return mp3_file.getvalue()
+
+
+def _encoder_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _encoder_semaphores.get(loop)
+    if semaphore is None:
+        concurrency = int(
+            os.getenv("AUDIO_ENCODER_CONCURRENCY", str(os.cpu_count() or 4))
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+        _encoder_semaphores[loop] = semaphore
+    return semaphore
+
+
+async def encode_wav_bytes(
+    wav_bytes: bytes, audio_format: AudioFormat = AudioFormat.MP3
+) -> bytes:
+    """Encode WAV bytes through an ffmpeg pipe without blocking the event loop.
+    At most AUDIO_ENCODER_CONCURRENCY encoders run at a time."""
+    async with _encoder_semaphore():
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-f", "wav", "-i", "pipe:0",
+            *_ENCODER_ARGS[audio_format], "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        encoded_bytes, error = await process.communicate(wav_bytes)
+    if process.returncode != 0:
+        raise InternalServerException(
+            f"Audio encoding to {audio_format.value} failed: "
+            f"{error.decode('utf-8', 'ignore')}")
+    return encoded_bytes
@@ -1,9 +1,13 @@
+import io
 import pytest
 import os
+import wave
 from jugalbandi.audio_converter.converter import (
     convert_to_wav,
     convert_to_wav_with_ffmpeg,
+    encode_wav_bytes,
 )
+from jugalbandi.core import AudioFormat
 
 test_dir = os.path.dirname(__file__)
 TEST_FILE_PATH = "https://storage.googleapis.com/jugalbandi"
@@ -39,3 +43,18 @@ async def test_audio_conversion_of_file_url_with_ffmpeg():
     file_url = f"{TEST_FILE_PATH}/generic_qa/music_files/english_voice.mp3"
     wav_data = await convert_to_wav_with_ffmpeg(file_url)
     assert wav_data is not None and type(wav_data) == bytes
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("audio_format", list(AudioFormat))
+async def test_encode_wav_bytes(audio_format: AudioFormat):
+    wav_file = io.BytesIO()
+    with wave.open(wav_file, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(8000)
+        writer.writeframes(b"\x00\x10" * 8000)
+    encoded_bytes = await encode_wav_bytes(wav_file.getvalue(), audio_format)
+    assert len(encoded_bytes) > 0
+    if audio_format == AudioFormat.OGG_OPUS:
+        assert encoded_bytes.startswith(b"OggS")
@@ -1,4 +1,4 @@
-from .media_format import MediaFormat
+from .media_format import MediaFormat, AudioFormat
 from .caching import aiocached, aiocachedmethod
 from .language import Language
 from .errors import (
@@ -10,10 +10,18 @@ from .errors import (
 )
 from .speech_processor import SpeechProcessor
 from .singleton import SingletonMeta
+from .clients import (
+    ClientRegistry,
+    ClientStats,
+    client_registry,
+    client_pool_size,
+    client_keepalive_timeout,
+)
 
 
 __all__ = [
     "MediaFormat",
+    "AudioFormat",
     "Language",
     "aiocached",
     "aiocachedmethod",
@@ -24,4 +32,9 @@ __all__ = [
     "ServiceUnavailableException",
     "SpeechProcessor",
     "SingletonMeta",
+    "ClientRegistry",
+    "ClientStats",
+    "client_registry",
+    "client_pool_size",
+    "client_keepalive_timeout",
 ]
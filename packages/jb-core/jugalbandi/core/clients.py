@@ -0,0 +1,171 @@
+import asyncio
+import inspect
+import logging
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def client_pool_size(name: str, default: int = 100) -> int:
+    """Connection pool size for a provider client, read from
+    ``<NAME>_POOL_SIZE`` and falling back to ``CLIENT_POOL_SIZE``."""
+    env_name = name.upper().replace("-", "_") + "_POOL_SIZE"
+    return int(os.getenv(env_name, os.getenv("CLIENT_POOL_SIZE", str(default))))
+
+
+def client_keepalive_timeout(default: float = 30.0) -> float:
+    return float(os.getenv("CLIENT_KEEPALIVE_TIMEOUT", str(default)))
+
+
+@dataclass
+class ClientStats:
+    pool_size: Optional[int] = None
+    created: int = 0
+    acquisitions: int = 0
+    in_use: int = 0
+    peak_in_use: int = 0
+
+
+@dataclass
+class _ClientEntry:
+    factory: Callable[[], Any]
+    close: Optional[Callable[[Any], Any]]
+    stats: ClientStats
+    client: Any = None
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    lock: Optional[asyncio.Lock] = None
+
+
+async def _maybe_await(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+class ClientRegistry:
+    """Keeps one long-lived, keep-alive client per provider.
+
+    Clients are created lazily on first use (or eagerly by ``startup``) and
+    closed by ``shutdown``. Async clients are bound to the event loop they
+    were created on, so a client is recreated if it is requested from a
+    different loop.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _ClientEntry] = {}
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        close: Optional[Callable[[Any], Awaitable[None]]] = None,
+        pool_size: Optional[int] = None,
+    ):
+        # registering again (e.g. on module reload) keeps the existing client
+        if name in self._entries:
+            return
+        self._entries[name] = _ClientEntry(
+            factory=factory, close=close, stats=ClientStats(pool_size=pool_size)
+        )
+
+    def _entry(self, name: str) -> _ClientEntry:
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Client {name} is not registered")
+        return entry
+
+    async def get(self, name: str) -> Any:
+        entry = self._entry(name)
+        loop = asyncio.get_running_loop()
+        if entry.client is not None and entry.loop is loop:
+            return entry.client
+
+        if entry.lock is None or entry.loop is not loop:
+            self._close_stale(name, entry)
+            entry.lock = asyncio.Lock()
+            entry.loop = loop
+        async with entry.lock:
+            if entry.client is None:
+                entry.client = await _maybe_await(entry.factory())
+                entry.stats.created += 1
+        return entry.client
+
+    def _close_stale(self, name: str, entry: _ClientEntry):
+        """Closes the client created on another event loop. An async close
+        runs on that loop, unless it is closed already, then the client's
+        connections cannot be closed anymore and are only logged."""
+        client, old_loop = entry.client, entry.loop
+        entry.client = None
+        if client is None or entry.close is None:
+            return
+        try:
+            closing = entry.close(client)
+        except Exception:
+            logger.exception("Closing client %s failed", name)
+            return
+        if not inspect.isawaitable(closing):
+            return
+        if old_loop is None or old_loop.is_closed():
+            if inspect.iscoroutine(closing):
+                closing.close()
+            logger.warning(
+                "Client %s was created on an event loop that is closed, "
+                "its connections are not closed",
+                name,
+            )
+            return
+        asyncio.run_coroutine_threadsafe(
+            self._close_on_loop(name, closing), old_loop
+        )
+
+    @staticmethod
+    async def _close_on_loop(name: str, closing: Awaitable[Any]):
+        try:
+            await closing
+        except Exception:
+            logger.exception("Closing client %s failed", name)
+
+    @asynccontextmanager
+    async def acquire(self, name: str):
+        client = await self.get(name)
+        stats = self._entries[name].stats
+        stats.acquisitions += 1
+        stats.in_use += 1
+        stats.peak_in_use = max(stats.peak_in_use, stats.in_use)
+        try:
+            yield client
+        finally:
+            stats.in_use -= 1
+
+    async def startup(self, names: Optional[Iterable[str]] = None):
+        """Create the given (default: all registered) clients ahead of the
+        first request. A client that cannot be created is logged and left to
+        be created lazily."""
+        for name in names if names is not None else list(self._entries):
+            try:
+                await self.get(name)
+            except Exception:
+                logger.exception("Prewarming client %s failed", name)
+
+    async def shutdown(self):
+        for name, entry in self._entries.items():
+            client, entry.client = entry.client, None
+            if client is None or entry.close is None:
+                continue
+            try:
+                await _maybe_await(entry.close(client))
+            except Exception:
+                logger.exception("Closing client %s failed", name)
+
+    def stats(self) -> Dict[str, ClientStats]:
+        return {
+            name: ClientStats(**vars(entry.stats))
+            for name, entry in self._entries.items()
+        }
+
+
+client_registry = ClientRegistry()
@@ -4,3 +4,17 @@ from enum import Enum
 class MediaFormat(str, Enum):
     TEXT = "Text"
     VOICE = "Voice"
+
+
+class AudioFormat(str, Enum):
+    MP3 = "mp3"
+    MP3_LOW_BITRATE = "mp3-low-bitrate"
+    OGG_OPUS = "ogg-opus"
+
+    @property
+    def extension(self) -> str:
+        return "ogg" if self is AudioFormat.OGG_OPUS else "mp3"
+
+    @property
+    def mime_type(self) -> str:
+        return "audio/ogg" if self is AudioFormat.OGG_OPUS else "audio/mpeg"
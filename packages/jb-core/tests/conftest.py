@@ -0,0 +1,8 @@
+import inspect
+import pytest
+
+
+def pytest_collection_modifyitems(config, items):
+    for item in items:
+        if inspect.iscoroutinefunction(item.function):
+            item.add_marker(pytest.mark.asyncio)
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import pytest
+from jugalbandi.core import ClientRegistry
+
+
+class _Client:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.closed = False
+
+
+async def _close(client: _Client):
+    client.closed = True
+
+
+def _registry(close=_close) -> ClientRegistry:
+    registry = ClientRegistry()
+    registry.register("provider", _Client, close=close, pool_size=10)
+    return registry
+
+
+async def test_client_is_created_once():
+    registry = _registry()
+
+    clients = await asyncio.gather(*[registry.get("provider") for _ in range(5)])
+    assert all(client is clients[0] for client in clients)
+    stats = registry.stats()["provider"]
+    assert (stats.created, stats.pool_size) == (1, 10)
+
+
+async def test_acquire_counts_clients_in_use():
+    registry = _registry()
+
+    async with registry.acquire("provider") as first:
+        async with registry.acquire("provider") as second:
+            assert first is second
+            assert registry.stats()["provider"].in_use == 2
+    stats = registry.stats()["provider"]
+    assert (stats.acquisitions, stats.in_use, stats.peak_in_use) == (2, 0, 2)
+
+
+async def test_startup_and_shutdown():
+    registry = _registry()
+
+    def _failing():
+        raise RuntimeError("unavailable")
+
+    registry.register("failing", _failing)
+    await registry.startup()
+    assert registry.stats()["provider"].created == 1
+    assert registry.stats()["failing"].created == 0
+
+    client = await registry.get("provider")
+    await registry.shutdown()
+    assert client.closed
+    assert await registry.get("provider") is not client
+
+
+async def test_unknown_client():
+    with pytest.raises(KeyError):
+        await ClientRegistry().get("missing")
+
+
+def test_stale_client_is_closed_on_its_loop():
+    registry = _registry()
+    old_loop = asyncio.new_event_loop()
+    try:
+        old_client = old_loop.run_until_complete(registry.get("provider"))
+        new_client = asyncio.run(registry.get("provider"))
+
+        assert new_client is not old_client
+        assert not old_client.closed
+        # the close hook runs the next time the old loop runs
+        old_loop.run_until_complete(asyncio.sleep(0))
+        assert old_client.closed
+        assert registry.stats()["provider"].created == 2
+    finally:
+        old_loop.close()
+
+
+def test_stale_client_of_a_closed_loop_is_logged(caplog):
+    registry = _registry()
+    old_client = asyncio.run(registry.get("provider"))
+
+    with caplog.at_level(logging.WARNING):
+        new_client = asyncio.run(registry.get("provider"))
+    assert new_client is not old_client
+    assert not old_client.closed
+    assert "event loop that is closed" in caplog.text
+
+
+def test_stale_client_with_a_sync_close_is_closed():
+    closed = []
+    registry = _registry(close=closed.append)
+    old_client = asyncio.run(registry.get("provider"))
+
+    asyncio.run(registry.get("provider"))
+    assert closed == [old_client]
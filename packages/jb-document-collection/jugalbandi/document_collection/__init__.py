@@ -5,7 +5,10 @@ from .repository import (
     AsyncReader,
     WrapSyncReader,
     DocumentFormat,
+    IngestionLimiter,
+    IngestionReport,
 )
+from .manifest import CollectionManifest, FileKind, ManifestEntry
 
 from jugalbandi.storage import Storage, NullStorage, LocalStorage, GoogleStorage, AzureStorage
 
@@ -21,4 +24,9 @@ __all__ = [
     "LocalStorage",
     "NullStorage",
     "DocumentFormat",
+    "IngestionLimiter",
+    "IngestionReport",
+    "CollectionManifest",
+    "FileKind",
+    "ManifestEntry",
 ]
@@ -0,0 +1,88 @@
+import os
+import re
+from enum import Enum
+from typing import Dict, Iterable, List, Optional
+from pydantic import BaseModel
+from jugalbandi.storage import StorageEntry
+
+MANIFEST_FILE_NAME = "__manifest__.json"
+
+INDEX_FILE_REGEX = re.compile(r"^index\..*")
+
+
+def is_index_file(file_path: str) -> bool:
+    return INDEX_FILE_REGEX.match(os.path.basename(file_path)) is not None
+
+
+class FileKind(str, Enum):
+    DATA = "data"
+    TEXT = "text"
+    INDEX = "index"
+
+
+class ManifestEntry(BaseModel):
+    kind: FileKind
+    size: int
+    # unknown for files found by listing a collection without manifest
+    sha256: Optional[str] = None
+
+
+class CollectionManifest(BaseModel):
+    """Files of a collection, keyed by their path in the collection: the
+    uploaded data files, their text variants and the files of the indexes."""
+
+    version: int = 1
+    files: Dict[str, ManifestEntry] = {}
+
+    def add(self, file_path: str, kind: FileKind, size: int, sha256: Optional[str]):
+        entry = self.files.get(file_path)
+        # textify writes the text variant of an uploaded .txt file over it,
+        # it stays a data file
+        if entry is not None and entry.kind == FileKind.DATA and kind == FileKind.TEXT:
+            kind = FileKind.DATA
+        self.files[file_path] = ManifestEntry(kind=kind, size=size, sha256=sha256)
+
+    def data_files(self) -> List[str]:
+        return sorted(
+            file_path for file_path, entry in self.files.items()
+            if entry.kind == FileKind.DATA
+        )
+
+    def index_files(self, indexer: str) -> Dict[str, ManifestEntry]:
+        prefix = f"{indexer}/"
+        return {
+            file_path[len(prefix):]: entry for file_path, entry in self.files.items()
+            if entry.kind == FileKind.INDEX and file_path.startswith(prefix)
+        }
+
+    def get(self, file_path: str, kind: FileKind) -> Optional[ManifestEntry]:
+        entry = self.files.get(file_path)
+        if entry is None or entry.kind != kind:
+            return None
+        return entry
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[StorageEntry]) -> "CollectionManifest":
+        """Manifest of a collection written before manifests existed, from a
+        listing of its folder."""
+        sizes = {
+            entry.name: entry.size or 0 for entry in entries
+            if entry.name != MANIFEST_FILE_NAME
+        }
+        bases_with_original = {
+            os.path.splitext(file_path)[0] for file_path in sizes
+            if not file_path.endswith(".txt") and not is_index_file(file_path)
+        }
+        manifest = cls()
+        for file_path, size in sizes.items():
+            if is_index_file(file_path):
+                kind = FileKind.INDEX
+            elif (
+                file_path.endswith(".txt")
+                and os.path.splitext(file_path)[0] in bases_with_original
+            ):
+                kind = FileKind.TEXT
+            else:
+                kind = FileKind.DATA
+            manifest.files[file_path] = ManifestEntry(kind=kind, size=size)
+        return manifest
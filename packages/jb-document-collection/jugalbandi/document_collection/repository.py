@@ -1,20 +1,47 @@
 import asyncio
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass, field
 from enum import Enum
-from io import BytesIO
-from typing import Any, AsyncIterator, Dict, List, Protocol
+import hashlib
+import random
+import resource
+import tempfile
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+)
 import os
 import uuid
-import re
 import logging
-from pydantic import BaseModel
-from zipfile import ZipFile, ZipInfo
-from jugalbandi.storage import Storage
+import aiofiles
+from aiofiles import os as aiofiles_os
+from cachetools import TTLCache
+from zipfile import ZipFile
+from jugalbandi.storage import PreconditionFailedError, Storage, StorageWriter
+from .manifest import (
+    MANIFEST_FILE_NAME,
+    CollectionManifest,
+    FileKind,
+    ManifestEntry,
+    is_index_file,
+)
 
 logger = logging.getLogger(__name__)
 
+# uploads and zip members are copied to the stores in chunks of this size
+INGEST_CHUNK_SIZE = 1024 * 1024
+
 
 class AsyncReader(Protocol):
-    async def read(self) -> bytes:
+    async def read(self, size: int = -1) -> bytes:
         pass
 
 
@@ -22,8 +49,8 @@ class WrapSyncReader:
     def __init__(self, file_like: Any):
         self.file_like = file_like
 
-    async def read(self) -> bytes:
-        return self.file_like.read()
+    async def read(self, size: int = -1) -> bytes:
+        return self.file_like.read(size)
 
 
 class DocumentSourceFile:
@@ -37,14 +64,107 @@ class DocumentSourceFile:
     async def read_content(self):
         return await self.reader.read()
 
+    async def read_chunk(self, size: int = INGEST_CHUNK_SIZE) -> bytes:
+        return await self.reader.read(size)
+
+
+class IngestionLimiter:
+    """Caps the files copied to the stores at once and the bytes read from
+    the sources that are not written yet, across all the collections of a
+    process. Bytes buffered by the remote writers (up to one upload part per
+    file) come on top."""
+
+    def __init__(self, max_tasks: int, max_bytes: int):
+        self.max_tasks = max_tasks
+        self.max_bytes = max_bytes
+        self.tasks = 0
+        self.bytes = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls) -> "IngestionLimiter":
+        return cls(
+            max_tasks=int(os.getenv("DOCUMENT_INGEST_MAX_TASKS", "16")),
+            max_bytes=int(
+                os.getenv("DOCUMENT_INGEST_MAX_BYTES", str(64 * 1024 * 1024))
+            ),
+        )
+
+    def _get_condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            # the counts of a loop that is gone do not apply any more
+            self._condition = asyncio.Condition()
+            self._loop = loop
+            self.tasks = 0
+            self.bytes = 0
+        return self._condition
+
+    @asynccontextmanager
+    async def task(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.tasks < self.max_tasks)
+            self.tasks += 1
+        try:
+            yield
+        finally:
+            async with condition:
+                self.tasks -= 1
+                condition.notify_all()
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        condition = self._get_condition()
+        async with condition:
+            # a reservation larger than the cap goes through on its own
+            await condition.wait_for(
+                lambda: self.bytes == 0 or self.bytes + size <= self.max_bytes
+            )
+            self.bytes += size
+        try:
+            yield
+        finally:
+            async with condition:
+                self.bytes -= size
+                condition.notify_all()
+
+
+ingestion_limiter = IngestionLimiter.from_env()
+
+
+@dataclass
+class IngestionReport:
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    # most bytes of this ingestion read from the sources and not yet written
+    peak_in_flight_bytes: int = 0
+    # the cap of the limiter on in-flight bytes
+    max_in_flight_bytes: int = 0
+    # peak resident memory of the process so far
+    peak_rss_bytes: int = 0
+    _in_flight_bytes: int = field(default=0, repr=False)
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second."""
+        if self.seconds == 0:
+            return 0.0
+        return self.bytes / self.seconds
+
+    def _add_in_flight(self, size: int):
+        self._in_flight_bytes += size
+        self.peak_in_flight_bytes = max(
+            self.peak_in_flight_bytes, self._in_flight_bytes
+        )
 
-class ZipFileReader:
-    def __init__(self, zf: ZipFile, fileinfo: ZipInfo):
-        self.zf = zf
-        self.fileinfo = fileinfo
 
-    async def read(self) -> bytes:
-        return self.zf.read(self.fileinfo)
+async def _abort(*writers: StorageWriter):
+    for writer in writers:
+        with suppress(Exception):
+            await writer.abort()
 
 
 class DocumentFormat(Enum):
@@ -52,12 +172,11 @@ class DocumentFormat(Enum):
     TEXT = "txt"
 
 
-class DataFileInfo(BaseModel):
-    default_file_name: str
-    extensions: List[str]
-
-
-INDEX_FILE_REGEX = re.compile(r"^index\..*")
+# manifests read or written by this process with their etag, by the remote
+# path of the manifest
+_manifest_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+# conditional writes of a manifest update before it gives up
+MANIFEST_COMMIT_ATTEMPTS = 10
 
 
 class DocumentCollection:
@@ -66,13 +185,18 @@ class DocumentCollection:
         collection_id: str,
         local_store: Storage,
         remote_store: Storage,
+        limiter: Optional[IngestionLimiter] = None,
     ):
         self._id = collection_id
         self.local_store = local_store
         self.remote_store = remote_store
-        self.data_files: Dict[str, DataFileInfo] = {}
-        self.index_files: Dict[str, List[str]] = {}
-        self.dir: List[str] = []
+        self.limiter = limiter or ingestion_limiter
+        self._manifest: Optional[CollectionManifest] = None
+        self._manifest_etag: Optional[str] = None
+        # files added since the manifest was last written, applied again on
+        # top of the stored manifest when another process changed it
+        self._manifest_changes: Dict[str, ManifestEntry] = {}
+        self._manifest_lock = asyncio.Lock()
 
     @property
     def id(self):
@@ -82,81 +206,247 @@ class DocumentCollection:
         return self.local_store.path(self._id)
 
     @staticmethod
-    def _is_index_file(file_path: str):
-        basename = os.path.basename(file_path)
-        return INDEX_FILE_REGEX.match(basename) is not None
+    def _relative_filename(
+        file_suffix: str, format: DocumentFormat = DocumentFormat.DEFAULT
+    ) -> str:
+        if format == DocumentFormat.DEFAULT:
+            return file_suffix
+        return f"{os.path.splitext(file_suffix)[0]}.{format.value}"
 
     def _filename(
         self, file_suffix: str, format: DocumentFormat = DocumentFormat.DEFAULT
     ):
-        if format == DocumentFormat.DEFAULT:
-            return f"{self._id}/{file_suffix}"
+        return f"{self._id}/{self._relative_filename(file_suffix, format)}"
+
+    def _manifest_path(self) -> str:
+        return f"{self._id}/{MANIFEST_FILE_NAME}"
+
+    async def manifest(self) -> CollectionManifest:
+        """The manifest of the collection, read with one request and kept in
+        memory. A collection written before manifests existed is listed once
+        and gets its manifest written."""
+        if self._manifest is not None:
+            return self._manifest
+        cache_key = self.remote_store.path(self._manifest_path())
+        cached = _manifest_cache.get(cache_key)
+        if cached is None:
+            manifest, etag = await self._read_manifest()
+            if etag is None and len(manifest.files) > 0:
+                try:
+                    etag = await self.remote_store.write_file_if_match(
+                        self._manifest_path(), manifest.json().encode("utf-8"), None
+                    )
+                except PreconditionFailedError:
+                    # written by another process in the meantime
+                    manifest, etag = await self._read_manifest()
+            # an empty listing may be a collection still being uploaded
+            if etag is not None:
+                _manifest_cache[cache_key] = (manifest, etag)
         else:
-            file_suffix = f"{os.path.splitext(file_suffix)[0]}.{format.value}"
-            return f"{self._id}/{file_suffix}"
-
-    async def _load_directory(self):
-        async for file in self.remote_store.list_files(self.id):
-            if self._is_index_file(file):
-                index_name = os.path.dirname(file)
-                base = os.path.basename(file)
-                if index_name not in self.index_files:
-                    self.index_files[index_name] = [base]
-                else:
-                    self.index_files[index_name].append(base)
-            else:
-                parts = os.path.splitext(file)
-                base = parts[0]
-                ext = parts[1]
-
-                if base not in self.data_files:
-                    self.data_files[base] = DataFileInfo(
-                        default_file_name=file, extensions=[ext]
+            manifest, etag = cached
+        self._manifest, self._manifest_etag = manifest, etag
+        return manifest
+
+    async def _read_manifest(self) -> Tuple[CollectionManifest, Optional[str]]:
+        """The stored manifest and its etag, or one listed from the files of a
+        collection without manifest and None."""
+        try:
+            content, etag = await self.remote_store.read_file_versioned(
+                self._manifest_path()
+            )
+        except FileNotFoundError:
+            return CollectionManifest.from_entries(
+                [entry async for entry in self.remote_store.list_entries(self._id)]
+            ), None
+        return CollectionManifest.parse_raw(content), etag
+
+    def _add_to_manifest(
+        self,
+        manifest: CollectionManifest,
+        file_path: str,
+        kind: FileKind,
+        size: int,
+        sha256: Optional[str],
+    ):
+        manifest.add(file_path, kind, size, sha256)
+        self._manifest_changes[file_path] = ManifestEntry(
+            kind=kind, size=size, sha256=sha256
+        )
+
+    async def _save_manifest(self):
+        """Writes the files added to the manifest. When another process
+        changed the stored manifest since it was read, they are added to the
+        stored one and written again."""
+        await self.manifest()
+        async with self._manifest_lock:
+            if not self._manifest_changes:
+                return
+            for attempt in range(1, MANIFEST_COMMIT_ATTEMPTS + 1):
+                assert self._manifest is not None
+                changes = dict(self._manifest_changes)
+                try:
+                    self._manifest_etag = await self.remote_store.write_file_if_match(
+                        self._manifest_path(),
+                        self._manifest.json().encode("utf-8"),
+                        self._manifest_etag,
                     )
-                else:
-                    dfi = self.data_files[base]
-                    if dfi.default_file_name.endswith(".txt"):
-                        dfi.default_file_name = file
-                    else:
-                        dfi.extensions.append(ext)
-
-            self.dir = [
-                file_info.default_file_name for file_info in self.data_files.values()
-            ]
-
-    async def _add_data_file(self, file: DocumentSourceFile):
-        content = await file.read_content()
-        target_file_name = self._filename(file.filename())
-        await self.local_store.write_file(target_file_name, content)
-        await self.remote_store.write_file(target_file_name, content)
-
-    async def _init_from_zip(self, zip_src_file: DocumentSourceFile):
-        zip_contents = await zip_src_file.read_content()
-        with ZipFile(BytesIO(zip_contents), "r") as zf:
-            async with asyncio.TaskGroup() as task_group:
-                for file_info in zf.infolist():
-                    filename = file_info.filename
-                    if filename.startswith("__MACOSX/") or filename.endswith(
-                            ".DS_Store"):
-                        continue
-
-                    zip_source_file = DocumentSourceFile(
-                        filename, ZipFileReader(zf, file_info)
+                    break
+                except PreconditionFailedError:
+                    if attempt == MANIFEST_COMMIT_ATTEMPTS:
+                        raise
+                    logger.info(
+                        "Manifest of %s changed while saving it, attempt %d",
+                        self.id, attempt,
                     )
+                    await asyncio.sleep(random.uniform(0, min(1.0, 0.02 * 2**attempt)))
+                manifest, self._manifest_etag = await self._read_manifest()
+                for file_path, entry in self._manifest_changes.items():
+                    manifest.add(file_path, entry.kind, entry.size, entry.sha256)
+                self._manifest = manifest
+            for file_path, entry in changes.items():
+                # unless added again while it was written
+                if self._manifest_changes.get(file_path) is entry:
+                    del self._manifest_changes[file_path]
+        _manifest_cache[self.remote_store.path(self._manifest_path())] = (
+            self._manifest, self._manifest_etag
+        )
 
-                    task_group.create_task(self._add_data_file(zip_source_file))
+    async def _record_file(self, file_path: str, kind: FileKind, content: bytes):
+        manifest = await self.manifest()
+        self._add_to_manifest(
+            manifest, file_path, kind, len(content), hashlib.sha256(content).hexdigest()
+        )
+        await self._save_manifest()
 
-    async def init_from_files(self, files: List[DocumentSourceFile]):
+    async def _copy_to_stores(
+        self,
+        filename: str,
+        read_chunk: Callable[[int], Awaitable[bytes]],
+        report: IngestionReport,
+    ):
+        """Streams a file to the local and the remote store at the same time,
+        one chunk in memory. A content addressed remote store hashes the
+        streamed content and keeps one blob per content."""
+        target_file_name = self._filename(filename)
+        sha256 = hashlib.sha256()
+        size = 0
+        async with self.limiter.task():
+            local_writer = await self.local_store.open_write(target_file_name)
+            try:
+                remote_writer = await self.remote_store.open_write(target_file_name)
+            except BaseException:
+                await _abort(local_writer)
+                raise
+            try:
+                while True:
+                    async with self.limiter.reserve(INGEST_CHUNK_SIZE):
+                        chunk = await read_chunk(INGEST_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        report._add_in_flight(len(chunk))
+                        await asyncio.gather(
+                            local_writer.write(chunk), remote_writer.write(chunk)
+                        )
+                        report._add_in_flight(-len(chunk))
+                        sha256.update(chunk)
+                        size += len(chunk)
+                await asyncio.gather(local_writer.close(), remote_writer.close())
+            except BaseException:
+                await _abort(local_writer, remote_writer)
+                raise
+        manifest = await self.manifest()
+        self._add_to_manifest(
+            manifest, filename, FileKind.DATA, size, sha256.hexdigest()
+        )
+        report.files += 1
+        report.bytes += size
+
+    async def _add_data_file(self, file: DocumentSourceFile, report: IngestionReport):
+        await self._copy_to_stores(file.filename(), file.read_chunk, report)
+
+    async def _spool(self, file: DocumentSourceFile) -> str:
+        """Copies an upload to a temporary file, which the caller removes."""
+        fd, spool_path = tempfile.mkstemp(suffix=os.path.splitext(file.filename())[1])
+        os.close(fd)
+        try:
+            async with aiofiles.open(spool_path, "wb") as f:
+                while chunk := await file.read_chunk():
+                    await f.write(chunk)
+        except BaseException:
+            await aiofiles_os.remove(spool_path)
+            raise
+        return spool_path
+
+    async def _add_zip_member(
+        self,
+        zf: ZipFile,
+        filename: str,
+        report: IngestionReport,
+        pending: asyncio.Semaphore,
+    ):
+        try:
+            member = await asyncio.to_thread(zf.open, filename)
+            try:
+                await self._copy_to_stores(
+                    filename, lambda size: asyncio.to_thread(member.read, size), report
+                )
+            finally:
+                member.close()
+        finally:
+            pending.release()
+
+    async def _init_from_zip(
+        self, zip_src_file: DocumentSourceFile, report: IngestionReport
+    ):
+        # a zip can only be read from a seekable file, the members are then
+        # extracted one chunk at a time
+        spool_path = await self._spool(zip_src_file)
+        try:
+            with await asyncio.to_thread(ZipFile, spool_path, "r") as zf:
+                # no more member tasks are created than the limiter lets run
+                pending = asyncio.Semaphore(self.limiter.max_tasks)
+                async with asyncio.TaskGroup() as task_group:
+                    for file_info in zf.infolist():
+                        filename = file_info.filename
+                        if file_info.is_dir():
+                            continue
+                        if filename.startswith("__MACOSX/") or filename.endswith(
+                                ".DS_Store"):
+                            continue
+                        await pending.acquire()
+                        task_group.create_task(
+                            self._add_zip_member(zf, filename, report, pending)
+                        )
+        finally:
+            await aiofiles_os.remove(spool_path)
+
+    async def init_from_files(self, files: List[DocumentSourceFile]) -> IngestionReport:
+        report = IngestionReport(max_in_flight_bytes=self.limiter.max_bytes)
+        start = time.perf_counter()
+        await self.manifest()
         async with asyncio.TaskGroup() as task_group:
             for file in files:
                 if file.filename().endswith(".zip"):
-                    task_group.create_task(self._init_from_zip(file))
+                    task_group.create_task(self._init_from_zip(file, report))
                 else:
-                    task_group.create_task(self._add_data_file(file))
+                    task_group.create_task(self._add_data_file(file, report))
+        # one manifest update for all the files
+        await self._save_manifest()
+        report.seconds = time.perf_counter() - start
+        # kilobytes on Linux
+        report.peak_rss_bytes = (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        )
+        logger.info(
+            "Ingested %d files (%d bytes) into %s in %.2fs, %.1f MB/s, "
+            "peak in-flight %d bytes",
+            report.files, report.bytes, self.id, report.seconds,
+            report.throughput / 1e6, report.peak_in_flight_bytes,
+        )
+        return report
 
     async def list_files(self) -> AsyncIterator[str]:
-        await self._load_directory()
-        for file in self.dir:
+        for file in (await self.manifest()).data_files():
             yield file
 
     async def read_file(
@@ -173,9 +463,28 @@ class DocumentCollection:
         content: bytes,
         format: DocumentFormat = DocumentFormat.DEFAULT,
     ) -> bytes:
-        return await self.remote_store.write_file(
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        result = await self.remote_store.write_file(
             self._filename(filename, format), content
         )
+        file_path = self._relative_filename(filename, format)
+        if format == DocumentFormat.TEXT:
+            kind = FileKind.TEXT
+        elif is_index_file(file_path):
+            kind = FileKind.INDEX
+        else:
+            kind = FileKind.DATA
+        await self._record_file(file_path, kind, content)
+        return result
+
+    async def read_derived(self, filename: str, name: str) -> Optional[bytes]:
+        """Artifact derived from the content of a data file, shared with every
+        file of the same content when the remote store is content addressed."""
+        return await self.remote_store.read_derived(self._filename(filename), name)
+
+    async def write_derived(self, filename: str, name: str, content: bytes):
+        await self.remote_store.write_derived(self._filename(filename), name, content)
 
     async def write_audio_file(
         self,
@@ -209,33 +518,96 @@ class DocumentCollection:
         return self._filename(file_suffix)
 
     async def download_index_files(self, indexer: str, *filenames: str) -> str:
-        for filename in filenames:
-            index_file_name = self._index_filename(indexer, filename)
-            content = await self.read_index_file(indexer, filename)
-            await self.local_store.write_file(index_file_name, content)
+        index_file_names = {
+            filename: self._index_filename(indexer, filename) for filename in filenames
+        }
+        local_exists = await self.local_store.exists_many(index_file_names.values())
+        missing = [
+            filename for filename, index_file_name in index_file_names.items()
+            if not local_exists[index_file_name]
+        ]
+        if len(missing) == 0:
+            return self._index_folder(indexer)
+
+        manifest = await self.manifest()
+        sources = {}
+        for filename in missing:
+            source = self._index_source(manifest, indexer, filename)
+            if source is not None:
+                sources[filename] = source
+
+        unknown = [filename for filename in missing if filename not in sources]
+        if len(unknown) > 0:
+            # not in the manifest (e.g. written by another process since it
+            # was read): a single listing tells which files are in the index
+            # folder and which only exist at the fallback location
+            fallbacks = {
+                filename: self._index_filename_fallback(indexer, filename)
+                for filename in unknown
+            }
+            remote_exists = await self.remote_store.exists_many(
+                [index_file_names[filename] for filename in unknown]
+                + list(fallbacks.values())
+            )
+            for filename in unknown:
+                if remote_exists[index_file_names[filename]]:
+                    sources[filename] = index_file_names[filename]
+                elif remote_exists[fallbacks[filename]]:
+                    sources[filename] = fallbacks[filename]
+                else:
+                    raise FileNotFoundError(f"file {filename} not found")
+
+        async with asyncio.TaskGroup() as task_group:
+            for filename, source in sources.items():
+                task_group.create_task(
+                    self.remote_store.read_into(
+                        source, self.local_store.path(index_file_names[filename])
+                    )
+                )
         return self._index_folder(indexer)
 
+    def _index_source(
+        self, manifest: CollectionManifest, indexer: str, filename: str
+    ) -> Optional[str]:
+        """Remote path of an index file according to the manifest."""
+        if manifest.get(f"{indexer}/{filename}", FileKind.INDEX) is not None:
+            return self._index_filename(indexer, filename)
+        if manifest.get(filename, FileKind.INDEX) is not None:
+            return self._index_filename_fallback(indexer, filename)
+        return None
+
     async def read_index_file(self, indexer: str, filename: str) -> bytes:
         index_file_name = self._index_filename(indexer, filename)
         index_file_name_fallback = self._index_filename_fallback(indexer, filename)
-        if not await self.local_store.file_exists(index_file_name):
-            if await self.remote_store.file_exists(index_file_name):
-                content = await self.remote_store.read_file(index_file_name)
-            elif await self.remote_store.file_exists(index_file_name_fallback):
-                content = await self.remote_store.read_file(index_file_name_fallback)
-            else:
-                raise FileNotFoundError(f"file {filename} not found")
-        else:
-            content = await self.local_store.read_file(index_file_name)
-
-        return content
+        if await self.local_store.file_exists(index_file_name):
+            return await self.local_store.read_file(index_file_name)
+
+        source = self._index_source(await self.manifest(), indexer, filename)
+        if source is not None:
+            try:
+                return await self.remote_store.read_file(source)
+            except FileNotFoundError:
+                pass
+
+        # read directly instead of checking existence first, a missing file
+        # costs the same single request
+        try:
+            return await self.remote_store.read_file(index_file_name)
+        except FileNotFoundError:
+            pass
+        try:
+            return await self.remote_store.read_file(index_file_name_fallback)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"file {filename} not found")
 
     async def write_index_file(
         self, indexer: str, filename: str, content: bytes
     ) -> bytes:
-        return await self.remote_store.write_file(
+        result = await self.remote_store.write_file(
             self._index_filename(indexer, filename), content
         )
+        await self._record_file(f"{indexer}/{filename}", FileKind.INDEX, content)
+        return result
 
     def local_index_folder(self, indexer: str) -> str:
         return os.path.join(
@@ -252,19 +624,25 @@ class DocumentRepository:
         self,
         local_store: Storage,
         remote_store: Storage,
+        limiter: Optional[IngestionLimiter] = None,
     ):
         self.local_store = local_store
         self.remote_store = remote_store
+        self.limiter = limiter
 
     def new_collection(self) -> DocumentCollection:
         uuid_number = str(uuid.uuid1())
         new_collection = DocumentCollection(
-            uuid_number, self.local_store, self.remote_store
+            uuid_number, self.local_store, self.remote_store, self.limiter
         )
+        # nothing to read for a new collection
+        new_collection._manifest = CollectionManifest()
         return new_collection
 
     def get_collection(self, doc_id: str) -> DocumentCollection:
-        return DocumentCollection(doc_id, self.local_store, self.remote_store)
+        return DocumentCollection(
+            doc_id, self.local_store, self.remote_store, self.limiter
+        )
 
     async def shutdown(self):
         await self.remote_store.shutdown()
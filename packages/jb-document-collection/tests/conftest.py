@@ -9,6 +9,7 @@ import pytest_asyncio
 import tempfile
 
 from jugalbandi.storage import (
+    InMemoryStorage,
     LocalStorage,
     NullStorage,
     GoogleStorage,
@@ -60,6 +61,14 @@ async def local_only_repo():
         )
 
 
+@pytest_asyncio.fixture()
+async def memory_repo():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield DocumentRepository(
+            local_store=LocalStorage(temp_dir), remote_store=InMemoryStorage("doc_repo")
+        )
+
+
 @pytest_asyncio.fixture()
 async def zip_source_random():
     zip_contents = fake.zip(num_files=fake.pyint(min_value=1, max_value=5))
@@ -1,8 +1,29 @@
+import hashlib
 import logging
+import tempfile
+from io import BytesIO
 from typing import Dict, Tuple
-from jugalbandi.document_collection.repository import DocumentSourceFile
+from zipfile import ZipFile
+from jugalbandi.document_collection.repository import (
+    INGEST_CHUNK_SIZE,
+    DocumentSourceFile,
+    WrapSyncReader,
+    _manifest_cache,
+)
 import os
-from jugalbandi.document_collection import DocumentRepository
+from jugalbandi.document_collection import (
+    DocumentCollection,
+    DocumentFormat,
+    DocumentRepository,
+    FileKind,
+    IngestionLimiter,
+)
+from jugalbandi.storage import (
+    ContentAddressedStorage,
+    InMemoryStorage,
+    LocalStorage,
+    SimulatedStorage,
+)
 
 test_dir = os.path.dirname(__file__)
 
@@ -93,3 +114,151 @@ async def test_index_download(
     ) as f:
         content = f.read()
         assert content == exp_content
+
+
+async def test_streaming_ingestion(
+    memory_repo: DocumentRepository,
+    zip_source_random: Tuple[Dict[str, bytes], DocumentSourceFile],
+):
+    exp_values, zip_src_file = zip_source_random
+    pdf_content = os.urandom(3 * INGEST_CHUNK_SIZE + 17)
+    doc_collection = memory_repo.new_collection()
+    pdf_src_file = DocumentSourceFile("large.pdf", WrapSyncReader(BytesIO(pdf_content)))
+    report = await doc_collection.init_from_files([zip_src_file, pdf_src_file])
+
+    assert report.files == len(exp_values) + 1
+    assert report.bytes == sum(map(len, exp_values.values())) + len(pdf_content)
+    assert await doc_collection.read_file("large.pdf") == pdf_content
+    with open(doc_collection.local_file_path("large.pdf"), "rb") as f:
+        assert f.read() == pdf_content
+    for filename, content in exp_values.items():
+        assert await doc_collection.read_file(filename) == content
+
+
+async def test_same_content_is_stored_once():
+    pdf_content = os.urandom(2 * INGEST_CHUNK_SIZE + 17)
+    memory_store = InMemoryStorage()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo = DocumentRepository(
+            LocalStorage(temp_dir), ContentAddressedStorage(memory_store)
+        )
+        collections = [repo.new_collection(), repo.new_collection()]
+        for doc_collection in collections:
+            await doc_collection.init_from_files(
+                [DocumentSourceFile("act.pdf", WrapSyncReader(BytesIO(pdf_content)))]
+            )
+        await collections[0].write_derived("act.pdf", "pages.json", b"[1]")
+
+        blobs = [
+            entry.name
+            async for entry in memory_store.list_entries("__cas__")
+            if entry.name.endswith("/blob")
+        ]
+        assert len(blobs) == 1
+        for doc_collection in collections:
+            assert await doc_collection.read_file("act.pdf") == pdf_content
+            assert await doc_collection.read_derived("act.pdf", "pages.json") == b"[1]"
+
+
+async def test_ingestion_limits(memory_repo: DocumentRepository):
+    zip_buffer = BytesIO()
+    with ZipFile(zip_buffer, "w") as zf:
+        for i in range(20):
+            zf.writestr(f"doc{i}.txt", os.urandom(INGEST_CHUNK_SIZE // 2))
+        zf.writestr("__MACOSX/doc0.txt", b"")
+    zip_buffer.seek(0)
+
+    limiter = IngestionLimiter(max_tasks=3, max_bytes=2 * INGEST_CHUNK_SIZE)
+    doc_collection = DocumentCollection(
+        "limited", memory_repo.local_store, memory_repo.remote_store, limiter
+    )
+    report = await doc_collection.init_from_files(
+        [DocumentSourceFile("docs.zip", WrapSyncReader(zip_buffer))]
+    )
+
+    assert report.files == 20
+    assert 0 < report.peak_in_flight_bytes <= limiter.max_bytes
+    assert limiter.tasks == 0 and limiter.bytes == 0
+    assert [f async for f in doc_collection.list_files()] == sorted(
+        f"doc{i}.txt" for i in range(20)
+    )
+
+
+async def test_manifest(
+    zip_source_random: Tuple[Dict[str, bytes], DocumentSourceFile],
+):
+    exp_values, zip_src_file = zip_source_random
+    remote_store = SimulatedStorage(InMemoryStorage())
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo = DocumentRepository(LocalStorage(temp_dir), remote_store)
+        doc_collection = repo.new_collection()
+        await doc_collection.init_from_files([zip_src_file])
+        filename = sorted(exp_values)[0]
+        await doc_collection.write_file(filename, "some text", DocumentFormat.TEXT)
+        await doc_collection.write_index_file("langchain", "index.faiss", b"index")
+
+        _manifest_cache.clear()
+        remote_store.reset_stats()
+        reopened = repo.get_collection(doc_collection.id)
+        for _ in range(2):
+            assert [f async for f in reopened.list_files()] == sorted(exp_values)
+        await reopened.download_index_files("langchain", "index.faiss")
+
+    # one read of the manifest, no listing, one index download
+    assert remote_store.stats().requests == {"read_file_versioned": 1, "read_into": 1}
+    manifest = await reopened.manifest()
+    assert manifest.index_files("langchain")["index.faiss"].size == 5
+    sha256 = hashlib.sha256(exp_values[filename]).hexdigest()
+    assert manifest.files[filename].sha256 == sha256
+
+
+async def test_manifest_of_existing_collection(memory_repo: DocumentRepository):
+    remote_store = memory_repo.remote_store
+    for file_path in [
+        "old/a.pdf",
+        "old/a.txt",
+        "old/b.txt",
+        "old/langchain/index.faiss",
+        "old/langchain/index.pkl",
+        "old/index.json",
+    ]:
+        await remote_store.write_file(file_path, b"content")
+
+    doc_collection = memory_repo.get_collection("old")
+    assert [f async for f in doc_collection.list_files()] == ["a.pdf", "b.txt"]
+    assert await remote_store.file_exists("old/__manifest__.json")
+    manifest = await doc_collection.manifest()
+    assert sorted(manifest.index_files("langchain")) == ["index.faiss", "index.pkl"]
+    assert manifest.files["a.txt"].kind == FileKind.TEXT
+    assert manifest.files["index.json"].kind == FileKind.INDEX
+
+
+async def test_concurrent_manifest_updates_are_merged(memory_repo: DocumentRepository):
+    doc_collection = memory_repo.new_collection()
+    await doc_collection.write_file("a.txt", "a", DocumentFormat.TEXT)
+    # another process, which read the manifest before this one changed it
+    _manifest_cache.clear()
+    other = DocumentRepository(memory_repo.local_store, memory_repo.remote_store)
+    other_collection = other.get_collection(doc_collection.id)
+    await other_collection.manifest()
+
+    await doc_collection.write_file("b.txt", "b", DocumentFormat.TEXT)
+    await other_collection.write_file("c.txt", "c", DocumentFormat.TEXT)
+    await doc_collection.write_file("d.txt", "d", DocumentFormat.TEXT)
+
+    _manifest_cache.clear()
+    reopened = memory_repo.get_collection(doc_collection.id)
+    manifest = await reopened.manifest()
+    assert sorted(manifest.files) == ["a.txt", "b.txt", "c.txt", "d.txt"]
+
+
+async def test_empty_listing_is_not_cached(memory_repo: DocumentRepository):
+    _manifest_cache.clear()
+    remote_store = memory_repo.remote_store
+    doc_collection = memory_repo.get_collection("pending")
+    assert [f async for f in doc_collection.list_files()] == []
+
+    # uploaded by another process afterwards
+    await remote_store.write_file("pending/a.pdf", b"content")
+    reopened = memory_repo.get_collection("pending")
+    assert [f async for f in reopened.list_files()] == ["a.pdf"]
@@ -1,3 +1,26 @@
 from .legal_library import LegalLibrary, LegalDocumentType, Jurisdiction, LegalKeys
+from .index_service import LibraryIndexService, publish_index
+from .query_preprocessing import (
+    LEGAL_ABBREVIATIONS,
+    AbbreviationExpander,
+    QueryClassifier,
+    QueryType,
+)
+from .section_index import SectionIndex, SectionIndexEntry
+from .title_index import TitleIndex
 
-__all__ = ["LegalLibrary", "LegalDocumentType", "Jurisdiction", "LegalKeys"]
+__all__ = [
+    "AbbreviationExpander",
+    "LEGAL_ABBREVIATIONS",
+    "LegalLibrary",
+    "LegalDocumentType",
+    "Jurisdiction",
+    "LegalKeys",
+    "LibraryIndexService",
+    "publish_index",
+    "QueryClassifier",
+    "QueryType",
+    "SectionIndex",
+    "SectionIndexEntry",
+    "TitleIndex",
+]
@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional, Set
+import aiofiles
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores.faiss import FAISS, dependable_faiss_import
+from pydantic import BaseModel
+from jugalbandi.library import Library
+
+logger = logging.getLogger(__name__)
+
+INDEX_FOLDER = "indexes"
+INDEX_FILES = ("index.faiss", "index.pkl")
+# written last by publish_index, names the folder of the current version
+INDEX_MARKER = "current.json"
+# prefix of the versions of the files directly in indexes/, from before
+# versioned folders, followed by a hash of their etags
+UNVERSIONED = "unversioned"
+# chunk size of the uploads of publish_index
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class IndexMarker(BaseModel):
+    version: str
+
+
+async def publish_index(library: Library, local_path: str, keep: int = 2) -> str:
+    """Uploads the index files in local_path as a new version of the library's
+    index and points ``indexes/current.json`` to it once all of them are
+    stored, so services never load files of two different versions. Older
+    versions beyond the last ``keep`` ones are removed."""
+    version = f"{datetime.utcnow():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    store = library.store
+
+    async def _upload(file_name: str):
+        async with await store.open_write(
+            library._file_path(f"{INDEX_FOLDER}/{version}/{file_name}")
+        ) as writer:
+            async with aiofiles.open(os.path.join(local_path, file_name), "rb") as f:
+                while chunk := await f.read(UPLOAD_CHUNK_SIZE):
+                    await writer.write(chunk)
+
+    await asyncio.gather(*[_upload(file_name) for file_name in INDEX_FILES])
+    await store.write_file(
+        library._file_path(f"{INDEX_FOLDER}/{INDEX_MARKER}"),
+        IndexMarker(version=version).json().encode("utf-8"),
+    )
+    logger.info("Published index %s of library %s", version, library.id)
+
+    # versions sort by the time they were published
+    versions = sorted([
+        folder async for folder in store.list_subfolders(
+            library._file_path(INDEX_FOLDER)
+        )
+        if folder != version
+    ])
+    for stale_version in versions[:max(len(versions) - keep + 1, 0)]:
+        await store.delete_prefix(
+            library._file_path(f"{INDEX_FOLDER}/{stale_version}")
+        )
+    return version
+
+
+@dataclass(frozen=True)
+class LoadedIndex:
+    version: str
+    path: str
+    vector_db: FAISS
+
+
+class LibraryIndexService:
+    """Keeps the current FAISS index of a library loaded.
+
+    Each version of the index is stored in its own ``<library>/indexes/<version>``
+    folder by publish_index, which writes ``indexes/current.json`` naming it
+    last; the service only reads that marker, every ``poll_interval`` seconds.
+    A library without marker has its files directly in ``indexes``, those are
+    watched by their etags instead. A new version is downloaded to its own
+    local folder and loaded in the background while queries keep using the
+    loaded one, then swapped in.
+    The local folders are shared by the worker processes of a host: a version
+    downloaded by one of them is used by the others, and each process only
+    removes the folders it downloaded.
+    The index is memory mapped where faiss supports it, so a swap does not need
+    room for two copies of the vectors.
+    """
+
+    def __init__(
+        self,
+        library: Library,
+        embeddings_factory: Callable[[], Embeddings],
+        local_path: Optional[str] = None,
+        poll_interval: Optional[float] = None,
+        mmap: Optional[bool] = None,
+    ):
+        self.library = library
+        self.embeddings_factory = embeddings_factory
+        self.local_path = os.path.join(
+            local_path or os.getenv("LIBRARY_INDEX_PATH", INDEX_FOLDER), library.id
+        )
+        self.poll_interval = (
+            poll_interval
+            if poll_interval is not None
+            else float(os.getenv("LIBRARY_INDEX_POLL_SECONDS", "60"))
+        )
+        self.mmap = (
+            mmap
+            if mmap is not None
+            else os.getenv("LIBRARY_INDEX_MMAP", "true").lower() == "true"
+        )
+        self._loaded: Optional[LoadedIndex] = None
+        # local folders downloaded by this process
+        self._downloaded: Set[str] = set()
+        self._embeddings: Optional[Embeddings] = None
+        self._lock = asyncio.Lock()
+        self._poller: Optional[asyncio.Task] = None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._loaded.version if self._loaded is not None else None
+
+    async def current(self) -> FAISS:
+        """The loaded index, only the first call of a process waits for it."""
+        loaded = self._loaded
+        if loaded is None:
+            await self.refresh()
+            loaded = self._loaded
+            if loaded is None:
+                raise FileNotFoundError(
+                    f"No index in {self.library.id}/{INDEX_FOLDER}"
+                )
+        self._start_polling()
+        return loaded.vector_db
+
+    async def start(self):
+        """Loads the index ahead of the first query and starts watching it."""
+        await self.refresh()
+        self._start_polling()
+
+    def _start_polling(self):
+        if self._poller is None and self.poll_interval > 0:
+            self._poller = asyncio.create_task(self._poll())
+
+    async def refresh(self) -> bool:
+        """Loads the stored index if its version changed, True if it did."""
+        async with self._lock:
+            version = await self._stored_version()
+            if version is None:
+                return False
+            if self._loaded is not None and self._loaded.version == version:
+                return False
+
+            path = os.path.join(self.local_path, version)
+            await self._download(version, path)
+            vector_db = await asyncio.to_thread(self._load, path)
+            previous = self._loaded
+            self._loaded = LoadedIndex(version, path, vector_db)
+            logger.info("Loaded index %s of library %s", version, self.library.id)
+
+        # queries still running on the previous index keep their mapping, other
+        # workers may still use a folder they did not download
+        if previous is not None and previous.path in self._downloaded:
+            self._downloaded.discard(previous.path)
+            await asyncio.to_thread(shutil.rmtree, previous.path, True)
+        return True
+
+    async def _stored_version(self) -> Optional[str]:
+        try:
+            marker = await self.library.store.read_file(
+                self.library._file_path(f"{INDEX_FOLDER}/{INDEX_MARKER}")
+            )
+        except FileNotFoundError:
+            return await self._unversioned_version()
+        return IndexMarker.parse_raw(marker).version
+
+    async def _unversioned_version(self) -> Optional[str]:
+        try:
+            entries = await asyncio.gather(*[
+                self.library.store.stat(
+                    self.library._file_path(f"{INDEX_FOLDER}/{file_name}")
+                )
+                for file_name in INDEX_FILES
+            ])
+        except FileNotFoundError:
+            # being rewritten, the loaded files stay in use
+            return self._loaded.version if self._loaded is not None else None
+        etags = "/".join(str(entry.etag) for entry in entries)
+        return f"{UNVERSIONED}-{hashlib.sha1(etags.encode('utf-8')).hexdigest()[:16]}"
+
+    def _is_downloaded(self, path: str) -> bool:
+        return all(
+            os.path.exists(os.path.join(path, file_name)) for file_name in INDEX_FILES
+        )
+
+    async def _download(self, version: str, path: str):
+        if self._is_downloaded(path):
+            # by another worker, or before a restart
+            return
+        download_path = f"{path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.download"
+        os.makedirs(download_path)
+        folder = (
+            INDEX_FOLDER if version.startswith(UNVERSIONED)
+            else f"{INDEX_FOLDER}/{version}"
+        )
+        try:
+            await asyncio.gather(*[
+                self.library.store.read_into(
+                    self.library._file_path(f"{folder}/{file_name}"),
+                    os.path.join(download_path, file_name),
+                )
+                for file_name in INDEX_FILES
+            ])
+            try:
+                # fails if another worker renamed its download first
+                os.rename(download_path, path)
+                self._downloaded.add(path)
+            except OSError:
+                if not self._is_downloaded(path):
+                    raise
+        finally:
+            await asyncio.to_thread(shutil.rmtree, download_path, True)
+
+    def _load(self, path: str) -> FAISS:
+        faiss = dependable_faiss_import()
+        index_path = os.path.join(path, "index.faiss")
+        index = None
+        if self.mmap:
+            try:
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+            except RuntimeError:
+                logger.info(
+                    "Index type cannot be memory mapped, reading %s", index_path
+                )
+        if index is None:
+            index = faiss.read_index(index_path)
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        if self._embeddings is None:
+            self._embeddings = self.embeddings_factory()
+        return FAISS(
+            self._embeddings.embed_query, index, docstore, index_to_docstore_id
+        )
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception(
+                    "Could not refresh the index of library %s", self.library.id
+                )
+
+    async def shutdown(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
@@ -1,28 +1,27 @@
 from enum import Enum
-import operator
 from typing import Dict, List, Optional
 from datetime import date
 from pydantic import BaseModel
 from jugalbandi.library import DocumentMetaData, Library, DocumentSection
+from jugalbandi.library.catalog import CATALOG_FOLDER
 from jugalbandi.storage import Storage
-from cachetools import TTLCache
-from jugalbandi.core import aiocachedmethod
+from .index_service import LibraryIndexService
+from .query_preprocessing import AbbreviationExpander
+from .section_index import SectionIndex
+from .title_index import TitleIndex
 from jugalbandi.core.errors import (
     IncorrectInputException,
     InternalServerException,
 )
 from jugalbandi.jiva_repository import JivaRepository
-from sklearn.feature_extraction.text import TfidfVectorizer
-from langchain.vectorstores.faiss import FAISS
+from langchain.embeddings.base import Embeddings
 from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.embeddings.azure_openai import AzureOpenAIEmbeddings
 from langchain.docstore.document import Document
 import re
 import os
 import openai
-import json
 import roman
-import numpy as np
 import tiktoken
 
 
@@ -111,15 +110,40 @@ class ActMetaData(BaseModel):
         )
 
 
+def _embeddings() -> Embeddings:
+    # return OpenAIEmbeddings()
+    return AzureOpenAIEmbeddings(azure_deployment="ada-002",
+                                 openai_api_version="2023-05-15",
+                                 retry_min_seconds=30, disallowed_special=())
+
+
 class LegalLibrary(Library):
     def __init__(self, id: str, store: Storage):
         super(LegalLibrary, self).__init__(id, store)
-        self._act_cache: TTLCache = TTLCache(2, 900)
+        self._act_catalog: Optional[Dict[str, ActMetaData]] = None
+        self._act_catalog_version = 0
+        self._title_index: Optional[TitleIndex] = None
+        self._section_index = SectionIndex(
+            store, self._file_path(f"{CATALOG_FOLDER}/sections.json")
+        )
+        self.index_service = LibraryIndexService(self, _embeddings)
+        self.abbreviation_expander = AbbreviationExpander(
+            fallback=self._abbreviate_query
+        )
         self.jiva_repository = JivaRepository()
 
-    @aiocachedmethod(operator.attrgetter("_act_cache"))
+    async def shutdown(self):
+        await self.index_service.shutdown()
+        await super().shutdown()
+
     async def act_catalog(self) -> Dict[str, ActMetaData]:
         catalog = await self.catalog()
+        # regrouped only when the catalog changed
+        if (
+            self._act_catalog is not None
+            and self._act_catalog_version == self.catalog_version
+        ):
+            return self._act_catalog
         act_catalog: Dict[str, ActMetaData] = {}
 
         for _, doc_md in catalog.items():
@@ -134,6 +158,8 @@ class LegalLibrary(Library):
                     act_md.add_document(doc_md)
                     act_catalog[act_id] = act_md
 
+        self._act_catalog = act_catalog
+        self._act_catalog_version = self.catalog_version
         return act_catalog
 
     async def _abbreviate_query(self, query: str):
@@ -153,7 +179,8 @@ class LegalLibrary(Library):
         return result["choices"][0]["message"]["content"]
 
     async def _preprocess_query(self, query: str) -> str:
-        query = await self._abbreviate_query(query)
+        # the LLM only sees queries with abbreviations missing in the dictionary
+        query = await self.abbreviation_expander.expand(query)
         words = ["Give me", "Give", "Find me", "Find", "Get me", "Get",
                  "Tell me", "Tell"]
         for word in words:
@@ -172,18 +199,16 @@ class LegalLibrary(Library):
                 raise IncorrectInputException("Incorrect section number format")
         return str(result)
 
-    async def _get_document_section(self, section_number: str,
-                                    document_id: str, document_metadata:
-                                    DocumentMetaData) -> DocumentSection:
-        document = self.get_document(document_id)
-        byte_sections = await document.read_sections()
-        sections = json.loads(byte_sections.decode('utf-8'))
-        for section in sections:
-            if section["Section number"] == section_number:
-                return DocumentSection(section_id=section["Full section name"],
-                                       section_name=section["Section name"],
-                                       start_page=section["Start page"],
-                                       metadata=document_metadata)
+    def _get_document_section(self, section_number: str,
+                              document_metadata: DocumentMetaData
+                              ) -> Optional[DocumentSection]:
+        section = self._section_index.get(document_metadata.id, section_number)
+        if section is None:
+            return None
+        return DocumentSection(section_id=section.section_id,
+                               section_name=section.section_name,
+                               start_page=section.start_page,
+                               metadata=document_metadata)
 
     async def _generate_response(self, docs: List[Document], query: str,
                                  email_id: str, past_conversations_history: bool):
@@ -229,26 +254,21 @@ class LegalLibrary(Library):
         #                                                     response=response)
         return response
 
+    async def title_index(self) -> TitleIndex:
+        catalog = await self.catalog()
+        # rebuilt only when the catalog changed
+        if (
+            self._title_index is None
+            or self._title_index.version != self.catalog_version
+        ):
+            self._title_index = TitleIndex(catalog, self.catalog_version)
+        return self._title_index
+
     async def search_titles(self, query: str) -> List[DocumentMetaData]:
         processed_query = await self._preprocess_query(query)
         processed_query = processed_query.strip()
-        catalog = await self.catalog()
-        titles_list = [catalog[cat].title for cat in catalog]
-
-        vectorizer = TfidfVectorizer()
-        tfidf_matrix = vectorizer.fit_transform(titles_list)
-        title_vector = vectorizer.transform([processed_query])
-        cosine_similarities = tfidf_matrix.dot(title_vector.T).toarray().flatten()
-        top_3_indices = np.argsort(cosine_similarities)[-3:][::-1]
-
-        result = []
-        for i in top_3_indices:
-            title = titles_list[i]
-            for cat in catalog:
-                if catalog[cat].title == title:
-                    result.append(catalog[cat])
-
-        return result
+        title_index = await self.title_index()
+        return title_index.search(processed_query, k=3)
 
     async def search_sections(self, query: str):
         processed_query = await self._preprocess_query(query)
@@ -267,10 +287,9 @@ class LegalLibrary(Library):
             documents_metadata = await self.search_titles(title)
             document_metadata = documents_metadata[0]
             document_id = document_metadata.id
+            await self._section_index.refresh(self)
             document_sections = []
-            document_sections.append(await self._get_document_section(
-                                                                section_number,
-                                                                document_id,
+            document_sections.append(self._get_document_section(section_number,
                                                                 document_metadata))
 
             if document_sections[0] is None:
@@ -281,21 +300,15 @@ class LegalLibrary(Library):
                       document_metadata.extra_data["legal_act_year"])
 
             act_catalog = await self.act_catalog()
-            acts = act_catalog.values()
-            for act in acts:
-                if act.id == act_id:
-                    relevant_act = act
-                    break
-
+            relevant_act = act_catalog[act_id]
+            # the other documents of the act (e.g. its translations) come from
+            # the in-memory index, without reading their sections
             for act_document in relevant_act.documents:
-                new_document_id = act_document.id
-                if new_document_id != document_id:
-                    new_document = self.get_document(new_document_id)
-                    new_document_metadata = await new_document.read_metadata()
-                    document_sections.append(await self._get_document_section(
-                                                                section_number,
-                                                                new_document_id,
-                                                                new_document_metadata))
+                if act_document.id != document_id:
+                    document_section = self._get_document_section(section_number,
+                                                                  act_document)
+                    if document_section is not None:
+                        document_sections.append(document_section)
 
             return document_sections
         else:
@@ -304,9 +317,7 @@ class LegalLibrary(Library):
     async def test_response(self, query: str):
         processed_query = await self._preprocess_query(query)
         processed_query = processed_query.strip()
-        await self.download_index_files("index.faiss", "index.pkl")
-        #vector_db = FAISS.load_local("indexes", OpenAIEmbeddings())
-        vector_db = FAISS.load_local("indexes", AzureOpenAIEmbeddings(azure_deployment="ada-002",openai_api_version="2023-05-15",retry_min_seconds=30, disallowed_special=()))
+        vector_db = await self.index_service.current()
         docs = vector_db.similarity_search(query=query, k=10)
 
         contexts = []
@@ -354,9 +365,7 @@ class LegalLibrary(Library):
     async def general_search(self, query: str, email_id: str):
         processed_query = await self._preprocess_query(query)
         processed_query = processed_query.strip()
-        await self.download_index_files("index.faiss", "index.pkl")
-        # vector_db = FAISS.load_local("indexes", OpenAIEmbeddings())
-        vector_db = FAISS.load_local("indexes", AzureOpenAIEmbeddings(azure_deployment="ada-002",openai_api_version="2023-05-15",retry_min_seconds=30, disallowed_special=()))
+        vector_db = await self.index_service.current()
         docs = vector_db.similarity_search(query=query, k=10)
         return await self._generate_response(docs=docs, query=processed_query,
                                              email_id=email_id,
@@ -0,0 +1,212 @@
+import logging
+import operator
+import os
+import re
+from enum import Enum
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from cachetools import TTLCache
+from jugalbandi.core import aiocachedmethod
+
+logger = logging.getLogger(__name__)
+
+# unambiguous abbreviations of Indian statutes and legal terms, matched
+# case-insensitively as whole words
+LEGAL_ABBREVIATIONS: Dict[str, str] = {
+    "IPC": "Indian Penal Code",
+    "CrPC": "Code of Criminal Procedure",
+    "CPC": "Code of Civil Procedure",
+    "IEA": "Indian Evidence Act",
+    "BNS": "Bharatiya Nyaya Sanhita",
+    "BNSS": "Bharatiya Nagarik Suraksha Sanhita",
+    "BSA": "Bharatiya Sakshya Adhiniyam",
+    "NDPS": "Narcotic Drugs and Psychotropic Substances",
+    "POCSO": "Protection of Children from Sexual Offences",
+    "PMLA": "Prevention of Money Laundering Act",
+    "UAPA": "Unlawful Activities (Prevention) Act",
+    "IBC": "Insolvency and Bankruptcy Code",
+    "RTI": "Right to Information",
+    "GST": "Goods and Services Tax",
+    "FEMA": "Foreign Exchange Management Act",
+    "RERA": "Real Estate (Regulation and Development) Act",
+    "MV Act": "Motor Vehicles Act",
+    "IT Act": "Information Technology Act",
+    "NI Act": "Negotiable Instruments Act",
+    "SC/ST Act": "Scheduled Castes and Scheduled Tribes (Prevention of Atrocities) Act",
+    "KPEI Act": "Karnataka Professional Educational Institutions Act",
+    "BDA Act": "Bangalore Development Authority Act",
+    "BBMP": "Bruhat Bengaluru Mahanagara Palike",
+    "FIR": "First Information Report",
+    "u/s": "under section",
+    "r/w": "read with",
+    "Sec.": "Section",
+    "Art.": "Article",
+}
+
+_DOTTED_ABBREVIATION = re.compile(r"\b(?:[A-Z]\.){2,}")
+_ABBREVIATION_LIKE = re.compile(r"\b(?:[A-Z]\.){2,}|\b[A-Z][A-Za-z]{0,4}[A-Z]\b")
+_ROMAN_NUMERAL = re.compile(r"^[IVXLCDM]+$")
+# capitalized words of titles, e.g. the ACT of "Give me the KPEI ACT"
+_CAPITALIZED_WORDS = {
+    "THE", "ACT", "OF", "AND", "FOR", "IN", "ON", "TO", "AN", "BY", "OR"
+}
+
+
+class QueryType(str, Enum):
+    # the answers of the LLM classification
+    DESCRIPTIVE = "Descriptive Search"
+    NON_DESCRIPTIVE = "Non Descriptive Search"
+
+
+def _confidence_threshold() -> float:
+    return float(os.getenv("QUERY_PREPROCESSING_THRESHOLD", "0.75"))
+
+
+class AbbreviationExpander:
+    """Expands the legal abbreviations of a query from a dictionary.
+
+    A query with abbreviations that are not in the dictionary goes to the
+    fallback (e.g. an LLM), if any; results are cached per query.
+    """
+
+    def __init__(
+        self,
+        abbreviations: Dict[str, str] = LEGAL_ABBREVIATIONS,
+        fallback: Optional[Callable[[str], Awaitable[str]]] = None,
+        cache_size: int = 4096,
+        cache_ttl: float = 3600,
+    ):
+        self.abbreviations = {
+            self._key(abbreviation): expansion
+            for abbreviation, expansion in abbreviations.items()
+        }
+        self.fallback = fallback
+        self._pattern = re.compile(
+            r"(?<![\w./])(?:"
+            + "|".join(
+                re.escape(abbreviation)
+                for abbreviation in sorted(abbreviations, key=len, reverse=True)
+            )
+            + r")(?![\w/])",
+            re.IGNORECASE,
+        )
+        self._cache: TTLCache = TTLCache(cache_size, cache_ttl)
+
+    @staticmethod
+    def _key(abbreviation: str) -> str:
+        return abbreviation.lower()
+
+    def unknown_abbreviations(self, query: str) -> List[str]:
+        words = re.findall(r"[A-Za-z]{2,}", query)
+        if words and sum(word.isupper() for word in words) * 2 > len(words):
+            # a title written in capitals, its words are no abbreviations
+            return []
+        known = set(self.abbreviations)
+        return [
+            match for match in _ABBREVIATION_LIKE.findall(query)
+            if not _ROMAN_NUMERAL.match(match)
+            and match not in _CAPITALIZED_WORDS
+            and self._key(match.replace(".", "")) not in known
+        ]
+
+    def expand_locally(self, query: str) -> Tuple[str, List[str]]:
+        """The query with the known abbreviations expanded, and the
+        abbreviation-like words left in it."""
+        # I.P.C. is looked up as IPC
+        query = _DOTTED_ABBREVIATION.sub(
+            lambda match: match.group(0).replace(".", "")
+            if self._key(match.group(0).replace(".", "")) in self.abbreviations
+            else match.group(0),
+            query,
+        )
+        expanded = self._pattern.sub(
+            lambda match: self.abbreviations[self._key(match.group(0))], query
+        )
+        return expanded, self.unknown_abbreviations(expanded)
+
+    @aiocachedmethod(operator.attrgetter("_cache"))
+    async def expand(self, query: str) -> str:
+        expanded, unknown = self.expand_locally(query)
+        if unknown and self.fallback is not None:
+            logger.info("Unknown abbreviations %s, expanding with fallback", unknown)
+            return await self.fallback(query)
+        return expanded
+
+
+_SECTION_REFERENCE = re.compile(
+    r"\b(?:sec(?:tion)?s?\.?|u/s|article|art\.|rule|clause|schedule)\s*"
+    r"(?:\d+[A-Z]{0,3}|[IVXLCDM]+[A-Z]{0,3})\b",
+    re.IGNORECASE,
+)
+_STATUTE = re.compile(
+    r"\b(?:act|code|rules|regulations?|ordinance|sanhita|adhiniyam)\b", re.IGNORECASE
+)
+_COMMANDS = {
+    "give", "find", "get", "show", "tell", "list", "search", "open", "fetch",
+    "display", "locate", "lookup",
+}
+_QUESTION_WORDS = {
+    "what", "how", "why", "when", "who", "whom", "whose", "which", "where",
+    "whether", "is", "are", "can", "could", "should", "shall", "does", "do",
+    "did", "will", "would", "may", "might", "must", "explain", "describe",
+    "define", "summarize", "summarise", "compare", "difference",
+}
+# a command that still asks a question, e.g. "tell me what ..."
+_EMBEDDED_QUESTION = re.compile(
+    r"\b(?:what|how|why|when|who|whether|which|difference|punishment|penalty|"
+    r"liable|eligible|allowed|rights?)\b",
+    re.IGNORECASE,
+)
+
+
+class QueryClassifier:
+    """Tells descriptive searches (questions, answered from the index) from
+    non descriptive ones (commands looking up an act or a section) with a few
+    rules, and asks the fallback (e.g. an LLM) when the rules are not
+    confident enough. Results are cached per query."""
+
+    def __init__(
+        self,
+        fallback: Optional[Callable[[str], Awaitable[str]]] = None,
+        threshold: Optional[float] = None,
+        cache_size: int = 4096,
+        cache_ttl: float = 3600,
+    ):
+        self.fallback = fallback
+        self.threshold = threshold if threshold is not None else _confidence_threshold()
+        self._cache: TTLCache = TTLCache(cache_size, cache_ttl)
+
+    def classify_locally(self, query: str) -> Tuple[QueryType, float]:
+        words = re.findall(r"[\w/]+", query.lower())
+        if not words:
+            return QueryType.DESCRIPTIVE, 0.0
+        first = words[0]
+        is_question = query.rstrip().endswith("?") or first in _QUESTION_WORDS
+        is_command = first in _COMMANDS
+        section_reference = _SECTION_REFERENCE.search(query) is not None
+        statute = _STATUTE.search(query) is not None
+
+        if is_question:
+            return QueryType.DESCRIPTIVE, 0.9
+        if is_command and _EMBEDDED_QUESTION.search(query):
+            return QueryType.DESCRIPTIVE, 0.6
+        if section_reference and len(words) <= 12:
+            return QueryType.NON_DESCRIPTIVE, 0.95
+        if is_command and statute:
+            return QueryType.NON_DESCRIPTIVE, 0.9
+        if statute and len(words) <= 8:
+            # the title of an act
+            return QueryType.NON_DESCRIPTIVE, 0.8
+        if is_command:
+            return QueryType.NON_DESCRIPTIVE, 0.6
+        return QueryType.DESCRIPTIVE, 0.5
+
+    @aiocachedmethod(operator.attrgetter("_cache"))
+    async def classify(self, query: str) -> QueryType:
+        query_type, confidence = self.classify_locally(query)
+        if confidence >= self.threshold or self.fallback is None:
+            return query_type
+        logger.info("Classifying with fallback, confidence %.2f", confidence)
+        answer = await self.fallback(query)
+        if QueryType.NON_DESCRIPTIVE.value.lower() in answer.lower():
+            return QueryType.NON_DESCRIPTIVE
+        return QueryType.DESCRIPTIVE
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+from pydantic import BaseModel, ValidationError
+from jugalbandi.library import Library
+from jugalbandi.storage import Storage, bulk_apply
+
+logger = logging.getLogger(__name__)
+
+SECTIONS_FILE_NAME = "sections.json"
+
+
+def normalize_section_number(section_number: Any) -> str:
+    section_number = str(section_number).strip().upper()
+    if section_number.isdigit():
+        return str(int(section_number))
+    return section_number
+
+
+class SectionIndexEntry(BaseModel):
+    section_id: str
+    section_name: str
+    start_page: int
+
+
+class SectionIndexData(BaseModel):
+    catalog_version: int = 0
+    # catalog version of the last touch() when the library was listed, None
+    # before the first listing
+    touched_version: Optional[int] = None
+    # document id -> etag of its sections.json as listed, also for documents
+    # that are not in the catalog yet
+    etags: Dict[str, Optional[str]] = {}
+    # document id -> normalized section number -> section
+    sections: Dict[str, Dict[str, SectionIndexEntry]] = {}
+
+
+class SectionIndex:
+    """The sections of all the documents of a library, from their
+    sections.json files, persisted as one file.
+
+    refresh() brings it to the library's catalog version: the persisted index
+    is used as is when it was built for that version. Sections are written
+    with a touch() of the catalog, so the library is listed only when the
+    catalog was touched since the last listing, to find the sections.json
+    files that changed; only those and the ones of documents new in the
+    catalog are read.
+    """
+
+    def __init__(self, store: Storage, file_path: str):
+        self.store = store
+        self.file_path = file_path
+        self._data: Optional[SectionIndexData] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def catalog_version(self) -> int:
+        return self._data.catalog_version if self._data is not None else 0
+
+    def get(self, document_id: str, section_number: str) -> Optional[SectionIndexEntry]:
+        if self._data is None:
+            return None
+        return self._data.sections.get(document_id, {}).get(
+            normalize_section_number(section_number)
+        )
+
+    async def refresh(self, library: Library):
+        catalog = await library.catalog()
+        version = library.catalog_version
+        if self._data is not None and self._data.catalog_version == version:
+            return
+        async with self._lock:
+            if self._data is not None and self._data.catalog_version == version:
+                return
+            if self._data is None:
+                self._data = await self._load()
+                if self._data.catalog_version == version:
+                    return
+            self._data = await self._update(library, set(catalog.keys()), version)
+
+    async def _load(self) -> SectionIndexData:
+        try:
+            content = await self.store.read_file(self.file_path)
+            return SectionIndexData.parse_raw(content)
+        except FileNotFoundError:
+            return SectionIndexData()
+
+    async def _update(
+        self, library: Library, document_ids: set, version: int
+    ) -> SectionIndexData:
+        assert self._data is not None
+        touched_version = library.catalog_touched_version
+        if self._data.touched_version == touched_version:
+            # only metadata changed, the listed sections are still current
+            etags = self._data.etags
+        else:
+            etags = {}
+            async for entry in library.store.list_entries(library.id):
+                doc_id, _, file_name = entry.name.partition("/")
+                if file_name == SECTIONS_FILE_NAME:
+                    etags[doc_id] = entry.etag
+
+        sections = {
+            doc_id: doc_sections for doc_id, doc_sections in self._data.sections.items()
+            if doc_id in document_ids
+            and etags.get(doc_id) is not None
+            and self._data.etags.get(doc_id) == etags[doc_id]
+        }
+        changed = [
+            doc_id for doc_id in etags
+            if doc_id in document_ids and doc_id not in sections
+        ]
+
+        async def _changed() -> AsyncIterator[str]:
+            for doc_id in changed:
+                yield doc_id
+
+        async def _read_sections(doc_id: str):
+            content = await library.get_document(doc_id).read_sections()
+            sections[doc_id] = _parse_sections(
+                doc_id, json.loads(content.decode("utf-8"))
+            )
+
+        result = await bulk_apply(_changed(), _read_sections)
+        for doc_id, failure in result.failures.items():
+            # read again with the next catalog version
+            logger.warning("Skipping the sections of %s: %s", doc_id, failure)
+
+        data = SectionIndexData(
+            catalog_version=version,
+            touched_version=touched_version,
+            etags=etags,
+            sections=sections,
+        )
+        await self.store.write_file(self.file_path, data.json().encode("utf-8"))
+        logger.info(
+            "Section index of %s at catalog version %d (%d documents read)",
+            library.id, version, len(result.processed),
+        )
+        return data
+
+
+def _parse_sections(
+    doc_id: str, sections: List[Dict[str, Any]]
+) -> Dict[str, SectionIndexEntry]:
+    entries: Dict[str, SectionIndexEntry] = {}
+    for section in sections:
+        try:
+            section_number = normalize_section_number(section["Section number"])
+            entry = SectionIndexEntry(
+                section_id=section["Full section name"],
+                section_name=section["Section name"],
+                start_page=section["Start page"],
+            )
+        except (KeyError, ValidationError):
+            logger.warning("Skipping malformed section of %s: %s", doc_id, section)
+            continue
+        # the first section with a number wins, as with a linear scan
+        entries.setdefault(section_number, entry)
+    return entries
@@ -0,0 +1,73 @@
+from collections import Counter
+from typing import Dict, List
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from jugalbandi.library import DocumentMetaData
+
+
+class TitleIndex:
+    """TF-IDF vectors of the titles of a catalog, one row per document.
+
+    Built once per catalog version. A search weighs the query terms with the
+    fitted vocabulary and idf and only adds up the postings of those terms,
+    the vectorizer's transform and a sparse product per query cost more than
+    the search itself.
+    """
+
+    def __init__(self, catalog: Dict[str, DocumentMetaData], version: int = 0):
+        self.version = version
+        self.doc_ids = np.array(list(catalog.keys()), dtype=object)
+        self._metadata = list(catalog.values())
+        self._vectorizer = TfidfVectorizer()
+        if self._metadata:
+            # rows are l2 normalized, the product with a query is its cosine
+            matrix = self._vectorizer.fit_transform(
+                [metadata.title for metadata in self._metadata]
+            )
+            # one row of (document, weight) postings per term
+            self._postings = matrix.T.tocsr()
+            self._analyzer = self._vectorizer.build_analyzer()
+            self._vocabulary = self._vectorizer.vocabulary_
+            self._idf = self._vectorizer.idf_
+
+    def __len__(self) -> int:
+        return len(self._metadata)
+
+    def scores(self, query: str) -> np.ndarray:
+        """Cosine similarity of the query with every title."""
+        scores = np.zeros(len(self))
+        if not self._metadata:
+            return scores
+        counts = Counter(
+            self._vocabulary[term] for term in self._analyzer(query)
+            if term in self._vocabulary
+        )
+        if not counts:
+            return scores
+        terms = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        weights *= self._idf[terms]
+        weights /= np.linalg.norm(weights)
+        indptr, indices, data = (
+            self._postings.indptr, self._postings.indices, self._postings.data
+        )
+        for term, weight in zip(terms, weights):
+            start, end = indptr[term], indptr[term + 1]
+            scores[indices[start:end]] += data[start:end] * weight
+        return scores
+
+    def top_k(self, query: str, k: int = 3) -> List[int]:
+        """Rows of the k titles closest to the query, best first."""
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+        scores = self.scores(query)
+        top = np.argpartition(-scores, k - 1)[:k]
+        # only the k selected rows are sorted, equal scores in catalog order
+        return top[np.lexsort((top, -scores[top]))].tolist()
+
+    def search(self, query: str, k: int = 3) -> List[DocumentMetaData]:
+        return [self._metadata[row] for row in self.top_k(query, k)]
+
+    def search_ids(self, query: str, k: int = 3) -> List[str]:
+        return [self.doc_ids[row] for row in self.top_k(query, k)]
@@ -0,0 +1,142 @@
+import json
+import pytest
+from langchain.embeddings import FakeEmbeddings
+from langchain.vectorstores.faiss import FAISS
+from jugalbandi.library import Library
+from jugalbandi.legal_library import LibraryIndexService, publish_index
+from jugalbandi.storage import InMemoryStorage, SimulatedStorage
+
+
+def _embeddings():
+    return FakeEmbeddings(size=8)
+
+
+def _save_index(path, *texts) -> str:
+    FAISS.from_texts(list(texts), _embeddings()).save_local(str(path))
+    return str(path)
+
+
+def _texts(vector_db: FAISS):
+    documents = vector_db.docstore._dict.values()
+    return sorted(document.page_content for document in documents)
+
+
+def _service(library: Library, tmp_path) -> LibraryIndexService:
+    return LibraryIndexService(
+        library, _embeddings, str(tmp_path / "local"), poll_interval=0, mmap=True
+    )
+
+
+async def test_new_versions_are_swapped_in(tmp_path):
+    store = InMemoryStorage()
+    library = Library("lib", store)
+    service = _service(library, tmp_path)
+    with pytest.raises(FileNotFoundError):
+        await service.current()
+
+    first = await publish_index(library, _save_index(tmp_path / "v1", "murder"))
+    first_db = await service.current()
+    assert _texts(first_db) == ["murder"]
+    assert service.version == first
+
+    assert not await service.refresh()
+    second = await publish_index(
+        library, _save_index(tmp_path / "v2", "arrest", "bail")
+    )
+    assert await service.refresh()
+    assert service.version == second
+    assert _texts(await service.current()) == ["arrest", "bail"]
+    # queries already running keep the previous index
+    assert _texts(first_db) == ["murder"]
+    assert sorted((tmp_path / "local" / "lib").iterdir()) == [
+        tmp_path / "local" / "lib" / second
+    ]
+
+
+async def test_workers_share_the_local_folders(tmp_path):
+    memory_store = InMemoryStorage()
+    library = Library("lib", memory_store)
+    first = await publish_index(library, _save_index(tmp_path / "v1", "murder"))
+    store = SimulatedStorage(memory_store)
+    workers = [_service(library, tmp_path), _service(Library("lib", store), tmp_path)]
+    for worker in workers:
+        await worker.start()
+    # downloaded by the first worker only
+    assert "read_into" not in store.stats().requests
+
+    second = await publish_index(library, _save_index(tmp_path / "v2", "arrest"))
+    assert await workers[1].refresh()
+    # still used by the first worker, which downloaded it
+    local = tmp_path / "local" / "lib"
+    assert sorted(path.name for path in local.iterdir()) == sorted([first, second])
+    assert await workers[0].refresh()
+    assert [path.name for path in local.iterdir()] == [second]
+    assert _texts(await workers[0].current()) == ["arrest"]
+
+
+async def test_files_of_an_unpublished_version_are_not_loaded(tmp_path):
+    store = InMemoryStorage()
+    library = Library("lib", store)
+    service = _service(library, tmp_path)
+    version = await publish_index(library, _save_index(tmp_path / "v1", "murder"))
+    await service.start()
+
+    # a publish in progress, its marker is not written yet
+    with open(tmp_path / "v1" / "index.faiss", "rb") as f:
+        await store.write_file("lib/indexes/next/index.faiss", f.read())
+    assert not await service.refresh()
+    assert service.version == version
+
+
+async def test_polling_reads_the_marker_only(tmp_path):
+    memory_store = InMemoryStorage()
+    await publish_index(
+        Library("lib", memory_store), _save_index(tmp_path / "v1", "murder")
+    )
+    store = SimulatedStorage(memory_store)
+    service = _service(Library("lib", store), tmp_path)
+    await service.start()
+
+    store.reset_stats()
+    assert not await service.refresh()
+    assert store.stats().requests == {"read_file": 1}
+
+
+async def test_publish_keeps_the_last_versions(tmp_path):
+    store = InMemoryStorage()
+    library = Library("lib", store)
+    versions = [
+        await publish_index(library, _save_index(tmp_path / f"v{n}", str(n)))
+        for n in range(4)
+    ]
+
+    stored = [folder async for folder in store.list_subfolders("lib/indexes")]
+    assert stored == versions[-2:]
+    marker = json.loads(await store.read_file("lib/indexes/current.json"))
+    assert marker == {"version": versions[-1]}
+
+
+async def _write_unversioned(store: InMemoryStorage, path: str):
+    for file_name in ("index.faiss", "index.pkl"):
+        with open(f"{path}/{file_name}", "rb") as f:
+            await store.write_file(f"lib/indexes/{file_name}", f.read())
+
+
+async def test_unversioned_index_is_loaded(tmp_path):
+    store = InMemoryStorage()
+    library = Library("lib", store)
+    await _write_unversioned(store, _save_index(tmp_path / "v1", "murder"))
+    service = _service(library, tmp_path)
+
+    assert _texts(await service.current()) == ["murder"]
+    assert not await service.refresh()
+    # rewritten by an older producer, also seen after a restart
+    await _write_unversioned(store, _save_index(tmp_path / "v2", "bail"))
+    assert await service.refresh()
+    assert _texts(await service.current()) == ["bail"]
+    restarted = _service(library, tmp_path)
+    assert _texts(await restarted.current()) == ["bail"]
+
+    version = await publish_index(library, _save_index(tmp_path / "v3", "arrest"))
+    assert await service.refresh()
+    assert service.version == version
@@ -0,0 +1,72 @@
+from jugalbandi.legal_library import AbbreviationExpander, QueryClassifier, QueryType
+
+
+async def test_expands_known_abbreviations_locally():
+    calls = []
+
+    async def llm(query: str) -> str:
+        calls.append(query)
+        return query
+
+    expander = AbbreviationExpander(fallback=llm)
+    assert await expander.expand("Give me section 4 of IT act") == (
+        "Give me section 4 of Information Technology Act"
+    )
+    assert await expander.expand("punishment u/s 302 I.P.C.") == (
+        "punishment under section 302 Indian Penal Code"
+    )
+    assert await expander.expand("Give me section IV of crpc") == (
+        "Give me section IV of Code of Criminal Procedure"
+    )
+    assert await expander.expand("THE KARNATAKA DEBT RELIEF ACT, 2018") == (
+        "THE KARNATAKA DEBT RELIEF ACT, 2018"
+    )
+    assert calls == []
+
+
+async def test_unknown_abbreviations_use_the_fallback_once():
+    calls = []
+
+    async def llm(query: str) -> str:
+        calls.append(query)
+        return "Give me the Karnataka Stamp Act"
+
+    expander = AbbreviationExpander(fallback=llm)
+    for _ in range(3):
+        expanded = await expander.expand("Give me the KSA")
+        assert expanded == "Give me the Karnataka Stamp Act"
+    assert calls == ["Give me the KSA"]
+
+
+async def test_classifies_common_queries_locally():
+    async def llm(query: str) -> str:
+        raise AssertionError(f"LLM called for {query}")
+
+    classifier = QueryClassifier(fallback=llm, threshold=0.75)
+    for query in [
+        "Give me section 19 bangalore development authority act",
+        "Give me debt relief act 2018",
+        "section 302 of Indian Penal Code",
+        "the karnataka professional Educational institutions act",
+    ]:
+        assert await classifier.classify(query) == QueryType.NON_DESCRIPTIVE, query
+    for query in [
+        "What is the punishment for murder?",
+        "how can a tenant be evicted under the rent control act",
+        "Can the police arrest without a warrant",
+    ]:
+        assert await classifier.classify(query) == QueryType.DESCRIPTIVE, query
+
+
+async def test_uncertain_queries_use_the_fallback():
+    calls = []
+
+    async def llm(query: str) -> str:
+        calls.append(query)
+        return "Non Descriptive Search"
+
+    classifier = QueryClassifier(fallback=llm, threshold=0.75)
+    for _ in range(2):
+        query_type = await classifier.classify("bail for first time offenders")
+        assert query_type == QueryType.NON_DESCRIPTIVE
+    assert calls == ["bail for first time offenders"]
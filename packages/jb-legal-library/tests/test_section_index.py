@@ -0,0 +1,89 @@
+import json
+from jugalbandi.library import DocumentFormat, DocumentMetaData, Library
+from jugalbandi.legal_library import SectionIndex
+from jugalbandi.storage import InMemoryStorage, SimulatedStorage
+
+
+def _sections(*rows):
+    return json.dumps(
+        [
+            {
+                "Full section name": f"Section {no}. {name}",
+                "Section number": no,
+                "Section name": name,
+                "Start page": page,
+            }
+            for no, name, page in rows
+        ]
+    ).encode("utf-8")
+
+
+async def _add(library: Library, doc_id: str, sections: bytes):
+    metadata = DocumentMetaData(
+        id=doc_id,
+        title=doc_id,
+        original_file_name=f"{doc_id}.pdf",
+        original_format=DocumentFormat.PDF,
+    )
+    document = await library.add_document(metadata, b"%PDF")
+    await document.write_sections(sections)
+
+
+async def test_section_index_reads_changed_sections_only():
+    memory_store = InMemoryStorage()
+    library = Library("lib", memory_store)
+    await library.catalog()
+    await _add(
+        library, "ipc", _sections(("302", "Murder", 120), ("302", "Duplicate", 1))
+    )
+    await _add(library, "ipc-hi", _sections(("302", "Hatya", 130), ("IV", "Roman", 4)))
+
+    store = SimulatedStorage(memory_store)
+    worker = Library("lib", store)
+    index = SectionIndex(store, "lib/__catalog__/sections.json")
+    await index.refresh(worker)
+    assert index.get("ipc", "302").section_name == "Murder"
+    assert index.get("ipc-hi", " 302 ").start_page == 130
+    assert index.get("ipc-hi", "iv").section_name == "Roman"
+    assert index.get("ipc", "303") is None
+
+    await _add(library, "crpc", _sections(("41", "Arrest", 20)))
+    worker._catalog_snapshot.poll_interval = 0
+    store.reset_stats()
+    await index.refresh(worker)
+    assert index.get("crpc", "41").start_page == 20
+    # catalog version, changed shard, listing, the new sections and the index
+    assert store.stats().requests == {
+        "read_file_versioned": 2, "read_file": 1, "list_entries": 1, "write_file": 1
+    }
+
+    # another worker loads the persisted index with one read
+    other = SectionIndex(memory_store, "lib/__catalog__/sections.json")
+    await other.refresh(Library("lib", memory_store))
+    assert other.get("ipc", "302").section_name == "Murder"
+
+
+async def test_metadata_changes_do_not_list_the_library():
+    memory_store = InMemoryStorage()
+    library = Library("lib", memory_store)
+    await library.catalog()
+    for index in range(40):
+        await _add(library, f"act-{index}", _sections(("1", f"Act {index}", 1)))
+
+    store = SimulatedStorage(memory_store)
+    worker = Library("lib", store)
+    worker._catalog_snapshot.poll_interval = 0
+    index = SectionIndex(store, "lib/__catalog__/sections.json")
+    await index.refresh(worker)
+    assert index.get("act-39", "1").section_name == "Act 39"
+    # the persisted index, then the sections of every document
+    assert store.stats().requests["read_file"] == 41
+
+    metadata = await library.get_document("act-3").read_metadata()
+    metadata.title = "renamed"
+    await library.get_document("act-3").write_metadata(metadata)
+    store.reset_stats()
+    await index.refresh(worker)
+    assert index.catalog_version == library.catalog_version
+    # catalog version, changed shard and the index
+    assert store.stats().requests == {"read_file_versioned": 2, "write_file": 1}
@@ -0,0 +1,42 @@
+from jugalbandi.library import DocumentFormat, DocumentMetaData
+from jugalbandi.legal_library import TitleIndex
+
+
+def _catalog(*titles: str):
+    return {
+        f"doc-{i}": DocumentMetaData(
+            id=f"doc-{i}",
+            title=title,
+            original_file_name=f"{i}.pdf",
+            original_format=DocumentFormat.PDF,
+        )
+        for i, title in enumerate(titles)
+    }
+
+
+def test_search_returns_documents_best_first():
+    index = TitleIndex(
+        _catalog(
+            "The Indian Penal Code",
+            "The Code of Criminal Procedure",
+            "The Indian Contract Act",
+            "The Motor Vehicles Act",
+        )
+    )
+    assert index.search_ids("indian penal code", k=2) == ["doc-0", "doc-2"]
+    assert [md.title for md in index.search("motor vehicles", k=1)] == [
+        "The Motor Vehicles Act"
+    ]
+
+
+def test_repeated_titles_are_returned_once_each():
+    index = TitleIndex(
+        _catalog("The Arbitration Act", "The Arbitration Act", "The Companies Act")
+    )
+    assert index.search_ids("arbitration act", k=3) == ["doc-0", "doc-1", "doc-2"]
+
+
+def test_small_and_empty_catalogs():
+    index = TitleIndex(_catalog("The Companies Act"))
+    assert index.search_ids("companies", k=3) == ["doc-0"]
+    assert TitleIndex({}).search("anything") == []
@@ -6,11 +6,21 @@ from .library import (
     DocumentFormat,
     DocumentMetaData,
     DocumentSupportingMetadata,
+    MetadataTransaction,
+)
+from .catalog import CatalogSnapshot
+from .page_render import (
+    PageImageFormat,
+    PageNumberError,
+    PageRenderConfig,
+    PageRenderService,
+    RenderedPage,
 )
 from .sections import SectionPdf
 
 
 __all__ = [
+    "CatalogSnapshot",
     "Document",
     "DocumentSection",
     "Library",
@@ -18,5 +28,11 @@ __all__ = [
     "DocumentFormat",
     "DocumentMetaData",
     "DocumentSupportingMetadata",
+    "MetadataTransaction",
+    "PageImageFormat",
+    "PageNumberError",
+    "PageRenderConfig",
+    "PageRenderService",
+    "RenderedPage",
     "SectionPdf",
 ]
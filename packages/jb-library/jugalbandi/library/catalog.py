@@ -0,0 +1,297 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from typing import Dict, Generic, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel
+from jugalbandi.storage import PreconditionFailedError, Storage
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FOLDER = "__catalog__"
+# conditional writes of one update before it gives up
+COMMIT_ATTEMPTS = 10
+
+M = TypeVar("M", bound=BaseModel)
+
+
+class CatalogVersion(BaseModel):
+    version: int = 0
+    shards: int = 1
+    # shard -> version that last changed it
+    shard_versions: Dict[int, int] = {}
+    # version of the last touch(), or of the rebuild if none came after it
+    touched: int = 0
+
+
+class CatalogSnapshot(Generic[M]):
+    """The metadata of all the documents of a library in a few sharded files
+    under ``__catalog__``, next to a small version file.
+
+    Readers load the snapshot with one read per shard and afterwards only read
+    the version file, at most every ``poll_interval`` seconds, reloading the
+    shards that changed. Writers update a shard and then bump the version,
+    both with conditional writes: a writer that lost to another one (in this
+    or another process) reads the shard or version again and reapplies its
+    change, so readers never see a version whose shard is not written yet and
+    concurrent updates are not lost.
+    """
+
+    def __init__(
+        self,
+        store: Storage,
+        folder: str,
+        model: Type[M],
+        shards: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+    ):
+        self.store = store
+        self.folder = folder
+        self.model = model
+        self.shards = shards or int(os.getenv("LIBRARY_CATALOG_SHARDS", "16"))
+        self.poll_interval = (
+            poll_interval
+            if poll_interval is not None
+            else float(os.getenv("LIBRARY_CATALOG_POLL_SECONDS", "30"))
+        )
+        self._version: Optional[CatalogVersion] = None
+        self._version_etag: Optional[str] = None
+        self._shard_documents: Dict[int, Dict[str, M]] = {}
+        # etags of the shards as last read or written, absent when unknown
+        self._shard_etags: Dict[int, Optional[str]] = {}
+        self._documents: Optional[Dict[str, M]] = None
+        self._polled_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version.version if self._version is not None else 0
+
+    @property
+    def touched_version(self) -> int:
+        return self._version.touched if self._version is not None else 0
+
+    def _version_path(self) -> str:
+        return f"{self.folder}/version.json"
+
+    def _shard_path(self, shard: int) -> str:
+        return f"{self.folder}/catalog-{shard}.json"
+
+    @staticmethod
+    def _shard_of(doc_id: str, shards: int) -> int:
+        digest = hashlib.sha1(doc_id.encode("utf-8")).hexdigest()
+        return int(digest[:8], 16) % shards
+
+    async def _read_version(self) -> Tuple[Optional[CatalogVersion], Optional[str]]:
+        try:
+            content, etag = await self.store.read_file_versioned(self._version_path())
+        except FileNotFoundError:
+            return None, None
+        return CatalogVersion.parse_raw(content), etag
+
+    async def _read_shard(self, shard: int) -> Tuple[Dict[str, M], Optional[str]]:
+        content, etag = await self.store.read_file_versioned(self._shard_path(shard))
+        documents = {
+            doc_id: self.model.parse_obj(metadata)
+            for doc_id, metadata in json.loads(content)["documents"].items()
+        }
+        return documents, etag
+
+    def _shard_content(self, documents: Dict[str, M]) -> bytes:
+        content = "{" + '"documents":{' + ",".join(
+            f"{json.dumps(doc_id)}:{metadata.json()}"
+            for doc_id, metadata in documents.items()
+        ) + "}}"
+        return content.encode("utf-8")
+
+    def _merge_shards(self):
+        # a new dict per change, callers may keep the previous one
+        self._documents = {
+            doc_id: metadata
+            for documents in self._shard_documents.values()
+            for doc_id, metadata in documents.items()
+        }
+
+    async def _refresh(self, force: bool = False) -> bool:
+        """Brings the documents up to the stored version, False if there is
+        no snapshot."""
+        if (
+            not force
+            and self._documents is not None
+            and time.monotonic() - self._polled_at < self.poll_interval
+        ):
+            return True
+        version, version_etag = await self._read_version()
+        self._polled_at = time.monotonic()
+        if version is None:
+            return False
+        self._version_etag = version_etag
+        if self._version is not None and version.version == self._version.version:
+            return True
+
+        if self._version is None or version.shards != self._version.shards:
+            changed = list(range(version.shards))
+            self._shard_documents = {}
+            self._shard_etags = {}
+        else:
+            changed = [
+                shard for shard in range(version.shards)
+                if version.shard_versions.get(shard)
+                != self._version.shard_versions.get(shard)
+            ]
+        shards = await asyncio.gather(*[self._read_shard(shard) for shard in changed])
+        for shard, (documents, etag) in zip(changed, shards):
+            self._shard_documents[shard] = documents
+            self._shard_etags[shard] = etag
+        self._version = version
+        self._merge_shards()
+        logger.info(
+            "Loaded catalog %s version %d (%d shards read)",
+            self.folder, version.version, len(changed),
+        )
+        return True
+
+    def peek(self, doc_id: str) -> Optional[M]:
+        """The document as of the loaded version, without any request."""
+        if self._documents is None:
+            return None
+        return self._documents.get(doc_id)
+
+    async def load(self) -> Optional[Dict[str, M]]:
+        """All the documents, None if the snapshot has not been built yet."""
+        if not await self._refresh():
+            return None
+        return self._documents
+
+    async def _bump_version(self, shard: Optional[int] = None, touch: bool = False):
+        """Writes the next version (changing shard, if any) on top of the
+        loaded one, raises PreconditionFailedError if it is not the stored
+        one anymore."""
+        assert self._version is not None
+        version_number = self._version.version + 1
+        shard_versions = dict(self._version.shard_versions)
+        if shard is not None:
+            shard_versions[shard] = version_number
+        version = CatalogVersion(
+            version=version_number,
+            shards=self._version.shards,
+            shard_versions=shard_versions,
+            touched=version_number if touch else self._version.touched,
+        )
+        self._version_etag = await self.store.write_file_if_match(
+            self._version_path(), version.json().encode("utf-8"), self._version_etag
+        )
+        self._version = version
+
+    async def _backoff(
+        self, error: PreconditionFailedError, description: str, attempt: int
+    ):
+        if attempt == COMMIT_ATTEMPTS:
+            raise error
+        logger.info(
+            "Catalog %s changed while %s, attempt %d", self.folder, description, attempt
+        )
+        await asyncio.sleep(random.uniform(0, min(1.0, 0.02 * 2**attempt)))
+
+    async def rebuild(self, documents: Dict[str, M]):
+        async with self._lock:
+            shard_documents: Dict[int, Dict[str, M]] = {
+                shard: {} for shard in range(self.shards)
+            }
+            for doc_id, metadata in documents.items():
+                shard = self._shard_of(doc_id, self.shards)
+                shard_documents[shard][doc_id] = metadata
+            await asyncio.gather(*[
+                self.store.write_file(
+                    self._shard_path(shard), self._shard_content(docs)
+                )
+                for shard, docs in shard_documents.items()
+            ])
+            for attempt in range(1, COMMIT_ATTEMPTS + 1):
+                previous, etag = await self._read_version()
+                version_number = (previous.version if previous is not None else 0) + 1
+                version = CatalogVersion(
+                    version=version_number,
+                    shards=self.shards,
+                    shard_versions={
+                        shard: version_number for shard in range(self.shards)
+                    },
+                    touched=version_number,
+                )
+                try:
+                    self._version_etag = await self.store.write_file_if_match(
+                        self._version_path(), version.json().encode("utf-8"), etag
+                    )
+                    break
+                except PreconditionFailedError as e:
+                    await self._backoff(e, "rebuilding", attempt)
+            self._version = version
+            self._shard_documents = shard_documents
+            # written unconditionally, the next update reads them again
+            self._shard_etags = {}
+            self._documents = dict(documents)
+            self._polled_at = time.monotonic()
+
+    async def _update(self, doc_id: str, metadata: Optional[M]):
+        async with self._lock:
+            for attempt in range(1, COMMIT_ATTEMPTS + 1):
+                # a library without snapshot gets one built from all the
+                # documents the next time the catalog is read
+                if not await self._refresh(force=True):
+                    return
+                try:
+                    await self._apply(doc_id, metadata)
+                    return
+                except PreconditionFailedError as e:
+                    await self._backoff(e, f"updating {doc_id}", attempt)
+
+    async def _apply(self, doc_id: str, metadata: Optional[M]):
+        assert self._version is not None
+        shard = self._shard_of(doc_id, self._version.shards)
+        if shard not in self._shard_etags:
+            self._shard_documents[shard], self._shard_etags[shard] = (
+                await self._read_shard(shard)
+            )
+        documents = dict(self._shard_documents[shard])
+        if metadata is None:
+            if documents.pop(doc_id, None) is None:
+                return
+        else:
+            # callers keep modifying the metadata they wrote
+            documents[doc_id] = metadata.copy(deep=True)
+        try:
+            etag = await self.store.write_file_if_match(
+                self._shard_path(shard),
+                self._shard_content(documents),
+                self._shard_etags[shard],
+            )
+        except PreconditionFailedError:
+            # written by another writer that may not have bumped the version yet
+            del self._shard_etags[shard]
+            raise
+        self._shard_documents[shard] = documents
+        self._shard_etags[shard] = etag
+        self._merge_shards()
+        await self._bump_version(shard)
+
+    async def touch(self):
+        """New version without changes to the documents, for data derived from
+        the documents' files (e.g. their sections); readers reload no shard."""
+        async with self._lock:
+            for attempt in range(1, COMMIT_ATTEMPTS + 1):
+                if not await self._refresh(force=True):
+                    return
+                try:
+                    await self._bump_version(touch=True)
+                    return
+                except PreconditionFailedError as e:
+                    await self._backoff(e, "touching", attempt)
+
+    async def put(self, doc_id: str, metadata: M):
+        await self._update(doc_id, metadata)
+
+    async def remove(self, doc_id: str):
+        await self._update(doc_id, None)
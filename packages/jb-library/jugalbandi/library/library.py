@@ -1,20 +1,30 @@
 import asyncio
 from enum import Enum
 import operator
-from typing import Dict, Optional
+import os
+import random
+from typing import Callable, Dict, List, Optional
 import uuid
-import aiofiles
 from pydantic import BaseModel
 from datetime import date, datetime
-from jugalbandi.storage import Storage
-from jugalbandi.core import aiocachedmethod
+from jugalbandi.storage import (
+    BulkOperationResult,
+    PreconditionFailedError,
+    Storage,
+    StorageReader,
+)
 from cachetools import TTLCache, cachedmethod
 import logging
 from aiofiles import os as aiofiles_os
+from .catalog import CATALOG_FOLDER, CatalogSnapshot
+from .metadata_cache import MetadataCache
 
 
 logger = logging.getLogger(__name__)
 
+# images of the pages of a document, see PageRenderService
+PAGES_FOLDER = "__pages__"
+
 
 class DocumentFormat(str, Enum):
     DEFAULT = ""
@@ -62,11 +72,18 @@ class DocumentSection(BaseModel):
     metadata: DocumentMetaData
 
 
+def _in_catalog(doc_id: str) -> bool:
+    return doc_id != "indexes" and not doc_id.startswith("__")
+
+
 class Library:
     def __init__(self, id: str, store: Storage):
         self.id = id
         self.store = store
-        self._directory_cache: TTLCache = TTLCache(maxsize=2, ttl=900)
+        self._catalog_snapshot: CatalogSnapshot[DocumentMetaData] = CatalogSnapshot(
+            store, self._file_path(CATALOG_FOLDER), DocumentMetaData
+        )
+        self.metadata_cache: MetadataCache[DocumentMetaData] = MetadataCache()
         self._task_manager_store_cache: TTLCache = TTLCache(maxsize=2, ttl=900)
 
     def _file_path(self, file_suffix: str):
@@ -81,19 +98,46 @@ class Library:
     async def _make_public(self, file_path: str):
         return await self.store.make_public(file_path)
 
-    @aiocachedmethod(operator.attrgetter("_directory_cache"))
-    async def catalog(self):
+    @property
+    def catalog_version(self) -> int:
+        """Version of the catalog last returned by catalog(), changes with every
+        update of the metadata of a document."""
+        return self._catalog_snapshot.version
+
+    @property
+    def catalog_touched_version(self) -> int:
+        """Catalog version of the last change of files derived from the
+        documents (e.g. their sections), not of their metadata."""
+        return self._catalog_snapshot.touched_version
+
+    async def catalog(self) -> Dict[str, DocumentMetaData]:
+        cat = await self._catalog_snapshot.load()
+        if cat is None:
+            # first use of a library written before the snapshot existed
+            cat = await self._scan_catalog()
+            await self._catalog_snapshot.rebuild(cat)
+        return cat
+
+    async def rebuild_catalog(self) -> Dict[str, DocumentMetaData]:
+        """Rebuilds the catalog snapshot from the metadata of every document."""
+        cat = await self._scan_catalog()
+        await self._catalog_snapshot.rebuild(cat)
+        return cat
+
+    async def _scan_catalog(self) -> Dict[str, DocumentMetaData]:
         cat: Dict[str, DocumentMetaData] = {}  # type: ignore
 
         async def _add_metadata(doc_id):
-            if doc_id != "indexes":
-                document = self.get_document(doc_id)
-                metadata = await document.read_metadata()
-                cat[doc_id] = metadata
+            document = self.get_document(doc_id)
+            metadata = await document.read_metadata()
+            cat[doc_id] = metadata
 
+        # one listing finds the documents that have metadata, instead of listing
+        # the folders and probing each of them
         async with asyncio.TaskGroup() as taskgroup:
-            async for doc_id in self.store.list_subfolders(self.id):
-                if not doc_id.startswith("__"):
+            async for entry in self.store.list_entries(self.id):
+                doc_id, _, file_name = entry.name.partition("/")
+                if _in_catalog(doc_id) and file_name == "metadata.json":
                     taskgroup.create_task(_add_metadata(doc_id))
 
         return cat
@@ -111,8 +155,17 @@ class Library:
         await document.write_document(content)
         return document
 
-    async def remove_document(self, document_id: str):
-        return await self.store.remove_file(self._file_path(document_id))
+    async def remove_document(self, document_id: str) -> BulkOperationResult:
+        result = await self.store.delete_prefix(self._file_path(document_id))
+        await self._catalog_snapshot.remove(document_id)
+        self.metadata_cache.invalidate(document_id)
+        if not result.ok:
+            logger.warning(
+                "Could not delete %d files of document %s",
+                len(result.failures),
+                document_id,
+            )
+        return result
 
     async def download_index_files(self, *filenames: str):
         if not await aiofiles_os.path.exists("indexes"):
@@ -121,9 +174,8 @@ class Library:
             temp_file_path = "indexes/" + filename
             if not await aiofiles_os.path.exists(temp_file_path):
                 index_file_name = self._file_path(temp_file_path)
-                file_content = await self._download(index_file_name)
-                async with aiofiles.open(temp_file_path, "wb") as f:
-                    await f.write(file_content)
+                # large indexes are fetched in parallel ranges straight to disk
+                await self.store.read_into(index_file_name, temp_file_path)
 
     def get_document(self, document_id: str):
         return Document(self, document_id)
@@ -147,11 +199,109 @@ class LibraryFileNameError(Exception):
     pass
 
 
+MetadataChange = Callable[[DocumentMetaData], None]
+
+
+class MetadataTransaction:
+    """Changes to the metadata of a document, applied with one read and one
+    conditional write of its metadata.json on commit.
+
+    When the metadata changed since it was read, the write fails and the
+    changes are applied again to the new metadata, for at most
+    ``max_attempts`` writes (``LIBRARY_METADATA_COMMIT_ATTEMPTS``, default 5).
+    As an async context manager, it commits when the block exits without an
+    exception.
+    """
+
+    def __init__(self, document: "Document", max_attempts: Optional[int] = None):
+        self.document = document
+        self.max_attempts = max_attempts or int(
+            os.getenv("LIBRARY_METADATA_COMMIT_ATTEMPTS", "5")
+        )
+        self._changes: List[MetadataChange] = []
+
+    @property
+    def pending(self) -> bool:
+        return len(self._changes) > 0
+
+    def update(self, change: MetadataChange):
+        """Adds a change, a function modifying the metadata in place. It is
+        applied once per attempt."""
+        self._changes.append(change)
+
+    def set_public_url(self, public_url: str):
+        def _change(metadata: DocumentMetaData):
+            metadata.public_url = public_url
+
+        self.update(_change)
+
+    def add_supporting(self, supporting_metadata: DocumentSupportingMetadata):
+        def _change(metadata: DocumentMetaData):
+            metadata.supportings[supporting_metadata.name] = supporting_metadata.copy()
+
+        self.update(_change)
+
+    def set_supporting_public_url(self, name: str, public_url: str):
+        def _change(metadata: DocumentMetaData):
+            if name not in metadata.supportings:
+                logger.warning(f"Supporting file not in metadata - {name}")
+                return
+            metadata.supportings[name].public_url = public_url
+            if name == "thumbnail.png":
+                metadata.thumbnail_url = public_url
+
+        self.update(_change)
+
+    def set_translated_data(self, field_name: str, translations: Dict[str, str]):
+        def _change(metadata: DocumentMetaData):
+            metadata.translated_data[field_name] = dict(translations)
+
+        self.update(_change)
+
+    async def commit(self) -> Optional[DocumentMetaData]:
+        """Writes the changes, returns the metadata written (None without
+        changes). Raises PreconditionFailedError when every attempt lost to a
+        concurrent update."""
+        if not self._changes:
+            return None
+        library = self.document.library
+        file_path = self.document._file_path("metadata.json")
+        for attempt in range(1, self.max_attempts + 1):
+            content, etag = await library.store.read_file_versioned(file_path)
+            metadata = DocumentMetaData.parse_raw(content)
+            for change in self._changes:
+                change(metadata)
+            try:
+                await library.store.write_file_if_match(
+                    file_path, bytes(metadata.json(), "utf-8"), etag
+                )
+            except PreconditionFailedError:
+                if attempt == self.max_attempts:
+                    raise
+                logger.info(
+                    "Metadata of %s changed during commit, attempt %d",
+                    self.document.id,
+                    attempt,
+                )
+                await asyncio.sleep(random.uniform(0, min(1.0, 0.05 * 2**attempt)))
+                continue
+            self._changes = []
+            await self.document._metadata_written(metadata)
+            return metadata
+        return None
+
+    async def __aenter__(self) -> "MetadataTransaction":
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            await self.commit()
+
+
 class Document:
     def __init__(self, library: Library, doc_id: str):
         self._library = library
         self._id = doc_id
-        self._metadata_cache: TTLCache = TTLCache(maxsize=2, ttl=300)
 
     def _file_path(self, *file_suffix: str) -> str:
         suffix = "/".join(file_suffix)
@@ -242,10 +392,28 @@ class Document:
             bytes(metadata.json(), "utf-8"),
             file_type=LibraryFileType.METADATA,
         )
-        self._metadata_cache.clear()
+        await self._metadata_written(metadata)
+
+    def metadata_transaction(self) -> MetadataTransaction:
+        return MetadataTransaction(self)
+
+    async def _metadata_written(self, metadata: DocumentMetaData):
+        if _in_catalog(self.id):
+            await self._library._catalog_snapshot.put(self.id, metadata)
+        self._library.metadata_cache.put(
+            self.id, self._library.catalog_version, metadata
+        )
 
-    @aiocachedmethod(operator.attrgetter("_metadata_cache"))
     async def read_metadata(self) -> DocumentMetaData:
+        return await self._library.metadata_cache.get_or_load(
+            self.id, self._library.catalog_version, self._load_metadata
+        )
+
+    async def _load_metadata(self) -> DocumentMetaData:
+        # the loaded catalog has the metadata of this version
+        metadata = self._library._catalog_snapshot.peek(self.id)
+        if metadata is not None:
+            return metadata.copy(deep=True)
         content = await self._read(file_type=LibraryFileType.METADATA)
         return DocumentMetaData.parse_raw(content)
 
@@ -254,35 +422,67 @@ class Document:
         content: bytes,
         format: Optional[DocumentFormat] = None,
     ):
-        return await self._write(content, document_format=format)
+        await self._write(content, document_format=format)
+        # pages rendered from the previous content
+        await self._library.store.delete_prefix(self._file_path(PAGES_FOLDER))
 
     async def read_document(
         self,
         format: Optional[DocumentFormat] = None,
         local_file_path: Optional[str] = None,
     ):
-        content = await self._read(document_format=format)
         if local_file_path is not None:
-            async with aiofiles.open(local_file_path, "wb") as f:
-                await f.write(content)
+            # streamed to disk instead of being loaded in memory
+            await self._library.store.read_into(
+                await self._default_file_path(format), local_file_path
+            )
+        else:
+            return await self._read(document_format=format)
+
+    async def open_document(
+        self,
+        format: Optional[DocumentFormat] = None,
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> StorageReader:
+        """Streams the bytes [start, end) of the document."""
+        return await self._library.store.open_read(
+            await self._default_file_path(format), start, end
+        )
+
+    async def document_size(self, format: Optional[DocumentFormat] = None) -> int:
+        entry = await self._library.store.stat(await self._default_file_path(format))
+        return entry.size or 0
+
+    async def document_etag(
+        self, format: Optional[DocumentFormat] = None
+    ) -> Optional[str]:
+        """Changes whenever the document is rewritten."""
+        entry = await self._library.store.stat(await self._default_file_path(format))
+        return entry.etag
 
     async def write_supporting_document(
         self,
         supporting_metadata: DocumentSupportingMetadata,
         name: str,
         content: bytes,
-    ):
+        transaction: Optional[MetadataTransaction] = None,
+    ) -> Optional[DocumentMetaData]:
+        """Writes a supporting document and adds it to the metadata, in
+        transaction if given (returning None), else right away."""
         await self._write(
             content,
             file_path=name,
             file_type=LibraryFileType.SUPPORTING,
         )
 
-        metadata = await self.read_metadata()
         supporting_metadata.create_ts = datetime.now().timestamp()
-        metadata.supportings[supporting_metadata.name] = supporting_metadata
-        await self.write_metadata(metadata)
-        return metadata
+        if transaction is not None:
+            transaction.add_supporting(supporting_metadata)
+            return None
+        transaction = self.metadata_transaction()
+        transaction.add_supporting(supporting_metadata)
+        return await transaction.commit()
 
     async def read_supporting_document(self, name: str) -> bytes:
         return await self._read(
@@ -291,10 +491,12 @@ class Document:
         )
 
     async def write_sections(self, content: bytes):
-        return await self._write(
+        await self._write(
             content,
             file_type=LibraryFileType.SECTIONS,
         )
+        # indexes of the sections are refreshed with the catalog version
+        await self._library._catalog_snapshot.touch()
 
     async def read_sections(self):
         return await self._read(
@@ -308,7 +510,10 @@ class Document:
         task_name: Optional[str] = None,
         file_type: Optional[LibraryFileType] = LibraryFileType.DEFAULT,
         document_format: Optional[DocumentFormat] = DocumentFormat.DEFAULT,
+        transaction: Optional[MetadataTransaction] = None,
     ) -> str:
+        """Makes a file public; the URL of the document or of a supporting
+        document is recorded in the metadata, in transaction if given."""
         full_file_path = await self._file_path_by_type_format(
             file_path=file_path,
             pipeline_name=pipeline_name,
@@ -322,17 +527,17 @@ class Document:
             file_type == LibraryFileType.DEFAULT
             or file_type == LibraryFileType.SUPPORTING
         ):
-            metadata = await self.read_metadata()
+            own_transaction = transaction is None
+            if transaction is None:
+                transaction = self.metadata_transaction()
             if file_type == LibraryFileType.DEFAULT:
-                metadata.public_url = public_url
-                await self.write_metadata(metadata)
-            elif file_path in metadata.supportings:
-                metadata.supportings[file_path].public_url = public_url
-                if file_path == "thumbnail.png":
-                    metadata.thumbnail_url = public_url
-                await self.write_metadata(metadata)
+                transaction.set_public_url(public_url)
             else:
-                logger.warn(f"Supporting file not in metadata - {file_path}")
+                transaction.set_supporting_public_url(
+                    file_path, public_url  # type: ignore
+                )
+            if own_transaction:
+                await transaction.commit()
         return public_url
 
     async def public_url(
@@ -0,0 +1,75 @@
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, Optional, Tuple, TypeVar
+from cachetools import TTLCache
+from pydantic import BaseModel
+
+M = TypeVar("M", bound=BaseModel)
+
+
+@dataclass
+class MetadataCacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    # entries dropped for room, not expired ones
+    evictions: int = 0
+    entries: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+
+class _EvictionCountingCache(TTLCache):
+    evictions = 0
+
+    def popitem(self):
+        self.evictions += 1
+        return super().popitem()
+
+
+class MetadataCache(Generic[M]):
+    """Metadata of the documents of a library, shared by all their Document
+    handles.
+
+    An entry is valid for the catalog version it was read at and for at most
+    ``ttl`` seconds, for changes by other processes that this process has not
+    seen in the catalog yet. Entries are copies, callers may modify what they
+    get.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        if ttl is None:
+            ttl = float(os.getenv("LIBRARY_METADATA_CACHE_TTL", "300"))
+        self._entries: _EvictionCountingCache = _EvictionCountingCache(
+            max_entries or int(os.getenv("LIBRARY_METADATA_CACHE_SIZE", "4096")), ttl
+        )
+        self._stats = MetadataCacheStats()
+
+    async def get_or_load(
+        self, doc_id: str, version: int, load: Callable[[], Awaitable[M]]
+    ) -> M:
+        entry: Optional[Tuple[int, M]] = self._entries.get(doc_id)
+        if entry is not None and entry[0] == version:
+            self._stats.hits += 1
+            return entry[1].copy(deep=True)
+        self._stats.misses += 1
+        metadata = await load()
+        self._entries[doc_id] = (version, metadata.copy(deep=True))
+        return metadata
+
+    def put(self, doc_id: str, version: int, metadata: M):
+        self._stats.writes += 1
+        self._entries[doc_id] = (version, metadata.copy(deep=True))
+
+    def invalidate(self, doc_id: str):
+        self._entries.pop(doc_id, None)
+
+    def stats(self) -> MetadataCacheStats:
+        self._stats.evictions = self._entries.evictions
+        self._stats.entries = len(self._entries)
+        return MetadataCacheStats(**vars(self._stats))
@@ -0,0 +1,289 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+from cachetools import TTLCache
+import fitz
+from .library import PAGES_FOLDER, Document, Library
+
+logger = logging.getLogger(__name__)
+
+# page counts of document versions kept in memory
+PAGE_COUNT_ENTRIES = 4096
+
+
+class PageNumberError(ValueError):
+    """The page does not exist in the document."""
+
+
+class PageImageFormat(str, Enum):
+    PNG = "png"
+    WEBP = "webp"
+
+    @property
+    def media_type(self) -> str:
+        return f"image/{self.value}"
+
+
+@dataclass(frozen=True)
+class PageRenderConfig:
+    dpi: int = 72
+    format: PageImageFormat = PageImageFormat.PNG
+    workers: int = 2
+    # in-memory cache of rendered pages
+    cache_bytes: int = 64 * 1024 * 1024
+    cache_ttl: float = 3600
+
+    @classmethod
+    def from_env(cls) -> "PageRenderConfig":
+        return cls(
+            dpi=int(os.getenv("LIBRARY_PAGE_DPI", "72")),
+            format=PageImageFormat(os.getenv("LIBRARY_PAGE_FORMAT", "png").lower()),
+            workers=int(
+                os.getenv(
+                    "LIBRARY_PAGE_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))
+                )
+            ),
+            cache_bytes=int(
+                os.getenv("LIBRARY_PAGE_CACHE_BYTES", str(64 * 1024 * 1024))
+            ),
+            cache_ttl=float(os.getenv("LIBRARY_PAGE_CACHE_TTL", "3600")),
+        )
+
+
+@dataclass(frozen=True)
+class RenderedPage:
+    content: bytes
+    format: PageImageFormat
+    etag: str
+
+    @classmethod
+    def of(cls, content: bytes, format: PageImageFormat) -> "RenderedPage":
+        return cls(content, format, f'"{hashlib.sha1(content).hexdigest()[:20]}"')
+
+    @property
+    def media_type(self) -> str:
+        return self.format.media_type
+
+
+def _page_count(pdf_path: str) -> int:
+    with fitz.open(pdf_path) as pdf:
+        return pdf.page_count
+
+
+def _render_page(
+    pdf_path: str, page_number: int, dpi: int, format: PageImageFormat
+) -> bytes:
+    with fitz.open(pdf_path) as pdf:
+        if page_number < 1 or page_number > pdf.page_count:
+            raise PageNumberError(f"No page {page_number} in the document")
+        pixmap = pdf.load_page(page_number - 1).get_pixmap(dpi=dpi)
+    if format == PageImageFormat.PNG:
+        return pixmap.tobytes("png")
+    # PyMuPDF does not write WebP
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    buffer = BytesIO()
+    image.save(buffer, format="WEBP", quality=80)
+    return buffer.getvalue()
+
+
+# document, its version, page, dpi and format
+PageKey = Tuple[str, str, int, int, PageImageFormat]
+
+
+class PageRenderService:
+    """Images of the pages of a library's PDF documents.
+
+    Pages are rendered in a process pool, kept in storage under the document's
+    ``__pages__`` folder (removed with the document or when it is rewritten)
+    and in a bounded in-memory cache, keyed by document, page, dpi and format
+    and by the version of the document, from one stat of its file per
+    request, so a document rewritten by another worker is rendered again
+    instead of being served from the cache. Concurrent requests for the same
+    page render it once. The page count of each version is kept next to the
+    pages and in memory, so pages out of range are rejected with
+    PageNumberError without downloading the document.
+    """
+
+    def __init__(
+        self,
+        library: Library,
+        config: Optional[PageRenderConfig] = None,
+        executor: Optional[Executor] = None,
+    ):
+        self.library = library
+        self.config = config or PageRenderConfig.from_env()
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._cache: TTLCache = TTLCache(
+            self.config.cache_bytes,
+            self.config.cache_ttl,
+            getsizeof=lambda page: len(page.content),
+        )
+        self._pending: Dict[PageKey, asyncio.Future] = {}
+        # (document, version) -> page count
+        self._page_counts: TTLCache = TTLCache(
+            PAGE_COUNT_ENTRIES, self.config.cache_ttl
+        )
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.config.workers)
+        return self._executor
+
+    def _page_path(self, document: Document, key: PageKey) -> str:
+        _, version, page_number, dpi, format = key
+        return document._file_path(
+            PAGES_FOLDER, version, str(dpi), f"{page_number}.{format.value}"
+        )
+
+    @staticmethod
+    def _page_count_path(document: Document, version: str) -> str:
+        return document._file_path(PAGES_FOLDER, version, "pages.json")
+
+    async def _page_count(self, document: Document, version: str) -> Optional[int]:
+        """The page count of the version, None until it has been rendered."""
+        page_count = self._page_counts.get((document.id, version))
+        if page_count is None:
+            try:
+                content = await self.library.store.read_file(
+                    self._page_count_path(document, version)
+                )
+            except FileNotFoundError:
+                return None
+            page_count = json.loads(content)["page_count"]
+            self._page_counts[(document.id, version)] = page_count
+        return page_count
+
+    async def _set_page_count(self, document: Document, version: str, page_count: int):
+        if self._page_counts.get((document.id, version)) == page_count:
+            return
+        await self.library.store.write_file(
+            self._page_count_path(document, version),
+            json.dumps({"page_count": page_count}).encode("utf-8"),
+        )
+        self._page_counts[(document.id, version)] = page_count
+
+    @staticmethod
+    async def _version(document: Document) -> str:
+        # etags may contain characters that do not belong in a path
+        etag = await document.document_etag()
+        return hashlib.sha1(str(etag).encode("utf-8")).hexdigest()[:16]
+
+    async def render(
+        self,
+        document_id: str,
+        page_number: int,
+        dpi: Optional[int] = None,
+        format: Optional[PageImageFormat] = None,
+    ) -> RenderedPage:
+        document = self.library.get_document(document_id)
+        version = await self._version(document)
+        page_count = await self._page_count(document, version)
+        if page_count is not None and not 1 <= page_number <= page_count:
+            raise PageNumberError(f"No page {page_number} in {document_id}")
+        key = (
+            document_id,
+            version,
+            page_number,
+            dpi or self.config.dpi,
+            format or self.config.format,
+        )
+        page = self._cache.get(key)
+        if page is not None:
+            return page
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            page = await self._load_or_render(key)
+            if len(page.content) <= self.config.cache_bytes:
+                self._cache[key] = page
+            future.set_result(page)
+            return page
+        except BaseException as e:
+            future.set_exception(e)
+            # retrieved, no "exception was never retrieved" without waiters
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    async def _load_or_render(self, key: PageKey) -> RenderedPage:
+        document_id, version, page_number, dpi, format = key
+        document = self.library.get_document(document_id)
+        page_path = self._page_path(document, key)
+        try:
+            return RenderedPage.of(
+                await self.library.store.read_file(page_path), format
+            )
+        except FileNotFoundError:
+            pass
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pdf_path = os.path.join(temp_dir, "document.pdf")
+            await document.read_document(local_file_path=pdf_path)
+            page_count = await asyncio.to_thread(_page_count, pdf_path)
+            await self._set_page_count(document, version, page_count)
+            if not 1 <= page_number <= page_count:
+                raise PageNumberError(f"No page {page_number} in {document_id}")
+            content = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), _render_page, pdf_path, page_number, dpi, format
+            )
+        await self.library.store.write_file(page_path, content)
+        return RenderedPage.of(content, format)
+
+    async def prerender(
+        self,
+        document_id: str,
+        dpi: Optional[int] = None,
+        format: Optional[PageImageFormat] = None,
+    ) -> int:
+        """Renders all the pages of a document to storage, returns their number."""
+        dpi = dpi or self.config.dpi
+        format = format or self.config.format
+        document = self.library.get_document(document_id)
+        version = await self._version(document)
+        loop = asyncio.get_running_loop()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pdf_path = os.path.join(temp_dir, "document.pdf")
+            await document.read_document(local_file_path=pdf_path)
+            page_count = await asyncio.to_thread(_page_count, pdf_path)
+            await self._set_page_count(document, version, page_count)
+
+            async def _prerender_page(page_number: int):
+                content = await loop.run_in_executor(
+                    self._get_executor(),
+                    _render_page,
+                    pdf_path,
+                    page_number,
+                    dpi,
+                    format,
+                )
+                key = (document_id, version, page_number, dpi, format)
+                await self.library.store.write_file(
+                    self._page_path(document, key), content
+                )
+
+            async with asyncio.TaskGroup() as taskgroup:
+                for page_number in range(1, page_count + 1):
+                    taskgroup.create_task(_prerender_page(page_number))
+        logger.info("Rendered %d pages of %s at %d dpi", page_count, document_id, dpi)
+        return page_count
+
+    def shutdown(self):
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
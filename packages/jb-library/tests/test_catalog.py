@@ -0,0 +1,92 @@
+import asyncio
+from pydantic import BaseModel
+from jugalbandi.library import CatalogSnapshot
+from jugalbandi.storage import InMemoryStorage, SimulatedStorage
+
+
+class _Metadata(BaseModel):
+    title: str
+
+
+def _snapshot(store, shards=4) -> CatalogSnapshot[_Metadata]:
+    # one snapshot per simulated process, polling on every load
+    return CatalogSnapshot(store, "lib/__catalog__", _Metadata, shards, 0)
+
+
+async def test_missing_snapshot_is_built_on_rebuild():
+    snapshot = _snapshot(InMemoryStorage())
+
+    assert await snapshot.load() is None
+    await snapshot.put("a", _Metadata(title="A"))
+    assert await snapshot.load() is None
+
+    await snapshot.rebuild({"a": _Metadata(title="A"), "b": _Metadata(title="B")})
+    assert sorted(await snapshot.load()) == ["a", "b"]
+    assert snapshot.version == 1
+
+
+async def test_updates_are_seen_by_other_readers():
+    store = InMemoryStorage()
+    writer, reader = _snapshot(store), _snapshot(store)
+    await writer.rebuild({"a": _Metadata(title="A")})
+    assert (await reader.load())["a"].title == "A"
+
+    await writer.put("a", _Metadata(title="A2"))
+    await writer.put("b", _Metadata(title="B"))
+    await writer.remove("missing")
+    documents = await reader.load()
+    assert {doc_id: m.title for doc_id, m in documents.items()} == {
+        "a": "A2", "b": "B"
+    }
+    assert reader.version == writer.version == 3
+
+    await writer.remove("a")
+    assert sorted(await reader.load()) == ["b"]
+
+
+async def test_concurrent_writers_do_not_lose_documents():
+    store = InMemoryStorage()
+    await _snapshot(store).rebuild({})
+    writers = [_snapshot(store) for _ in range(4)]
+
+    await asyncio.gather(*[
+        writers[index % 4].put(f"doc-{index}", _Metadata(title=str(index)))
+        for index in range(40)
+    ])
+
+    documents = await _snapshot(store).load()
+    assert sorted(documents) == sorted(f"doc-{index}" for index in range(40))
+    assert _snapshot(store).version == 0
+    assert max(writer.version for writer in writers) == 41
+
+
+async def test_readers_reload_only_changed_shards():
+    store = SimulatedStorage(InMemoryStorage())
+    writer, reader = _snapshot(store, shards=8), _snapshot(store, shards=8)
+    await writer.rebuild({f"doc-{index}": _Metadata(title="") for index in range(20)})
+    await reader.load()
+
+    store.reset_stats()
+    await writer.put("doc-3", _Metadata(title="changed"))
+    assert writer.touched_version == writer.version - 1
+    await writer.touch()
+    writes = store.stats().requests["write_file_if_match"]
+    store.reset_stats()
+    documents = await reader.load()
+
+    # the shard and the version, then the version of touch
+    assert writes == 3
+    # the version and the changed shard
+    assert store.stats().requests["read_file_versioned"] == 2
+    assert documents["doc-3"].title == "changed"
+    assert reader.version == reader.touched_version == writer.version
+
+
+async def test_writes_keep_a_copy_of_the_metadata():
+    snapshot = _snapshot(InMemoryStorage())
+    await snapshot.rebuild({})
+    metadata = _Metadata(title="A")
+    await snapshot.put("a", metadata)
+    metadata.title = "modified"
+
+    assert snapshot.peek("a").title == "A"
@@ -0,0 +1,40 @@
+from jugalbandi.library import DocumentFormat, DocumentMetaData, Library
+from jugalbandi.storage import InMemoryStorage, SimulatedStorage
+
+
+def _metadata(doc_id: str) -> DocumentMetaData:
+    return DocumentMetaData(
+        id=doc_id,
+        title=doc_id,
+        original_file_name=f"{doc_id}.pdf",
+        original_format=DocumentFormat.PDF,
+    )
+
+
+async def test_metadata_is_read_once_per_document():
+    memory_store = InMemoryStorage()
+    writer = Library("lib", memory_store)
+    for doc_id in ["a", "b"]:
+        await writer.add_document(_metadata(doc_id), b"%PDF")
+
+    # without catalog snapshot every load is a read of metadata.json
+    store = SimulatedStorage(memory_store)
+    library = Library("lib", store)
+    for _ in range(3):
+        for doc_id in ["a", "b"]:
+            # a new handle per request, as the services do
+            metadata = await library.get_document(doc_id).read_metadata()
+            assert metadata.title == doc_id
+    assert store.stats().requests == {"read_file": 2}
+    stats = library.metadata_cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (4, 2, 2)
+
+    # written through, the next read needs no request
+    metadata.title = "changed"
+    await library.get_document("b").write_metadata(metadata)
+    store.reset_stats()
+    assert (await library.get_document("b").read_metadata()).title == "changed"
+    assert store.stats().requests.get("read_file", 0) == 0
+    stats = library.metadata_cache.stats()
+    assert (stats.hits, stats.writes) == (5, 1)
+    assert stats.hit_ratio == 5 / 7
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import pytest
+from jugalbandi.library import (
+    DocumentFormat,
+    DocumentMetaData,
+    DocumentSupportingMetadata,
+    Library,
+    LibraryFileType,
+)
+from jugalbandi.storage import InMemoryStorage, PreconditionFailedError
+
+
+def _metadata() -> DocumentMetaData:
+    return DocumentMetaData(
+        title="Act", original_file_name="act.pdf", original_format=DocumentFormat.PDF
+    )
+
+
+def _supporting(doc_id: str, name: str) -> DocumentSupportingMetadata:
+    return DocumentSupportingMetadata(
+        doc_id=doc_id, name=name, original_file_name="act.pdf"
+    )
+
+
+async def _stored_metadata(store, doc_id: str) -> dict:
+    return json.loads(await store.read_file(f"lib/{doc_id}/metadata.json"))
+
+
+def _count_metadata_requests(store: InMemoryStorage) -> dict:
+    requests = {"read": 0, "write": 0}
+    read_file_versioned = store.read_file_versioned
+    write_file_if_match = store.write_file_if_match
+
+    async def _read(file_path):
+        if file_path.endswith("/metadata.json"):
+            requests["read"] += 1
+        return await read_file_versioned(file_path)
+
+    async def _write(file_path, content, etag):
+        if file_path.endswith("/metadata.json"):
+            requests["write"] += 1
+        return await write_file_if_match(file_path, content, etag)
+
+    store.read_file_versioned = _read
+    store.write_file_if_match = _write
+    return requests
+
+
+async def test_changes_are_committed_in_one_write():
+    store = InMemoryStorage()
+    library = Library("lib", store)
+    document = await library.add_document(_metadata(), b"%PDF")
+    requests = _count_metadata_requests(store)
+
+    async with document.metadata_transaction() as transaction:
+        await document.make_public(transaction=transaction)
+        await document.write_supporting_document(
+            _supporting(document.id, "thumbnail.png"),
+            "thumbnail.png",
+            b"png",
+            transaction=transaction,
+        )
+        await document.make_public(
+            file_path="thumbnail.png",
+            file_type=LibraryFileType.SUPPORTING,
+            transaction=transaction,
+        )
+        transaction.set_translated_data("title", {"Hindi": "अधिनियम"})
+
+    assert requests == {"read": 1, "write": 1}
+    stored = await _stored_metadata(store, document.id)
+    assert stored["public_url"].endswith(f"{document.id}.pdf")
+    assert stored["thumbnail_url"].endswith("__support__/thumbnail.png")
+    assert stored["translated_data"] == {"title": {"Hindi": "अधिनियम"}}
+    metadata = await document.read_metadata()
+    assert metadata.thumbnail_url == stored["thumbnail_url"]
+
+
+async def test_no_commit_when_the_block_fails():
+    store = InMemoryStorage()
+    library = Library("lib", store)
+    document = await library.add_document(_metadata(), b"%PDF")
+
+    with pytest.raises(RuntimeError):
+        async with document.metadata_transaction() as transaction:
+            transaction.set_translated_data("title", {"Hindi": "अधिनियम"})
+            raise RuntimeError("failed")
+    assert (await _stored_metadata(store, document.id))["translated_data"] == {}
+
+
+async def test_concurrent_updates_are_not_lost():
+    store = InMemoryStorage()
+    library = Library("lib", store)
+    document = await library.add_document(_metadata(), b"%PDF")
+
+    async def _add(index: int):
+        # each update is a separate transaction of a separate handle
+        handle = library.get_document(document.id)
+        handle_transaction = handle.metadata_transaction()
+        handle_transaction.max_attempts = 50
+        handle_transaction.add_supporting(_supporting(document.id, f"s{index}"))
+        await asyncio.sleep(0)
+        await handle_transaction.commit()
+
+    await asyncio.gather(*[_add(index) for index in range(20)])
+
+    stored = await _stored_metadata(store, document.id)
+    assert sorted(stored["supportings"]) == sorted(f"s{index}" for index in range(20))
+    assert len((await document.read_metadata()).supportings) == 20
+
+
+async def test_changes_are_applied_again_after_a_conflict():
+    store = InMemoryStorage()
+    library = Library("lib", store)
+    document = await library.add_document(_metadata(), b"%PDF")
+    transaction = document.metadata_transaction()
+    transaction.set_translated_data("title", {"Hindi": "अधिनियम"})
+
+    write_file_if_match = store.write_file_if_match
+    conflicts = 0
+
+    async def _conflicting_write(file_path, content, etag):
+        nonlocal conflicts
+        if conflicts == 0:
+            # another worker updates the metadata between read and write
+            conflicts += 1
+            other = await _stored_metadata(store, document.id)
+            other["title"] = "Updated Act"
+            await store.write_file(file_path, json.dumps(other).encode("utf-8"))
+        return await write_file_if_match(file_path, content, etag)
+
+    store.write_file_if_match = _conflicting_write
+    metadata = await transaction.commit()
+
+    assert conflicts == 1
+    assert metadata.title == "Updated Act"
+    stored = await _stored_metadata(store, document.id)
+    assert stored["title"] == "Updated Act"
+    assert stored["translated_data"] == {"title": {"Hindi": "अधिनियम"}}
+
+
+async def test_commit_gives_up_after_max_attempts():
+    store = InMemoryStorage()
+    library = Library("lib", store)
+    document = await library.add_document(_metadata(), b"%PDF")
+
+    async def _always_conflicting(file_path, content, etag):
+        raise PreconditionFailedError(file_path)
+
+    store.write_file_if_match = _always_conflicting
+    transaction = document.metadata_transaction()
+    transaction.max_attempts = 2
+    transaction.set_public_url("memory://act.pdf")
+    with pytest.raises(PreconditionFailedError):
+        await transaction.commit()
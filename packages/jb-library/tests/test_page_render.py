@@ -0,0 +1,114 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import fitz
+import pytest
+from jugalbandi.library import (
+    DocumentFormat,
+    DocumentMetaData,
+    Library,
+    PageImageFormat,
+    PageNumberError,
+    PageRenderConfig,
+    PageRenderService,
+)
+from jugalbandi.storage import InMemoryStorage, SimulatedStorage
+
+
+def _pdf(*texts: str) -> bytes:
+    with fitz.open() as pdf:
+        for text in texts:
+            pdf.new_page().insert_text((72, 72), text)
+        return pdf.tobytes()
+
+
+def _metadata() -> DocumentMetaData:
+    return DocumentMetaData(
+        id="act",
+        title="Act",
+        original_file_name="act.pdf",
+        original_format=DocumentFormat.PDF,
+    )
+
+
+class _CountingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+def _service(library: Library, executor=None) -> PageRenderService:
+    config = PageRenderConfig(dpi=36, format=PageImageFormat.PNG)
+    return PageRenderService(library, config, executor or _CountingExecutor())
+
+
+async def test_pages_are_rendered_once():
+    memory_store = InMemoryStorage()
+    await Library("lib", memory_store).add_document(
+        _metadata(), _pdf("first", "second")
+    )
+    store = SimulatedStorage(memory_store)
+    service = _service(Library("lib", store))
+
+    pages = await asyncio.gather(*[service.render("act", 2) for _ in range(5)])
+    assert service._executor.submitted == 1
+    assert len({page.etag for page in pages}) == 1
+    assert pages[0].content.startswith(b"\x89PNG")
+
+    store.reset_stats()
+    assert await service.render("act", 2) == pages[0]
+    # only the version of the document
+    assert store.stats().requests == {"stat": 1}
+
+    store.reset_stats()
+    with pytest.raises(PageNumberError):
+        await service.render("act", 3)
+    # rejected with the page count of the version, without download
+    assert store.stats().requests == {"stat": 1}
+
+
+async def test_page_count_is_shared_with_other_workers():
+    memory_store = InMemoryStorage()
+    library = Library("lib", memory_store)
+    await library.add_document(_metadata(), _pdf("first", "second"))
+    await _service(library).render("act", 1)
+
+    store = SimulatedStorage(memory_store)
+    service = _service(Library("lib", store))
+    for page_number in (0, 3):
+        with pytest.raises(PageNumberError):
+            await service.render("act", page_number)
+    # the metadata, the version and the page count, then the version only
+    assert store.stats().requests == {"read_file": 2, "stat": 2}
+
+
+async def test_rewritten_document_is_rendered_again():
+    store = InMemoryStorage()
+    library = Library("lib", store)
+    await library.add_document(_metadata(), _pdf("first"))
+    service = _service(library)
+    page = await service.render("act", 1)
+
+    # rewritten through another worker's library
+    await Library("lib", store).get_document("act").write_document(_pdf("changed"))
+    rewritten = await service.render("act", 1)
+
+    assert rewritten.etag != page.etag
+    assert service._executor.submitted == 2
+
+
+async def test_prerendered_pages_are_read_from_storage():
+    store = InMemoryStorage()
+    library = Library("lib", store)
+    await library.add_document(_metadata(), _pdf("first", "second", "third"))
+    assert await _service(library).prerender("act") == 3
+
+    # another worker serves the pages without rendering them
+    service = _service(Library("lib", store))
+    await asyncio.gather(*[service.render("act", page) for page in (1, 2, 3)])
+    assert service._executor.submitted == 0
+    with pytest.raises(FileNotFoundError):
+        await service.render("missing", 1)
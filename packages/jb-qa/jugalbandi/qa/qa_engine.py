@@ -8,7 +8,7 @@ from jugalbandi.speech_processor import SpeechProcessor
 from jugalbandi.translator import Translator
 from jugalbandi.audio_converter import convert_to_wav_with_ffmpeg
 from jugalbandi.core.language import Language
-from jugalbandi.core.media_format import MediaFormat
+from jugalbandi.core.media_format import MediaFormat, AudioFormat
 from jugalbandi.core.errors import IncorrectInputException
 from .query_with_gptindex import querying_with_gptindex
 from .query_with_langchain import (
@@ -41,6 +41,7 @@ class QAEngine(ABC):
         speech_query_url: str = "",
         input_language: Language = Language.EN,
         output_format: MediaFormat = MediaFormat.TEXT,
+        audio_format: AudioFormat = AudioFormat.MP3,
     ) -> QueryResponse:
         pass
 
@@ -62,6 +63,7 @@ class GPTIndexQAEngine:
         speech_query_url: str = "",
         input_language: Language = Language.EN,
         output_format: MediaFormat = MediaFormat.TEXT,
+        audio_format: AudioFormat = AudioFormat.MP3,
     ) -> QueryResponse:
         is_voice = False
         answer = ""
@@ -94,9 +96,10 @@ class GPTIndexQAEngine:
 
         if is_voice:
             audio_content = await self.speech_processor.text_to_speech(
-                answer, input_language)
+                answer, input_language, audio_format=audio_format)
             time_stamp = time.strftime("%Y%m%d-%H%M%S")
-            filename = "output_audio_files/audio-output-" + time_stamp + ".mp3"
+            filename = ("output_audio_files/audio-output-" + time_stamp + "."
+                        + audio_format.extension)
             await self.document_collection.write_audio_file(filename, audio_content)
             audio_output_url = await self.document_collection.audio_file_public_url(
                 filename)
@@ -138,6 +141,7 @@ class LangchainQAEngine:
         model_size: str = "4k",
         input_language: Language = Language.EN,
         output_format: MediaFormat = MediaFormat.TEXT,
+        audio_format: AudioFormat = AudioFormat.MP3,
     ) -> QueryResponse:
         is_voice = False
         answer = ""
@@ -172,9 +176,10 @@ class LangchainQAEngine:
 
         if is_voice:
             audio_content = await self.speech_processor.text_to_speech(
-                answer, input_language)
+                answer, input_language, audio_format=audio_format)
             time_stamp = time.strftime("%Y%m%d-%H%M%S")
-            filename = "output_audio_files/audio-output-" + time_stamp + ".mp3"
+            filename = ("output_audio_files/audio-output-" + time_stamp + "."
+                        + audio_format.extension)
             await self.document_collection.write_audio_file(filename, audio_content)
             audio_output_url = await self.document_collection.audio_file_public_url(
                 filename)
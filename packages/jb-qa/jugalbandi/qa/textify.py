@@ -20,7 +20,7 @@ def pdf_to_text_converter(pdf_file_path):
 
 
 class TextConverter:
-    async def textify(self, filename: str, doc_collection: DocumentCollection) -> str:
+    def _convert(self, filename: str, doc_collection: DocumentCollection) -> str:
         file_path = doc_collection.local_file_path(filename)
         if filename.endswith(".pdf"):
             content = pdf_to_text_converter(file_path)
@@ -34,7 +34,19 @@ class TextConverter:
         regex = r"(?<!\n\s)\n(?!\n| \n)"
         content = re.sub(regex, "", content)
 
-        content = repr(content)[1:-1]
+        return repr(content)[1:-1]
+
+    async def textify(self, filename: str, doc_collection: DocumentCollection) -> str:
+        # the same file uploaded to another collection has been converted before
+        derived = await doc_collection.read_derived(filename, "text.txt")
+        if derived is not None:
+            content = derived.decode("utf-8")
+        else:
+            content = self._convert(filename, doc_collection)
+            await doc_collection.write_derived(
+                filename, "text.txt", content.encode("utf-8")
+            )
+
         await doc_collection.write_file(filename, content, DocumentFormat.TEXT)
         await doc_collection.public_url(filename, DocumentFormat.TEXT)
         return content
@@ -1,25 +1,54 @@
+import asyncio
 import base64
 import httpx
+import io
 import os
-import tempfile
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple
 from jugalbandi.core import (
+    AudioFormat,
     Language,
     InternalServerException,
+    client_registry,
+    client_pool_size,
+    client_keepalive_timeout,
 )
-from jugalbandi.audio_converter.converter import convert_wav_bytes_to_mp3_bytes
+from jugalbandi.audio_converter import encode_wav_bytes
 from google.cloud import texttospeech, speech
 import azure.cognitiveservices.speech as speechsdk
 from abc import ABC, abstractmethod
 import json
 
 
+def _create_dhruva_client() -> httpx.AsyncClient:
+    pool_size = client_pool_size("dhruva-speech")
+    return httpx.AsyncClient(limits=httpx.Limits(max_connections=pool_size,
+                                                 max_keepalive_connections=pool_size,
+                                                 keepalive_expiry=client_keepalive_timeout()))
+
+
+client_registry.register("dhruva-speech", _create_dhruva_client,
+                         lambda client: client.aclose(),
+                         pool_size=client_pool_size("dhruva-speech"))
+client_registry.register("google-speech", speech.SpeechAsyncClient,
+                         lambda client: client.transport.close())
+client_registry.register("google-text-to-speech", texttospeech.TextToSpeechAsyncClient,
+                         lambda client: client.transport.close())
+
+
 class SpeechProcessor(ABC):
     @abstractmethod
     async def speech_to_text(self, wav_data: bytes, input_language: Language) -> str:
         pass
 
     @abstractmethod
-    async def text_to_speech(self, text: str, input_language: Language) -> bytes:
+    async def text_to_speech(
+        self,
+        text: str,
+        input_language: Language,
+        audio_format: AudioFormat = AudioFormat.MP3,
+    ) -> bytes:
         pass
 
 
@@ -74,7 +103,7 @@ class DhruvaSpeechProcessor(SpeechProcessor):
             'Content-Type': 'application/json'
         }
 
-        async with httpx.AsyncClient() as client:
+        async with client_registry.acquire("dhruva-speech") as client:
             response = await client.post(url, headers=headers, data=payload)  # type: ignore
 
         return response.json()
@@ -113,7 +142,7 @@ class DhruvaSpeechProcessor(SpeechProcessor):
             'Content-Type': 'application/json'
         }
 
-        async with httpx.AsyncClient() as client:
+        async with client_registry.acquire("dhruva-speech") as client:
             response = await client.post(url=self.bhashini_inference_url,
                                          headers=headers,
                                          data=payload)  # type: ignore
@@ -127,6 +156,7 @@ class DhruvaSpeechProcessor(SpeechProcessor):
     async def text_to_speech(self,
                              text: str,
                              input_language: Language,
+                             audio_format: AudioFormat = AudioFormat.MP3,
                              gender='female') -> bytes:
         bhashini_tts_config = await self.perform_bhashini_config_call(
             task='tts', source_language=input_language.name.lower())
@@ -161,7 +191,7 @@ class DhruvaSpeechProcessor(SpeechProcessor):
             'Content-Type': 'application/json'
         }
 
-        async with httpx.AsyncClient() as client:
+        async with client_registry.acquire("dhruva-speech") as client:
             response = await client.post(url=self.bhashini_inference_url,
                                          headers=headers,
                                          data=payload)  # type: ignore
@@ -172,8 +202,7 @@ class DhruvaSpeechProcessor(SpeechProcessor):
 
         audio_content = response.json()['pipelineResponse'][0]['audio'][0]['audioContent']
         audio_content = base64.b64decode(audio_content)
-        new_audio_content = convert_wav_bytes_to_mp3_bytes(audio_content)
-        return new_audio_content
+        return await encode_wav_bytes(audio_content, audio_format)
 
 
 class GoogleSpeechProcessor(SpeechProcessor):
@@ -204,37 +233,46 @@ class GoogleSpeechProcessor(SpeechProcessor):
             "ES" : "es-ES",
             "TR" : "tr-TR"
         }
+        self.audio_configs = {
+            AudioFormat.MP3: {"audio_encoding": texttospeech.AudioEncoding.MP3},
+            AudioFormat.MP3_LOW_BITRATE: {"audio_encoding": texttospeech.AudioEncoding.MP3,
+                                          "sample_rate_hertz": 16000},
+            AudioFormat.OGG_OPUS: {"audio_encoding": texttospeech.AudioEncoding.OGG_OPUS},
+        }
 
     async def speech_to_text(self, wav_data: bytes, input_language: Language) -> str:
         language_code = self.language_dict[input_language.name]
         if isinstance(language_code, list):
             language_code = language_code[0]
-        client = speech.SpeechAsyncClient()
         audio = speech.RecognitionAudio(content=wav_data)
         config = speech.RecognitionConfig(
             encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
             sample_rate_hertz=16000,
             language_code=language_code,
         )
-        response = await client.recognize(config=config, audio=audio)
+        async with client_registry.acquire("google-speech") as client:
+            response = await client.recognize(config=config, audio=audio)
         return response.results[0].alternatives[0].transcript
 
-    async def text_to_speech(self, text: str, input_language: Language) -> bytes:
+    async def text_to_speech(
+        self,
+        text: str,
+        input_language: Language,
+        audio_format: AudioFormat = AudioFormat.MP3,
+    ) -> bytes:
         language_code = self.language_dict[input_language.name]
         if isinstance(language_code, list):
             language_code = language_code[1]
-        client = texttospeech.TextToSpeechAsyncClient()
         input_text = texttospeech.SynthesisInput(text=text)
         voice = texttospeech.VoiceSelectionParams(
             language_code=language_code,
             ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
         )
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3
-        )
-        response = await client.synthesize_speech(
-            request={"input": input_text, "voice": voice, "audio_config": audio_config}
-        )
+        audio_config = texttospeech.AudioConfig(**self.audio_configs[audio_format])
+        async with client_registry.acquire("google-text-to-speech") as client:
+            response = await client.synthesize_speech(
+                request={"input": input_text, "voice": voice, "audio_config": audio_config}
+            )
         audio_content = response.audio_content
         return audio_content
 
@@ -267,33 +305,87 @@ class AzureSpeechProcessor(SpeechProcessor):
             "ES" : ["es-ES", "	es-ES-ElviraNeural"],
             "TR" : ["tr-TR", "tr-TR-EmelNeural"]
         }
-        self.speech_config = speechsdk.SpeechConfig(subscription=os.getenv('AZURE_SPEECH_KEY'),
-                                                    region=os.getenv('AZURE_SPEECH_REGION'))
+        self.output_formats = {
+            AudioFormat.MP3: speechsdk.SpeechSynthesisOutputFormat.Audio24Khz48KBitRateMonoMp3,
+            AudioFormat.MP3_LOW_BITRATE:
+                speechsdk.SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3,
+            AudioFormat.OGG_OPUS: speechsdk.SpeechSynthesisOutputFormat.Ogg24Khz16BitMonoOpus,
+        }
+        self.speech_key = os.getenv('AZURE_SPEECH_KEY')
+        self.speech_region = os.getenv('AZURE_SPEECH_REGION')
+        self.speech_config = speechsdk.SpeechConfig(subscription=self.speech_key,
+                                                    region=self.speech_region)
+        # SpeechConfig is mutable (voice name and output format live on it), so
+        # synthesis uses one config per voice and format, created once and
+        # shared by all requests.
+        self._voice_configs: Dict[Tuple[str, AudioFormat], speechsdk.SpeechConfig] = {}
+        # The SDK only offers blocking futures, they are resolved on a bounded
+        # pool so that concurrent requests do not block the event loop.
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('AZURE_SPEECH_MAX_WORKERS', '16')),
+            thread_name_prefix="azure-speech",
+        )
+
+    async def _resolve(self, result_future: speechsdk.ResultFuture):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, result_future.get)
+
+    def _voice_config(self, voice_name: str,
+                      audio_format: AudioFormat) -> speechsdk.SpeechConfig:
+        speech_config = self._voice_configs.get((voice_name, audio_format))
+        if speech_config is None:
+            speech_config = speechsdk.SpeechConfig(subscription=self.speech_key,
+                                                   region=self.speech_region)
+            speech_config.speech_synthesis_voice_name = voice_name
+            speech_config.set_speech_synthesis_output_format(self.output_formats[audio_format])
+            self._voice_configs[(voice_name, audio_format)] = speech_config
+        return speech_config
+
+    @staticmethod
+    def _audio_input_config(wav_data: bytes) -> speechsdk.audio.AudioConfig:
+        with wave.open(io.BytesIO(wav_data), "rb") as wav_file:
+            stream_format = speechsdk.audio.AudioStreamFormat(
+                samples_per_second=wav_file.getframerate(),
+                bits_per_sample=wav_file.getsampwidth() * 8,
+                channels=wav_file.getnchannels(),
+            )
+            frames = wav_file.readframes(wav_file.getnframes())
+        stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+        stream.write(frames)
+        stream.close()
+        return speechsdk.audio.AudioConfig(stream=stream)
 
     async def speech_to_text(self, wav_data: bytes, input_language: Language) -> str:
         language_code = self.language_dict[input_language.name][0]
-        temp_wav_file = tempfile.NamedTemporaryFile()
-        temp_wav_file.write(wav_data)
-        audio_config = speechsdk.AudioConfig(filename=temp_wav_file.name)
-        speech_recognizer = speechsdk.SpeechRecognizer(speech_config=self.speech_config,
-                                                       audio_config=audio_config,
-                                                       language=language_code)
-        result = speech_recognizer.recognize_once_async().get()
-        if temp_wav_file:
-            temp_wav_file.close()
+        speech_recognizer = speechsdk.SpeechRecognizer(
+            speech_config=self.speech_config,
+            audio_config=self._audio_input_config(wav_data),
+            language=language_code,
+        )
+        result = await self._resolve(speech_recognizer.recognize_once_async())
+        if result.reason == speechsdk.ResultReason.Canceled:
+            raise InternalServerException(
+                f"Azure speech to text failed: {result.cancellation_details.error_details}")
 
         return result.text
 
-    async def text_to_speech(self, text: str, input_language: Language) -> bytes:
+    async def text_to_speech(
+        self,
+        text: str,
+        input_language: Language,
+        audio_format: AudioFormat = AudioFormat.MP3,
+    ) -> bytes:
         voice_language_code = self.language_dict[input_language.name][1]
-        temp_output_file = tempfile.NamedTemporaryFile()
-        audio_config = speechsdk.audio.AudioOutputConfig(filename=temp_output_file.name)
-        self.speech_config.speech_synthesis_voice_name = voice_language_code
-        speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=self.speech_config,
-                                                         audio_config=audio_config)
-        speech_synthesis_result = speech_synthesizer.speak_text_async(text).get()
-        if temp_output_file:
-            temp_output_file.close()
+        # audio_config=None keeps the synthesized audio in memory (result.audio_data)
+        speech_synthesizer = speechsdk.SpeechSynthesizer(
+            speech_config=self._voice_config(voice_language_code, audio_format),
+            audio_config=None,
+        )
+        speech_synthesis_result = await self._resolve(speech_synthesizer.speak_text_async(text))
+        if speech_synthesis_result.reason == speechsdk.ResultReason.Canceled:
+            raise InternalServerException(
+                "Azure text to speech failed: "
+                f"{speech_synthesis_result.cancellation_details.error_details}")
 
         return speech_synthesis_result.audio_data
 
@@ -322,7 +414,12 @@ class CompositeSpeechProcessor(SpeechProcessor):
 
         raise ExceptionGroup("CompositeSpeechProcessor speech to text failed", excs)
 
-    async def text_to_speech(self, text: str, input_language: Language) -> bytes:
+    async def text_to_speech(
+        self,
+        text: str,
+        input_language: Language,
+        audio_format: AudioFormat = AudioFormat.MP3,
+    ) -> bytes:
         excs = []
         for speech_processor in self.speech_processors:
             try:
@@ -333,7 +430,8 @@ class CompositeSpeechProcessor(SpeechProcessor):
                       isinstance(speech_processor, AzureSpeechProcessor)):
                     pass
                 else:
-                    return await speech_processor.text_to_speech(text, input_language)
+                    return await speech_processor.text_to_speech(
+                        text, input_language, audio_format=audio_format)
             except Exception as exc:
                 excs.append(exc)
 
@@ -1,5 +1,72 @@
-from .storage import Storage, NullStorage, LocalStorage
+from .storage import (
+    BULK_CONCURRENCY,
+    BulkOperationResult,
+    PreconditionFailedError,
+    Storage,
+    StorageEntry,
+    StorageReader,
+    StorageWrapper,
+    StorageWriter,
+    TransferConfig,
+    NullStorage,
+    LocalStorage,
+    bulk_apply,
+)
 from .google_storage import GoogleStorage
 from .azure_storage import AzureStorage
+from .caching_storage import (
+    CacheStats,
+    CachingStorage,
+    DiskCache,
+    caching_storage_from_env,
+)
+from .compressed_storage import (
+    CompressedStorage,
+    CompressionConfig,
+    CompressionStats,
+    compressed_storage_from_env,
+)
+from .memory_storage import InMemoryStorage, MemoryBucket
+from .simulated_storage import (
+    InjectedFaultError,
+    SimulatedStorage,
+    SimulationProfile,
+    SimulationStats,
+)
+from .content_addressed_storage import (
+    ContentAddressedStorage,
+    content_addressed_storage_from_env,
+)
 
-__all__ = ["Storage", "NullStorage", "LocalStorage", "GoogleStorage", "AzureStorage"]
+__all__ = [
+    "BULK_CONCURRENCY",
+    "BulkOperationResult",
+    "PreconditionFailedError",
+    "Storage",
+    "StorageEntry",
+    "StorageReader",
+    "StorageWrapper",
+    "StorageWriter",
+    "TransferConfig",
+    "NullStorage",
+    "LocalStorage",
+    "bulk_apply",
+    "GoogleStorage",
+    "AzureStorage",
+    "CacheStats",
+    "CachingStorage",
+    "DiskCache",
+    "caching_storage_from_env",
+    "InMemoryStorage",
+    "MemoryBucket",
+    "InjectedFaultError",
+    "SimulatedStorage",
+    "SimulationProfile",
+    "SimulationStats",
+    "CompressedStorage",
+    "CompressionConfig",
+    "CompressionStats",
+    "compressed_storage_from_env",
+    "ContentAddressedStorage",
+    "content_addressed_storage_from_env",
+]
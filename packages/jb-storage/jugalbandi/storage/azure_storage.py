@@ -1,10 +1,38 @@
-from typing import AsyncIterator
+from typing import AsyncIterator, List, Optional, Tuple
+import asyncio
+import base64
 import os
 import logging
+import uuid
 from azure.storage.blob.aio import BlobServiceClient
-from azure.core.exceptions import ResourceNotFoundError
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    AzureError,
+    HttpResponseError,
+    ResourceExistsError,
+    ResourceModifiedError,
+    ResourceNotFoundError,
+)
 from azure.identity.aio import DefaultAzureCredential
-from .storage import Storage
+from azure.storage.blob import BlobBlock, BlobProperties
+from .storage import (
+    BULK_CONCURRENCY,
+    STREAM_CHUNK_SIZE,
+    BulkOperationResult,
+    EmptyRangeReader,
+    PreconditionFailedError,
+    ReadTarget,
+    Storage,
+    StorageEntry,
+    StorageReader,
+    StorageWriter,
+    TransferConfig,
+    bulk_apply,
+    create_temp_file,
+    join_path,
+    remove_temp_file,
+    resolve_range,
+)
 from tenacity import (
     retry,
     wait_random_exponential,
@@ -16,17 +44,177 @@ from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# blob batch requests carry at most 256 sub-requests
+MAX_BATCH_DELETES = 256
+
+# Azure returns a transactional MD5 (validate_content) only for ranges up to 4 MiB
+MAX_VALIDATED_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class _BufferStream:
+    """Minimal seekable stream over a preallocated buffer for
+    download_blob().readinto."""
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer)
+        self.position = 0
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            self.position = offset
+        elif whence == os.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = len(self.view) + offset
+        return self.position
+
+    def write(self, data) -> int:
+        self.view[self.position:self.position + len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class AzureBlobReader(StorageReader):
+    def __init__(self, downloader, size: int, start: int, end: int):
+        super().__init__(size, start, end)
+        self._downloader = downloader
+
+    async def _read_chunk(self) -> bytes:
+        return await self._downloader.read(STREAM_CHUNK_SIZE)
+
+
+class AzureBlobWriter(StorageWriter):
+    """Stages the content as blocks and commits the block list on close.
+    Content smaller than one block is uploaded in a single request."""
+
+    def __init__(self, blob_client, transfer_config: TransferConfig):
+        super().__init__()
+        self.blob_client = blob_client
+        self.block_size = transfer_config.part_size
+        self._buffer = bytearray()
+        self._blocks: List[BlobBlock] = []
+        # block ids of one blob must have the same length
+        self._block_prefix = uuid.uuid4().hex
+
+    async def _write(self, data: bytes):
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            await self._stage_block(self.block_size)
+
+    async def _stage_block(self, length: int):
+        block_id = base64.b64encode(
+            f"{self._block_prefix}-{len(self._blocks):06d}".encode("ascii")
+        ).decode("ascii")
+        await self.blob_client.stage_block(
+            block_id, bytes(self._buffer[:length]), validate_content=True
+        )
+        self._blocks.append(BlobBlock(block_id=block_id))
+        del self._buffer[:length]
+
+    async def close(self):
+        if len(self._blocks) == 0:
+            await self.blob_client.upload_blob(
+                bytes(self._buffer), overwrite=True, validate_content=True
+            )
+        else:
+            if len(self._buffer) > 0:
+                await self._stage_block(len(self._buffer))
+            await self.blob_client.commit_block_list(self._blocks)
+        self._buffer.clear()
+
+    async def abort(self):
+        # uncommitted blocks are garbage collected by Azure
+        self._buffer.clear()
+        self._blocks = []
+
+
 class AzureStorage(Storage):
-    def __init__(self, account_url: str, container_name: str, base_path: str):
+    def __init__(
+        self,
+        account_url: str,
+        container_name: str,
+        base_path: str,
+        transfer_config: Optional[TransferConfig] = None,
+    ):
         self.account_url = account_url
         self.container_name = container_name
         self.base_path = base_path
-        self.client = BlobServiceClient(account_url=self.account_url, credential=DefaultAzureCredential())
+        self.transfer_config = transfer_config or TransferConfig.from_env()
+        # blobs above the thresholds are moved in parallel blocks/ranges by the SDK
+        self.client = BlobServiceClient(
+            account_url=self.account_url,
+            credential=DefaultAzureCredential(),
+            max_single_put_size=self.transfer_config.threshold,
+            max_block_size=self.transfer_config.part_size,
+            max_single_get_size=self.transfer_config.threshold,
+            max_chunk_get_size=min(
+                self.transfer_config.part_size, MAX_VALIDATED_CHUNK_SIZE
+            ),
+        )
 
     async def write_file(self, file_path: str, content: bytes):
-        blob_name = f"{self.base_path}{file_path}"
+        blob_name = self._relative_path(file_path)
+        blob_client = self.client.get_blob_client(self.container_name, blob_name)
+        await blob_client.upload_blob(
+            content,
+            overwrite=True,
+            max_concurrency=self.transfer_config.max_concurrency,
+            validate_content=True,
+        )
+
+    async def write_file_if_match(
+        self, file_path: str, content: bytes, etag: Optional[str]
+    ) -> Optional[str]:
+        blob_name = self._relative_path(file_path)
+        blob_client = self.client.get_blob_client(self.container_name, blob_name)
+        try:
+            if etag is None:
+                result = await blob_client.upload_blob(content, overwrite=False)
+            else:
+                result = await blob_client.upload_blob(
+                    content,
+                    overwrite=True,
+                    etag=etag,
+                    match_condition=MatchConditions.IfNotModified,
+                )
+        except (ResourceExistsError, ResourceModifiedError):
+            raise PreconditionFailedError(f"{file_path} is not at version {etag}")
+        return result["etag"]
+
+    async def read_into(self, file_path: str, target: ReadTarget) -> int:
+        blob_name = self._relative_path(file_path)
         blob_client = self.client.get_blob_client(self.container_name, blob_name)
-        await blob_client.upload_blob(content, overwrite=True)
+        try:
+            downloader = await blob_client.download_blob(
+                max_concurrency=self.transfer_config.max_concurrency,
+                validate_content=True,
+            )
+        except ResourceNotFoundError:
+            raise FileNotFoundError(f"file {file_path} not found")
+
+        if not isinstance(target, str):
+            if len(memoryview(target)) < downloader.size:
+                raise ValueError(
+                    f"buffer of {len(memoryview(target))} bytes is too small "
+                    f"for {file_path} ({downloader.size} bytes)"
+                )
+            return await downloader.readinto(_BufferStream(target))
+
+        fd, temp_path = create_temp_file(target)
+        try:
+            with open(fd, "wb") as f:
+                size = await downloader.readinto(f)
+            os.replace(temp_path, target)
+        except BaseException:
+            await remove_temp_file(temp_path)
+            raise
+        return size
 
     @retry(
         wait=wait_random_exponential(multiplier=1, max=60),
@@ -34,14 +222,67 @@ class AzureStorage(Storage):
     )
     
     async def read_file(self, file_path: str) -> bytes:
-        blob_name = f"{self.base_path}/{file_path}"
+        blob_name = self._relative_path(file_path)
         blob_client = self.client.get_blob_client(self.container_name, blob_name)
         try:
-            download_stream = await blob_client.download_blob()
+            download_stream = await blob_client.download_blob(
+                max_concurrency=self.transfer_config.max_concurrency,
+                validate_content=True,
+            )
             return await download_stream.readall()
         except ResourceNotFoundError:
             raise FileNotFoundError(f"file {file_path} not found")
 
+    async def read_file_versioned(self, file_path: str) -> Tuple[bytes, Optional[str]]:
+        # the ETag comes with the content, one request
+        blob_name = self._relative_path(file_path)
+        blob_client = self.client.get_blob_client(self.container_name, blob_name)
+        try:
+            download_stream = await blob_client.download_blob(
+                max_concurrency=self.transfer_config.max_concurrency,
+                validate_content=True,
+            )
+            return await download_stream.readall(), download_stream.properties.etag
+        except ResourceNotFoundError:
+            raise FileNotFoundError(f"file {file_path} not found")
+
+    async def open_read(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> StorageReader:
+        if start < 0 or (end is not None and end < start):
+            raise ValueError(f"invalid byte range {start}-{end}")
+        blob_name = self._relative_path(file_path)
+        blob_client = self.client.get_blob_client(self.container_name, blob_name)
+        if end == start:
+            size = (await self.stat(file_path)).size or 0
+            start, end = resolve_range(size, start, end)
+            return EmptyRangeReader(size, start)
+        try:
+            downloader = await blob_client.download_blob(
+                offset=start if start > 0 or end is not None else None,
+                length=None if end is None else end - start,
+            )
+        except ResourceNotFoundError:
+            raise FileNotFoundError(f"file {file_path} not found")
+        except HttpResponseError as e:
+            if e.status_code == 416:
+                raise ValueError(
+                    f"byte range {start}-{end} not satisfiable for {file_path}"
+                )
+            raise
+        size = downloader.properties.size
+        content_range = downloader.properties.content_range
+        if content_range:
+            size = int(content_range.rsplit("/", 1)[1])
+        return AzureBlobReader(downloader, size, start, start + downloader.size)
+
+    async def open_write(self, file_path: str) -> StorageWriter:
+        blob_name = self._relative_path(file_path)
+        return AzureBlobWriter(
+            self.client.get_blob_client(self.container_name, blob_name),
+            self.transfer_config,
+        )
+
     def path(self, path_suffix: str):
         return f"azure://{self.container_name}/{self._relative_path(path_suffix)}"
 
@@ -51,20 +292,126 @@ class AzureStorage(Storage):
         async for blob in blob_list:
             yield blob.name[len(prefix):]
 
+    async def list_entries(
+        self, folder_path: str, recursive: bool = True
+    ) -> AsyncIterator[StorageEntry]:
+        prefix = f"{self._relative_path(folder_path)}/"
+        container_client = self.client.get_container_client(self.container_name)
+        if recursive:
+            blobs = container_client.list_blobs(name_starts_with=prefix)
+        else:
+            blobs = container_client.walk_blobs(name_starts_with=prefix, delimiter="/")
+        async for blob in blobs:
+            # walk_blobs also yields the sub folders (BlobPrefix)
+            if not isinstance(blob, BlobProperties):
+                continue
+            yield StorageEntry(
+                name=blob.name[len(prefix):],
+                size=blob.size,
+                etag=blob.etag,
+                updated=blob.last_modified,
+            )
+
     async def file_exists(self, file_path: str) -> bool:
-        blob_name = f"{self.base_path}/{file_path}"
+        blob_name = self._relative_path(file_path)
         blob_client = self.client.get_blob_client(self.container_name, blob_name)
         return await blob_client.exists()
 
+    async def stat(self, file_path: str) -> StorageEntry:
+        blob_name = self._relative_path(file_path)
+        blob_client = self.client.get_blob_client(self.container_name, blob_name)
+        try:
+            properties = await blob_client.get_blob_properties()
+        except ResourceNotFoundError:
+            raise FileNotFoundError(f"file {file_path} not found")
+        return StorageEntry(
+            name=file_path,
+            size=properties.size,
+            etag=properties.etag,
+            updated=properties.last_modified,
+        )
+
     def new_store(self, folder_suffix: str) -> "AzureStorage":
         folder_path = self._relative_path(folder_suffix)
-        return AzureStorage(self.connection_string, self.container_name, folder_path)
+        return AzureStorage(self.account_url, self.container_name, folder_path,
+                            self.transfer_config)
 
     async def remove_file(self, file_path: str):
         full_file_path = self._relative_path(file_path)
         blob_client = self.client.get_blob_client(self.container_name, full_file_path)
         await blob_client.delete_blob()
 
+    def _store_path(self, blob_name: str) -> str:
+        if self.base_path:
+            return blob_name[len(self.base_path) + 1:]
+        return blob_name
+
+    async def delete_prefix(self, folder_path: str) -> BulkOperationResult:
+        prefix = f"{self._relative_path(folder_path)}/"
+        container_client = self.client.get_container_client(self.container_name)
+        result = BulkOperationResult()
+        semaphore = asyncio.Semaphore(max(1, BULK_CONCURRENCY // 8))
+
+        async def _delete(blob_names: List[str]):
+            try:
+                responses = [
+                    response async for response in await container_client.delete_blobs(
+                        *blob_names, raise_on_any_failure=False
+                    )
+                ]
+                errors = [
+                    None if response.status_code in (200, 202, 404)
+                    else f"delete failed with status {response.status_code}"
+                    for response in responses
+                ]
+            except AzureError as e:
+                errors = [str(e)] * len(blob_names)
+            finally:
+                semaphore.release()
+            # a blob that is already gone (404) counts as deleted
+            for blob_name, error in zip(blob_names, errors):
+                if error is None:
+                    result.processed.append(self._store_path(blob_name))
+                else:
+                    result.failures[self._store_path(blob_name)] = error
+
+        async with asyncio.TaskGroup() as task_group:
+            batch: List[str] = []
+            async for blob in container_client.list_blobs(name_starts_with=prefix):
+                batch.append(blob.name)
+                if len(batch) == MAX_BATCH_DELETES:
+                    await semaphore.acquire()
+                    task_group.create_task(_delete(batch))
+                    batch = []
+            if batch:
+                await semaphore.acquire()
+                task_group.create_task(_delete(batch))
+        return result
+
+    async def copy_prefix(
+        self, folder_path: str, target_folder_path: str
+    ) -> BulkOperationResult:
+        prefix = f"{self._relative_path(folder_path)}/"
+        container_client = self.client.get_container_client(self.container_name)
+
+        async def _file_paths() -> AsyncIterator[str]:
+            async for blob in container_client.list_blobs(name_starts_with=prefix):
+                yield self._store_path(blob.name)
+
+        async def _copy(file_path: str):
+            source_blob_client = self.client.get_blob_client(
+                self.container_name, self._relative_path(file_path)
+            )
+            relative_path = file_path[len(folder_path):].lstrip("/")
+            target_blob_client = self.client.get_blob_client(
+                self.container_name,
+                self._relative_path(join_path(target_folder_path, relative_path)),
+            )
+            # server side copy, completes asynchronously for large blobs
+            await target_blob_client.start_copy_from_url(source_blob_client.url)
+
+        return await bulk_apply(_file_paths(), _copy)
+
     async def list_all_files(self, folder_path: str):
         prefix = f"{self._relative_path(folder_path)}/"
         blob_list = self.client.get_container_client(self.container_name).list_blobs(name_starts_with=prefix)
@@ -72,7 +419,7 @@ class AzureStorage(Storage):
             yield blob.name[len(prefix):]
 
     async def make_public(self, file_path: str) -> str:
-        blob_name = f"{self.base_path}/{file_path}"
+        blob_name = self._relative_path(file_path)
         blob_client = self.client.get_blob_client(self.container_name, blob_name)
         # #print ("\n" + str(self.client.get_user_delegation_key(datetime.utcnow(), datetime.utcnow() + timedelta(days=365))) + "\n")
         # sas_token = generate_blob_sas(
@@ -89,7 +436,7 @@ class AzureStorage(Storage):
         return f"{blob_client.url}"
     
     async def public_url(self, file_path: str) -> str:
-        blob_name = f"{self.base_path}/{file_path}"
+        blob_name = self._relative_path(file_path)
         blob_client = self.client.get_blob_client(self.container_name, blob_name)
 
         sas_token = generate_blob_sas(
@@ -104,7 +451,7 @@ class AzureStorage(Storage):
         return f"{blob_client.url}?{sas_token}"
 
     async def copy_file(self, file_path: str, target_container: str, target_file_path: str):
-        source_blob = f"{self.base_path}/{file_path}"
+        source_blob = self._relative_path(file_path)
         source_blob_client = self.client.get_blob_client(self.container_name, source_blob)
         target_blob_client = self.client.get_blob_client(target_container, target_file_path)
         copy_source_url = source_blob_client.url
@@ -0,0 +1,375 @@
+import asyncio
+import glob
+import hashlib
+import logging
+import os
+import time
+import uuid
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import aiofiles
+from aiofiles import os as aiofiles_os
+from cachetools import TTLCache
+from .storage import (
+    BulkOperationResult,
+    ReadTarget,
+    Storage,
+    StorageWrapper,
+    StorageWriter,
+    join_path,
+    write_into_target,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    # cached copies dropped because the remote object changed
+    stale: int = 0
+    evictions: int = 0
+    bytes_from_cache: int = 0
+    bytes_from_remote: int = 0
+    size_bytes: int = 0
+    entries: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+# temporary files older than this are left behind by an interrupted write,
+# younger ones may still be written by another process
+TEMP_FILE_GRACE_SECONDS = 3600
+# remote validations remembered per process, for at most an hour
+VALIDATED_ENTRIES = 65536
+VALIDATED_SECONDS = 3600
+
+
+class DiskCache:
+    """Size-bounded LRU of file contents in a local directory.
+
+    Each entry is a single file named ``<key hash>-<etag hash>``, written to a
+    temporary file and renamed into place, so readers never see partial
+    content. One DiskCache is meant to be shared by all CachingStorage
+    objects of a process, and the directory by all the processes of a host:
+    the size and recency of the entries are taken from the directory (a read
+    touches the entry's mtime), so every process evicts by the same total.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # key -> (time of last remote validation, etag)
+        self._validated: TTLCache = TTLCache(
+            maxsize=VALIDATED_ENTRIES, ttl=VALIDATED_SECONDS
+        )
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats = CacheStats()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._remove_stale_temp_files()
+
+    def _remove_stale_temp_files(self):
+        expired = time.time() - TEMP_FILE_GRACE_SECONDS
+        with os.scandir(self.cache_dir) as dir_iterator:
+            for entry in dir_iterator:
+                if not entry.name.endswith(".tmp"):
+                    continue
+                with suppress(FileNotFoundError):
+                    if entry.stat().st_mtime < expired:
+                        os.remove(entry.path)
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """(mtime, path, size) of the entries in the directory."""
+        files = []
+        with os.scandir(self.cache_dir) as dir_iterator:
+            for entry in dir_iterator:
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat_result = entry.stat()
+                except FileNotFoundError:
+                    # evicted by another process
+                    continue
+                files.append((stat_result.st_mtime, entry.path, stat_result.st_size))
+        return files
+
+    def _versions(self, key: str) -> List[str]:
+        return [
+            file_path
+            for file_path in glob.glob(os.path.join(self.cache_dir, f"{key}-*"))
+            if not file_path.endswith(".tmp")
+        ]
+
+    def _file_path(self, key: str, etag_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}-{etag_hash}")
+
+    @staticmethod
+    def key(remote_path: str) -> str:
+        return _hash(remote_path)
+
+    def validated_etag(self, key: str, max_age: float) -> Optional[str]:
+        validated = self._validated.get(key)
+        if validated is None or time.monotonic() - validated[0] > max_age:
+            return None
+        return validated[1]
+
+    def mark_validated(self, key: str, etag: str):
+        self._validated[key] = (time.monotonic(), etag)
+
+    async def read(self, key: str, etag: str) -> Optional[bytes]:
+        content = await self._read(key, etag)
+        if content is None:
+            self._stats.misses += 1
+        else:
+            self._stats.hits += 1
+            self._stats.bytes_from_cache += len(content)
+        return content
+
+    async def _read(self, key: str, etag: str) -> Optional[bytes]:
+        file_path = self._file_path(key, _hash(etag))
+        try:
+            async with aiofiles.open(file_path, "rb") as f:
+                content = await f.read()
+        except FileNotFoundError:
+            # not cached, or evicted by another process
+            return None
+        with suppress(FileNotFoundError):
+            # most recently used, for the eviction of every process
+            await asyncio.to_thread(os.utime, file_path)
+        return content
+
+    def record_download(self, size: int):
+        self._stats.bytes_from_remote += size
+
+    async def put(self, key: str, etag: str, content: bytes):
+        if len(content) > self.max_bytes:
+            return
+        file_path = self._file_path(key, _hash(etag))
+        temp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(temp_path, "wb") as f:
+            await f.write(content)
+        await aiofiles_os.replace(temp_path, file_path)
+        # copies of previous versions of the file
+        stale = await self._remove(key, keep=file_path)
+        self._stats.stale += stale
+        await self._evict()
+
+    async def invalidate(self, key: str):
+        self._validated.pop(key, None)
+        await self._remove(key)
+
+    async def _remove(self, key: str, keep: Optional[str] = None) -> int:
+        def _remove_versions() -> int:
+            removed = 0
+            for file_path in self._versions(key):
+                if file_path == keep:
+                    continue
+                with suppress(FileNotFoundError):
+                    os.remove(file_path)
+                    removed += 1
+            return removed
+
+        return await asyncio.to_thread(_remove_versions)
+
+    async def _evict(self):
+        def _evict_lru() -> int:
+            files = self._scan()
+            size = sum(file_size for _, _, file_size in files)
+            evicted = 0
+            for _, file_path, file_size in sorted(files):
+                if size <= self.max_bytes:
+                    break
+                with suppress(FileNotFoundError):
+                    os.remove(file_path)
+                    evicted += 1
+                size -= file_size
+            return evicted
+
+        self._stats.evictions += await asyncio.to_thread(_evict_lru)
+
+    async def single_flight(self, key: str, factory):
+        """Run factory() once for concurrent callers asking for the same key."""
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def stats(self) -> CacheStats:
+        files = self._scan()
+        return CacheStats(
+            hits=self._stats.hits,
+            misses=self._stats.misses,
+            stale=self._stats.stale,
+            evictions=self._stats.evictions,
+            bytes_from_cache=self._stats.bytes_from_cache,
+            bytes_from_remote=self._stats.bytes_from_remote,
+            size_bytes=sum(file_size for _, _, file_size in files),
+            entries=len(files),
+        )
+
+
+class CachingStorage(StorageWrapper):
+    """Read-through cache of a (remote) store on local disk.
+
+    Reads are served from the DiskCache when the cached copy has the same
+    etag as the remote object. The remote etag is looked up at most every
+    ``revalidate_after`` seconds per file. Writes go to the remote store and
+    drop the cached copy. Streamed reads (open_read) go to the remote store.
+    """
+
+    def __init__(
+        self, store: Storage, cache: DiskCache, revalidate_after: float = 30.0
+    ):
+        super().__init__(store)
+        self.cache = cache
+        self.revalidate_after = revalidate_after
+
+    async def read_file(self, file_path: str) -> bytes:
+        key = self.cache.key(self.store.path(file_path))
+        etag = self.cache.validated_etag(key, self.revalidate_after)
+        if etag is None:
+            etag = (await self.store.stat(file_path)).etag
+            if etag is None:
+                # nothing to validate a cached copy against
+                return await self.store.read_file(file_path)
+            self.cache.mark_validated(key, etag)
+
+        content = await self.cache.read(key, etag)
+        if content is not None:
+            return content
+        return await self.cache.single_flight(
+            key, lambda: self._download(file_path, key, etag)
+        )
+
+    async def _download(self, file_path: str, key: str, etag: str) -> bytes:
+        content = await self.store.read_file(file_path)
+        self.cache.record_download(len(content))
+        try:
+            await self.cache.put(key, etag, content)
+        except OSError:
+            logger.exception("Caching %s failed", file_path)
+        return content
+
+    async def read_into(self, file_path: str, target: ReadTarget) -> int:
+        """Served from a valid cached copy, otherwise downloaded by the wrapped
+        store (in ranges, streamed to disk) without caching it: the files read
+        into a target are the large ones."""
+        key = self.cache.key(self.store.path(file_path))
+        etag = self.cache.validated_etag(key, self.revalidate_after)
+        if etag is None:
+            entry = await self.store.stat(file_path)
+            if entry.etag is None:
+                return await self.store.read_into(file_path, target)
+            etag = entry.etag
+            self.cache.mark_validated(key, etag)
+            if entry.size is not None and entry.size > self.cache.max_bytes:
+                return await self.store.read_into(file_path, target)
+
+        content = await self.cache.read(key, etag)
+        if content is not None:
+            return await write_into_target(target, content)
+        size = await self.store.read_into(file_path, target)
+        self.cache.record_download(size)
+        return size
+
+    async def write_file(self, file_path: str, file_content: bytes):
+        await self.store.write_file(file_path, file_content)
+        await self.cache.invalidate(self.cache.key(self.store.path(file_path)))
+
+    # read_file_versioned goes to the wrapped store: the version of a cached
+    # copy may be up to revalidate_after seconds old
+
+    async def write_file_if_match(
+        self, file_path: str, file_content: bytes, etag: Optional[str]
+    ) -> Optional[str]:
+        try:
+            return await self.store.write_file_if_match(file_path, file_content, etag)
+        finally:
+            await self.cache.invalidate(self.cache.key(self.store.path(file_path)))
+
+    async def open_write(self, file_path: str) -> StorageWriter:
+        return _InvalidatingWriter(
+            await self.store.open_write(file_path),
+            self.cache,
+            self.cache.key(self.store.path(file_path)),
+        )
+
+    async def remove_file(self, file_path: str):
+        try:
+            await super().remove_file(file_path)
+        finally:
+            await self.cache.invalidate(self.cache.key(self.store.path(file_path)))
+
+    async def delete_prefix(self, folder_path: str) -> BulkOperationResult:
+        result = await self.store.delete_prefix(folder_path)
+        for file_path in result.processed:
+            await self.cache.invalidate(self.cache.key(self.store.path(file_path)))
+        return result
+
+    async def copy_prefix(
+        self, folder_path: str, target_folder_path: str
+    ) -> BulkOperationResult:
+        result = await self.store.copy_prefix(folder_path, target_folder_path)
+        for file_path in result.processed:
+            target_path = join_path(
+                target_folder_path, file_path[len(folder_path):].lstrip("/")
+            )
+            await self.cache.invalidate(self.cache.key(self.store.path(target_path)))
+        return result
+
+    def new_store(self, folder_suffix: str) -> "CachingStorage":
+        return CachingStorage(
+            self.store.new_store(folder_suffix), self.cache, self.revalidate_after
+        )
+
+    def stats(self) -> CacheStats:
+        return self.cache.stats()
+
+
+class _InvalidatingWriter(StorageWriter):
+    def __init__(self, writer: StorageWriter, cache: DiskCache, key: str):
+        super().__init__()
+        self.writer = writer
+        self.cache = cache
+        self.key = key
+
+    async def _write(self, data: bytes):
+        await self.writer.write(data)
+
+    async def close(self):
+        await self.writer.close()
+        await self.cache.invalidate(self.key)
+
+    async def abort(self):
+        await self.writer.abort()
+
+
+_disk_caches: Dict[str, DiskCache] = {}
+
+
+def caching_storage_from_env(store: Storage) -> Storage:
+    """Wraps store in a CachingStorage when STORAGE_CACHE_PATH is set. Stores
+    using the same path share one DiskCache."""
+    cache_dir = os.getenv("STORAGE_CACHE_PATH")
+    if not cache_dir:
+        return store
+    cache = _disk_caches.get(cache_dir)
+    if cache is None:
+        max_bytes = int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+        cache = DiskCache(cache_dir, max_bytes)
+        _disk_caches[cache_dir] = cache
+    revalidate_after = float(os.getenv("STORAGE_CACHE_REVALIDATE_SECONDS", "30"))
+    return CachingStorage(store, cache, revalidate_after)
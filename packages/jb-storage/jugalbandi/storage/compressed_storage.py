@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Set, Tuple
+import zstandard
+from .storage import (
+    BytesReader,
+    ReadTarget,
+    Storage,
+    StorageEntry,
+    StorageReader,
+    StorageWrapper,
+    StorageWriter,
+    write_into_target,
+)
+
+logger = logging.getLogger(__name__)
+
+# every zstd frame starts with these bytes. Neither UTF-8 text nor pickles can
+# start with them, so they mark a compressed object without object metadata
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# markers of the files that were made public, which are stored uncompressed
+PUBLIC_FOLDER = "__public__"
+# seconds between listings of the markers, for files made public by other
+# processes
+PUBLIC_REFRESH_SECONDS = 300.0
+
+
+@dataclass
+class CompressionConfig:
+    level: int = 3
+    # files are compressed when their name ends with one of these
+    suffixes: Tuple[str, ...] = (".txt", ".json", ".pkl")
+    # smaller files are stored as is
+    min_size: int = 256
+
+    @classmethod
+    def from_env(cls) -> "CompressionConfig":
+        suffixes = os.getenv("STORAGE_COMPRESSION_SUFFIXES")
+        return cls(
+            level=int(os.getenv("STORAGE_COMPRESSION_LEVEL", str(cls.level))),
+            suffixes=(
+                tuple(
+                    suffix.strip() for suffix in suffixes.split(",") if suffix.strip()
+                )
+                if suffixes is not None
+                else cls.suffixes
+            ),
+            min_size=int(
+                os.getenv("STORAGE_COMPRESSION_MIN_SIZE", str(cls.min_size))
+            ),
+        )
+
+    def applies_to(self, file_path: str) -> bool:
+        return file_path.endswith(self.suffixes)
+
+
+@dataclass
+class CompressionStats:
+    # bytes as seen by the callers
+    bytes_written: int = 0
+    bytes_read: int = 0
+    # bytes sent to and received from the wrapped store
+    stored_bytes_written: int = 0
+    stored_bytes_read: int = 0
+
+    @property
+    def read_ratio(self) -> float:
+        if self.bytes_read == 0:
+            return 1.0
+        return self.stored_bytes_read / self.bytes_read
+
+
+def is_compressed(content: bytes) -> bool:
+    return content[:len(ZSTD_MAGIC)] == ZSTD_MAGIC
+
+
+def _compress(content: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(content)
+
+
+def _decompress(content: bytes) -> bytes:
+    decompressor = zstandard.ZstdDecompressor()
+    if zstandard.frame_content_size(content) >= 0:
+        return decompressor.decompress(content)
+    # frames written by open_write do not carry their size
+    return decompressor.decompressobj().decompress(content)
+
+
+async def _run(function, content: bytes, *args):
+    # (de)compressing large index files would block the event loop
+    if len(content) > 1024 * 1024:
+        return await asyncio.to_thread(function, content, *args)
+    return function(content, *args)
+
+
+class _PublicMarkers:
+    """The markers under ``__public__``, listed at most every
+    PUBLIC_REFRESH_SECONDS instead of probing a marker per write."""
+
+    def __init__(self, root: Storage):
+        self.root = root
+        self._markers: Set[str] = set()
+        self._listed_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def contains(self, marker: str) -> bool:
+        if marker in self._markers:
+            return True
+        async with self._lock:
+            if (
+                self._listed_at is None
+                or time.monotonic() - self._listed_at > PUBLIC_REFRESH_SECONDS
+            ):
+                self._markers |= {
+                    f"{PUBLIC_FOLDER}/{entry.name}"
+                    async for entry in self.root.list_entries(PUBLIC_FOLDER)
+                }
+                self._listed_at = time.monotonic()
+        return marker in self._markers
+
+    def add(self, marker: str):
+        self._markers.add(marker)
+
+
+class CompressedStorage(StorageWrapper):
+    """Compresses text, JSON and pickle files with zstd when they are written
+    and decompresses them when they are read.
+
+    Stored objects are recognised as compressed by the zstd frame magic, so
+    files written before compression was enabled (or that did not get smaller)
+    remain readable as they are. ``stat`` does not read the object: it
+    reports the stored object's etag, and no size for the files it may
+    compress, whose stored size is not the size of their content.
+    Files that are made public are stored uncompressed, since they are
+    downloaded by clients that do not go through this store; a marker under
+    ``__public__`` of the root store keeps later writes of the file
+    uncompressed too, in other processes once they list the markers again.
+    """
+
+    def __init__(
+        self,
+        store: Storage,
+        config: Optional[CompressionConfig] = None,
+        root: Optional[Storage] = None,
+        public_markers: Optional[_PublicMarkers] = None,
+    ):
+        super().__init__(store)
+        self.config = config or CompressionConfig()
+        # the store holding __public__, stores created with new_store share it
+        self.root = root or store
+        self._stats = CompressionStats()
+        # files known to be public, they do not become private again
+        self._public_markers = public_markers or _PublicMarkers(self.root)
+
+    def _public_marker(self, file_path: str) -> str:
+        path_hash = hashlib.sha256(
+            self.store.path(file_path).encode("utf-8")
+        ).hexdigest()
+        return f"{PUBLIC_FOLDER}/{path_hash[:2]}/{path_hash[:32]}"
+
+    async def _is_public(self, file_path: str) -> bool:
+        return await self._public_markers.contains(self._public_marker(file_path))
+
+    async def _compresses(self, file_path: str) -> bool:
+        return self.config.applies_to(file_path) and not await self._is_public(
+            file_path
+        )
+
+    async def _stored_content(self, file_path: str, file_content: bytes) -> bytes:
+        if isinstance(file_content, str):
+            file_content = file_content.encode("utf-8")
+        content = file_content
+        if len(content) >= self.config.min_size and await self._compresses(file_path):
+            compressed = await _run(_compress, content, self.config.level)
+            if len(compressed) < len(content):
+                content = compressed
+        self._stats.bytes_written += len(file_content)
+        self._stats.stored_bytes_written += len(content)
+        return content
+
+    async def _content(self, stored: bytes) -> bytes:
+        content = await _run(_decompress, stored) if is_compressed(stored) else stored
+        self._stats.stored_bytes_read += len(stored)
+        self._stats.bytes_read += len(content)
+        return content
+
+    async def write_file(self, file_path: str, file_content: bytes):
+        await self.store.write_file(
+            file_path, await self._stored_content(file_path, file_content)
+        )
+
+    async def write_file_if_match(
+        self, file_path: str, file_content: bytes, etag: Optional[str]
+    ) -> Optional[str]:
+        return await self.store.write_file_if_match(
+            file_path, await self._stored_content(file_path, file_content), etag
+        )
+
+    async def read_file(self, file_path: str) -> bytes:
+        return await self._content(await self.store.read_file(file_path))
+
+    async def read_file_versioned(self, file_path: str) -> Tuple[bytes, Optional[str]]:
+        stored, etag = await self.store.read_file_versioned(file_path)
+        return await self._content(stored), etag
+
+    async def open_read(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> StorageReader:
+        if not self.config.applies_to(file_path):
+            return await self.store.open_read(file_path, start, end)
+        # a range of the content can only be served from the whole frame
+        return BytesReader(await self.read_file(file_path), start, end)
+
+    async def read_into(self, file_path: str, target: ReadTarget) -> int:
+        if not self.config.applies_to(file_path):
+            return await self.store.read_into(file_path, target)
+        return await write_into_target(target, await self.read_file(file_path))
+
+    async def open_write(self, file_path: str) -> StorageWriter:
+        writer = await self.store.open_write(file_path)
+        if not await self._compresses(file_path):
+            return writer
+        return _CompressingWriter(writer, self.config, self._stats)
+
+    async def stat(self, file_path: str) -> StorageEntry:
+        # revalidated often (CachingStorage), so the object is not read: the
+        # size of a compressed file's content is only known by reading it
+        entry = await self.store.stat(file_path)
+        if not self.config.applies_to(file_path):
+            return entry
+        return StorageEntry(
+            name=entry.name, size=None, etag=entry.etag, updated=entry.updated
+        )
+
+    async def make_public(self, file_path: str) -> str:
+        if self.config.applies_to(file_path):
+            # before decompressing, so that concurrent writes see it
+            marker = self._public_marker(file_path)
+            await self.root.write_file(marker, b"")
+            self._public_markers.add(marker)
+            stored = await self.store.read_file(file_path)
+            if is_compressed(stored):
+                logger.info("Storing %s uncompressed to make it public", file_path)
+                await self.store.write_file(file_path, await _run(_decompress, stored))
+        return await self.store.make_public(file_path)
+
+    def new_store(self, folder_suffix: str) -> "CompressedStorage":
+        return CompressedStorage(
+            self.store.new_store(folder_suffix),
+            self.config,
+            self.root,
+            self._public_markers,
+        )
+
+    def stats(self) -> CompressionStats:
+        return CompressionStats(**vars(self._stats))
+
+
+class _CompressingWriter(StorageWriter):
+    """Compresses the content into the wrapped store's writer as it is
+    written. Content shorter than min_size is stored as is."""
+
+    def __init__(
+        self, writer: StorageWriter, config: CompressionConfig, stats: CompressionStats
+    ):
+        super().__init__()
+        self.writer = writer
+        self.config = config
+        self.stats = stats
+        self._compressor = None
+        # held until there are min_size bytes
+        self._pending: List[bytes] = []
+        self._pending_size = 0
+
+    async def _write_stored(self, content: bytes):
+        if content:
+            await self.writer.write(content)
+            self.stats.stored_bytes_written += len(content)
+
+    async def _write(self, data: bytes):
+        self.stats.bytes_written += len(data)
+        if self._compressor is None:
+            self._pending.append(bytes(data))
+            self._pending_size += len(data)
+            if self._pending_size < self.config.min_size:
+                return
+            self._compressor = zstandard.ZstdCompressor(
+                level=self.config.level
+            ).compressobj()
+            data, self._pending = b"".join(self._pending), []
+        await self._write_stored(await _run(self._compressor.compress, data))
+
+    async def close(self):
+        if self._compressor is None:
+            await self._write_stored(b"".join(self._pending))
+        else:
+            await self._write_stored(self._compressor.flush())
+        await self.writer.close()
+
+    async def abort(self):
+        await self.writer.abort()
+
+
+def compressed_storage_from_env(store: Storage) -> Storage:
+    """Wraps store in a CompressedStorage when STORAGE_COMPRESSION is set to
+    zstd, configured by STORAGE_COMPRESSION_LEVEL, STORAGE_COMPRESSION_SUFFIXES
+    and STORAGE_COMPRESSION_MIN_SIZE."""
+    if os.getenv("STORAGE_COMPRESSION", "").lower() != "zstd":
+        return store
+    return CompressedStorage(store, CompressionConfig.from_env())
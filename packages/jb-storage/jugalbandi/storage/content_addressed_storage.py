@@ -0,0 +1,448 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from contextlib import suppress
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import aiofiles
+from .storage import (
+    STREAM_CHUNK_SIZE,
+    BulkOperationResult,
+    PreconditionFailedError,
+    ReadTarget,
+    Storage,
+    StorageEntry,
+    StorageReader,
+    StorageWrapper,
+    StorageWriter,
+    create_temp_file,
+    join_path,
+    remove_temp_file,
+)
+
+logger = logging.getLogger(__name__)
+
+CAS_FOLDER = "__cas__"
+POINTER_PREFIX = b"jb-cas:sha256:"
+# a pointer is the prefix followed by the hex sha256 digest
+POINTER_SIZE = len(POINTER_PREFIX) + 64
+# seconds after which the tombstone of a release is left by a process that
+# died while deleting the blob
+RELEASE_TIMEOUT = 30.0
+
+
+def content_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _parse_pointer(content: bytes) -> Optional[str]:
+    if len(content) != POINTER_SIZE or not content.startswith(POINTER_PREFIX):
+        return None
+    return content[len(POINTER_PREFIX):].decode("ascii")
+
+
+class ContentAddressedStorage(StorageWrapper):
+    """Stores the content of files once under its sha256 digest.
+
+    A file of at least ``min_size`` bytes is written to the ``__cas__`` folder
+    of the root store (only if no other file has the same content yet) and its
+    own path holds a small pointer to the blob. Every path pointing to a blob
+    has a reference marker next to it; the blob and the artifacts derived from
+    it are deleted together with the last reference. Smaller files are stored
+    as is. Streamed writes (open_write) are spooled to a temporary file to
+    compute their digest and stored the same way.
+
+    Reference updates for one digest are serialized within the process.
+    Across processes, a release writes a tombstone next to the blob and lists
+    the references again before it deletes the blob, while a writer adds its
+    reference before it looks for a tombstone: either the release sees the
+    new reference and keeps the blob, or the writer waits until the release
+    is done and uploads the blob again.
+    """
+
+    def __init__(
+        self,
+        store: Storage,
+        root: Optional[Storage] = None,
+        min_size: int = 4096,
+    ):
+        super().__init__(store)
+        # the store holding __cas__, stores created with new_store share it
+        self.root = root or store
+        self.min_size = max(min_size, POINTER_SIZE + 1)
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    # everything of one digest lives under one folder, so that it can be
+    # removed with delete_prefix:
+    #   __cas__/ab/<digest>/blob
+    #   __cas__/ab/<digest>/refs/<path hash>/path
+    #   __cas__/ab/<digest>/derived/<name>
+    #   __cas__/ab/<digest>/releasing (while the blob is being deleted)
+    def _digest_folder(self, digest: str) -> str:
+        return f"{CAS_FOLDER}/{digest[:2]}/{digest}"
+
+    def _blob_path(self, digest: str) -> str:
+        return f"{self._digest_folder(digest)}/blob"
+
+    def _derived_path(self, digest: str, name: str) -> str:
+        return f"{self._digest_folder(digest)}/derived/{name}"
+
+    def _tombstone_path(self, digest: str) -> str:
+        return f"{self._digest_folder(digest)}/releasing"
+
+    def _ref_folder(self, digest: str, file_path: str) -> str:
+        path_hash = hashlib.sha256(
+            self.store.path(file_path).encode("utf-8")
+        ).hexdigest()
+        return f"{self._digest_folder(digest)}/refs/{path_hash[:32]}"
+
+    async def _add_ref(self, digest: str, file_path: str):
+        await self.root.write_file(
+            f"{self._ref_folder(digest, file_path)}/path",
+            self.store.path(file_path).encode("utf-8"),
+        )
+
+    def _lock(self, digest: str) -> asyncio.Lock:
+        lock = self._locks.get(digest)
+        if lock is None:
+            lock = self._locks[digest] = asyncio.Lock()
+        return lock
+
+    async def _stat(self, file_path: str) -> Optional[StorageEntry]:
+        # stat asks the root store itself, file_exists may answer from a cache
+        try:
+            return await self.root.stat(file_path)
+        except FileNotFoundError:
+            return None
+
+    async def _has_refs(self, digest: str) -> bool:
+        async for _ in self.root.list_entries(f"{self._digest_folder(digest)}/refs"):
+            return True
+        return False
+
+    async def _wait_for_release(self, digest: str):
+        """Waits until no process is deleting the blob of digest."""
+        tombstone_path = self._tombstone_path(digest)
+        started = time.monotonic()
+        delay = 0.05
+        while (tombstone := await self._stat(tombstone_path)) is not None:
+            age = (
+                (datetime.now(timezone.utc) - tombstone.updated).total_seconds()
+                if tombstone.updated is not None
+                else 0.0
+            )
+            if max(age, time.monotonic() - started) > RELEASE_TIMEOUT:
+                logger.warning("Removing abandoned tombstone of blob %s", digest)
+                with suppress(FileNotFoundError):
+                    await self.root.remove_file(  # type: ignore[attr-defined]
+                        tombstone_path
+                    )
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    async def _store_blob(
+        self,
+        digest: str,
+        file_path: str,
+        upload: Callable[[str], Awaitable[None]],
+    ):
+        """References the blob of digest from file_path, uploading it with
+        upload(blob_path) unless it is stored already."""
+        async with self._lock(digest):
+            await self._add_ref(digest, file_path)
+            await self._wait_for_release(digest)
+            blob_path = self._blob_path(digest)
+            if await self._stat(blob_path) is None:
+                await upload(blob_path)
+
+    async def digest_of(self, file_path: str) -> Optional[str]:
+        """Digest of a content addressed file, None for files stored as is."""
+        try:
+            entry = await self.store.stat(file_path)
+        except FileNotFoundError:
+            return None
+        if entry.size is not None and entry.size != POINTER_SIZE:
+            return None
+        return _parse_pointer(await self.store.read_file(file_path))
+
+    async def write_file(self, file_path: str, file_content: bytes):
+        if isinstance(file_content, str):
+            # callers pass text content as str, which the remote stores accept
+            file_content = file_content.encode("utf-8")
+        if len(file_content) < self.min_size:
+            old_digest = await self.digest_of(file_path)
+            await self.store.write_file(file_path, file_content)
+            if old_digest is not None:
+                await self._release(old_digest, file_path)
+            return
+
+        if len(file_content) > 1024 * 1024:
+            digest = await asyncio.to_thread(content_digest, file_content)
+        else:
+            digest = content_digest(file_content)
+        await self._write_pointer(
+            file_path,
+            digest,
+            lambda blob_path: self.root.write_file(blob_path, file_content),
+        )
+
+    async def _write_pointer(
+        self,
+        file_path: str,
+        digest: str,
+        upload: Callable[[str], Awaitable[None]],
+    ):
+        old_digest = await self.digest_of(file_path)
+        if old_digest == digest:
+            return
+        await self._store_blob(digest, file_path, upload)
+        await self.store.write_file(file_path, POINTER_PREFIX + digest.encode("ascii"))
+        if old_digest is not None:
+            await self._release(old_digest, file_path)
+
+    async def read_file_versioned(self, file_path: str) -> Tuple[bytes, Optional[str]]:
+        # the version of the file itself (content or pointer), which is what
+        # write_file_if_match conditions on
+        content, etag = await self.store.read_file_versioned(file_path)
+        digest = _parse_pointer(content)
+        if digest is not None:
+            content = await self.root.read_file(self._blob_path(digest))
+        return content, etag
+
+    async def write_file_if_match(
+        self, file_path: str, file_content: bytes, etag: Optional[str]
+    ) -> Optional[str]:
+        if isinstance(file_content, str):
+            file_content = file_content.encode("utf-8")
+        # read after the version the caller holds: if the condition holds, this
+        # is still the digest the file points to
+        old_digest = await self.digest_of(file_path)
+        if len(file_content) < self.min_size:
+            new_etag = await self.store.write_file_if_match(
+                file_path, file_content, etag
+            )
+            if old_digest is not None:
+                await self._release(old_digest, file_path)
+            return new_etag
+
+        digest = content_digest(file_content)
+        await self._store_blob(
+            digest,
+            file_path,
+            lambda blob_path: self.root.write_file(blob_path, file_content),
+        )
+        try:
+            new_etag = await self.store.write_file_if_match(
+                file_path, POINTER_PREFIX + digest.encode("ascii"), etag
+            )
+        except PreconditionFailedError:
+            # unless the winning write points to the same blob
+            if await self.digest_of(file_path) != digest:
+                await self._release(digest, file_path)
+            raise
+        if old_digest is not None and old_digest != digest:
+            await self._release(old_digest, file_path)
+        return new_etag
+
+    async def _release(self, digest: str, file_path: str):
+        async with self._lock(digest):
+            await self.root.delete_prefix(self._ref_folder(digest, file_path))
+            if await self._has_refs(digest):
+                return
+            tombstone_path = self._tombstone_path(digest)
+            try:
+                await self.root.write_file_if_match(tombstone_path, b"", None)
+            except PreconditionFailedError:
+                # being released by another process
+                return
+            try:
+                # a writer that added its reference after the first listing
+                if await self._has_refs(digest):
+                    return
+                logger.info("Deleting unreferenced blob %s", digest)
+                await self.root.delete_prefix(f"{self._digest_folder(digest)}/derived")
+                with suppress(FileNotFoundError):
+                    await self.root.remove_file(  # type: ignore[attr-defined]
+                        self._blob_path(digest)
+                    )
+            finally:
+                with suppress(FileNotFoundError):
+                    await self.root.remove_file(  # type: ignore[attr-defined]
+                        tombstone_path
+                    )
+
+    async def remove_file(self, file_path: str):
+        digest = await self.digest_of(file_path)
+        await super().remove_file(file_path)
+        if digest is not None:
+            await self._release(digest, file_path)
+
+    async def open_write(self, file_path: str) -> StorageWriter:
+        fd, temp_path = create_temp_file(
+            os.path.join(tempfile.gettempdir(), "jb-cas-upload")
+        )
+        return _ContentAddressedWriter(
+            self, file_path, await aiofiles.open(fd, "w+b"), temp_path
+        )
+
+    async def _write_spooled(self, file_path: str, f, size: int, digest: str):
+        """Stores content spooled to the file f like write_file."""
+        await f.seek(0)
+        if size < self.min_size:
+            old_digest = await self.digest_of(file_path)
+            await self.store.write_file(file_path, await f.read())
+            if old_digest is not None:
+                await self._release(old_digest, file_path)
+            return
+
+        async def _upload(blob_path: str):
+            await f.seek(0)
+            async with await self.root.open_write(blob_path) as writer:
+                while chunk := await f.read(STREAM_CHUNK_SIZE):
+                    await writer.write(chunk)
+
+        await self._write_pointer(file_path, digest, _upload)
+
+    async def read_file(self, file_path: str) -> bytes:
+        content = await self.store.read_file(file_path)
+        digest = _parse_pointer(content)
+        if digest is None:
+            return content
+        return await self.root.read_file(self._blob_path(digest))
+
+    async def _resolve(self, file_path: str):
+        digest = await self.digest_of(file_path)
+        if digest is None:
+            return self.store, file_path
+        return self.root, self._blob_path(digest)
+
+    async def open_read(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> StorageReader:
+        store, path = await self._resolve(file_path)
+        return await store.open_read(path, start, end)
+
+    async def read_into(self, file_path: str, target: ReadTarget) -> int:
+        store, path = await self._resolve(file_path)
+        return await store.read_into(path, target)
+
+    async def stat(self, file_path: str) -> StorageEntry:
+        entry = await self.store.stat(file_path)
+        if entry.size != POINTER_SIZE:
+            return entry
+        digest = _parse_pointer(await self.store.read_file(file_path))
+        if digest is None:
+            return entry
+        blob_entry = await self.root.stat(self._blob_path(digest))
+        # the digest identifies the content
+        return StorageEntry(
+            name=file_path, size=blob_entry.size, etag=digest, updated=entry.updated
+        )
+
+    async def make_public(self, file_path: str) -> str:
+        store, path = await self._resolve(file_path)
+        return await store.make_public(path)
+
+    async def public_url(self, file_path: str) -> str:
+        store, path = await self._resolve(file_path)
+        return await store.public_url(path)
+
+    async def delete_prefix(self, folder_path: str) -> BulkOperationResult:
+        digests: Dict[str, str] = {}
+        async for entry in self.store.list_entries(folder_path):
+            if entry.size == POINTER_SIZE:
+                file_path = join_path(folder_path, entry.name)
+                digest = await self.digest_of(file_path)
+                if digest is not None:
+                    digests[file_path] = digest
+
+        result = await self.store.delete_prefix(folder_path)
+        for file_path in result.processed:
+            if file_path in digests:
+                await self._release(digests[file_path], file_path)
+        return result
+
+    async def copy_prefix(
+        self, folder_path: str, target_folder_path: str
+    ) -> BulkOperationResult:
+        # only the pointers are copied, the copies reference the same blobs
+        result = await self.store.copy_prefix(folder_path, target_folder_path)
+        for file_path in result.processed:
+            target_path = join_path(
+                target_folder_path, file_path[len(folder_path):].lstrip("/")
+            )
+            digest = await self.digest_of(target_path)
+            if digest is not None:
+                await self._add_ref(digest, target_path)
+        return result
+
+    async def read_derived(self, file_path: str, name: str) -> Optional[bytes]:
+        """Artifact (e.g. extracted text) derived from the content of a file,
+        shared by every file with the same content."""
+        digest = await self.digest_of(file_path)
+        if digest is None:
+            return None
+        try:
+            return await self.root.read_file(self._derived_path(digest, name))
+        except FileNotFoundError:
+            return None
+
+    async def write_derived(self, file_path: str, name: str, content: bytes) -> bool:
+        """Stores an artifact derived from the content of a file, returns False
+        if the file is not content addressed."""
+        digest = await self.digest_of(file_path)
+        if digest is None:
+            return False
+        await self.root.write_file(self._derived_path(digest, name), content)
+        return True
+
+    def new_store(self, folder_suffix: str) -> "ContentAddressedStorage":
+        return ContentAddressedStorage(
+            self.store.new_store(folder_suffix), self.root, self.min_size
+        )
+
+
+class _ContentAddressedWriter(StorageWriter):
+    """Spools the content to a temporary file while hashing it and stores it
+    on close."""
+
+    def __init__(self, store: ContentAddressedStorage, file_path: str, f, temp_path):
+        super().__init__()
+        self.store = store
+        self.file_path = file_path
+        self._file = f
+        self.temp_path = temp_path
+        self._sha256 = hashlib.sha256()
+        self._size = 0
+
+    async def _write(self, data: bytes):
+        await self._file.write(data)
+        self._sha256.update(data)
+        self._size += len(data)
+
+    async def close(self):
+        try:
+            await self.store._write_spooled(
+                self.file_path, self._file, self._size, self._sha256.hexdigest()
+            )
+        finally:
+            await self._file.close()
+            await remove_temp_file(self.temp_path)
+
+    async def abort(self):
+        await self._file.close()
+        await remove_temp_file(self.temp_path)
+
+
+def content_addressed_storage_from_env(store: Storage) -> Storage:
+    """Wraps store in a ContentAddressedStorage when STORAGE_CONTENT_ADDRESSED
+    is set to true. Files of STORAGE_CAS_MIN_SIZE bytes or more (default 4096)
+    are deduplicated."""
+    if os.getenv("STORAGE_CONTENT_ADDRESSED", "false").lower() != "true":
+        return store
+    min_size = int(os.getenv("STORAGE_CAS_MIN_SIZE", "4096"))
+    return ContentAddressedStorage(store, min_size=min_size)
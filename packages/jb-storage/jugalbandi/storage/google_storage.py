@@ -1,15 +1,45 @@
-from typing import AsyncIterator, Self
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Self, Tuple
+from urllib.parse import quote
+import asyncio
+import base64
+import hashlib
+import math
 import os
 import logging
+import re
+import uuid
 import aiohttp
-from .storage import Storage
+import google_crc32c
+from cachetools import TTLCache
+from .storage import (
+    BULK_CONCURRENCY,
+    STREAM_CHUNK_SIZE,
+    BulkOperationResult,
+    EmptyRangeReader,
+    PreconditionFailedError,
+    ReadTarget,
+    Storage,
+    StorageEntry,
+    StorageReader,
+    StorageWriter,
+    TransferConfig,
+    bulk_apply,
+    create_temp_file,
+    join_path,
+    remove_temp_file,
+    resolve_range,
+    write_into_buffer,
+)
 from gcloud.aio.storage import Storage as GoogleAioStorage  # for async operations
-from google.cloud import storage  # for synchronous operations
+from gcloud.aio.storage.storage import init_api_root
 from gcloud.aio.auth import Token
 from tenacity import (
     retry,
+    stop_after_attempt,
     wait_random_exponential,
     after_log,
+    retry_if_exception,
     retry_if_not_exception_type,
 )
 
@@ -25,6 +55,18 @@ STORAGE_EMULATOR_HOST = os.environ.get("STORAGE_EMULATOR_HOST")
 if STORAGE_EMULATOR_HOST:
     VERIFY_SSL = False
 
+_, API_ROOT = init_api_root(None)
+
+# Object metadata shared by all GoogleStorage instances, keyed by (bucket, object).
+# Missing objects are remembered for a shorter time as they are usually about to
+# be created.
+_metadata_cache: TTLCache = TTLCache(
+    maxsize=10000, ttl=float(os.environ.get("GCS_METADATA_CACHE_TTL", "60"))
+)
+_missing_cache: TTLCache = TTLCache(
+    maxsize=10000, ttl=float(os.environ.get("GCS_MISSING_CACHE_TTL", "5"))
+)
+
 
 @retry(
     wait=wait_random_exponential(multiplier=1, max=60),
@@ -39,19 +81,303 @@ async def _list_objects(client, bucket_name: str, params):
     return data
 
 
+def _is_retryable_error(e: BaseException) -> bool:
+    # a failed precondition is final, the same condition cannot pass again
+    return not (isinstance(e, aiohttp.ClientResponseError) and e.status == 412)
+
+
 @retry(
     wait=wait_random_exponential(multiplier=1, max=60),
+    retry=retry_if_exception(_is_retryable_error),
+    stop=stop_after_attempt(8),
     after=after_log(logger, logging.DEBUG),
 )
-async def _upload(client, bucket_name, object_name, content):
-    status = await client.upload(bucket_name, object_name, content)
+async def _upload(client, bucket_name, object_name, content, parameters=None):
+    status = await client.upload(
+        bucket_name, object_name, content, parameters=parameters
+    )
+    _remember_metadata(bucket_name, object_name, status)
     return status
 
 
+# GCS allows composing at most 32 objects in one request
+MAX_COMPOSE_PARTS = 32
+
+# chunks of a resumable upload must be multiples of 256 KiB
+RESUMABLE_CHUNK_MULTIPLE = 256 * 1024
+
+
+@retry(
+    wait=wait_random_exponential(multiplier=1, max=30),
+    retry=retry_if_exception(_is_retryable_error),
+    stop=stop_after_attempt(5),
+    after=after_log(logger, logging.DEBUG),
+)
+async def _download_range(
+    session: aiohttp.ClientSession,
+    url: str,
+    headers: Dict[str, str],
+    generation: Optional[str],
+    start: int,
+    end: int,
+) -> bytes:
+    params = {"alt": "media"}
+    if generation is not None:
+        # all the ranges of one download come from the same generation
+        params["ifGenerationMatch"] = generation
+    async with session.get(
+        url, params=params, headers={**headers, "Range": f"bytes={start}-{end}"}
+    ) as response:
+        response.raise_for_status()
+        content = await response.read()
+    if len(content) != end - start + 1:
+        raise IOError(
+            f"expected {end - start + 1} bytes of {url}, got {len(content)}"
+        )
+    return content
+
+
+@retry(
+    wait=wait_random_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(5),
+    after=after_log(logger, logging.DEBUG),
+)
+async def _upload_part(
+    client, bucket_name, object_name, content: bytes
+) -> Dict[str, Any]:
+    metadata = await client.upload(bucket_name, object_name, content)
+    if metadata.get("md5Hash") != _md5_base64(content):
+        raise IOError(f"checksum mismatch uploading {object_name}")
+    return metadata
+
+
+def _md5_base64(content) -> str:
+    return base64.b64encode(hashlib.md5(content).digest()).decode("ascii")
+
+
+def _file_chunks(file_path: str) -> Iterable[bytes]:
+    with open(file_path, "rb") as f:
+        yield from iter(lambda: f.read(1024 * 1024), b"")
+
+
+def _buffer_chunks(buffer: memoryview) -> Iterable[bytes]:
+    # the crc32c extension only takes bytes
+    for start in range(0, len(buffer), 1024 * 1024):
+        yield bytes(buffer[start:start + 1024 * 1024])
+
+
+def _checksum_matches(metadata: Dict[str, Any], chunks: Iterable[bytes]) -> bool:
+    """Checks content against the md5Hash of the object or, for composite
+    objects which only carry one, its crc32c."""
+    if metadata.get("md5Hash") is not None:
+        digest, expected = hashlib.md5(), metadata["md5Hash"]
+    elif metadata.get("crc32c") is not None:
+        digest, expected = google_crc32c.Checksum(), metadata["crc32c"]
+    else:
+        return True
+    for chunk in chunks:
+        digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode("ascii") == expected
+
+
+def _remember_metadata(
+    bucket_name: str, object_name: str, metadata: Optional[Dict[str, Any]]
+):
+    key = (bucket_name, object_name)
+    if metadata is None:
+        _metadata_cache.pop(key, None)
+        _missing_cache[key] = True
+    else:
+        _missing_cache.pop(key, None)
+        _metadata_cache[key] = metadata
+
+
+def _forget_metadata(bucket_name: str, object_name: str):
+    _metadata_cache.pop((bucket_name, object_name), None)
+    _missing_cache.pop((bucket_name, object_name), None)
+
+
+# GCS accepts at most 100 calls in one batch request
+MAX_BATCH_CALLS = 100
+
+_batch_content_id = re.compile(
+    r"^Content-ID:\s*<response-(\d+)>", re.IGNORECASE | re.MULTILINE
+)
+_batch_status = re.compile(r"^HTTP/1\.1 (\d{3})", re.MULTILINE)
+
+
+def _batch_delete_body(
+    bucket_name: str, object_names: List[str], boundary: str
+) -> bytes:
+    # https://cloud.google.com/storage/docs/batch
+    parts = []
+    for index, object_name in enumerate(object_names):
+        parts.append(
+            f"--{boundary}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <{index}>\r\n\r\n"
+            f"DELETE /storage/v1/b/{bucket_name}/o/{quote(object_name, safe='')} "
+            "HTTP/1.1\r\n\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n")
+    return "".join(parts).encode("utf-8")
+
+
+def _batch_statuses(content_type: str, body: str) -> Dict[int, int]:
+    """Status code of each call of a batch response, keyed by call index."""
+    boundary = content_type.split("boundary=", 1)[1].split(";", 1)[0].strip('"')
+    statuses = {}
+    for part in body.split(f"--{boundary}"):
+        content_id = _batch_content_id.search(part)
+        status = _batch_status.search(part)
+        if content_id is not None and status is not None:
+            statuses[int(content_id.group(1))] = int(status.group(1))
+    return statuses
+
+
+def _storage_entry(name: str, metadata: Dict[str, Any]) -> StorageEntry:
+    updated = metadata.get("updated")
+    return StorageEntry(
+        name=name,
+        size=int(metadata["size"]) if "size" in metadata else None,
+        etag=metadata.get("generation") or metadata.get("etag"),
+        updated=(
+            datetime.fromisoformat(updated.replace("Z", "+00:00"))
+            if updated
+            else None
+        ),
+    )
+
+
+def _parse_content_range(content_range: str) -> Tuple[int, int, int]:
+    # "bytes 0-99/1234" -> (0, 99, 1234)
+    byte_range, size = content_range.split(" ", 1)[1].split("/", 1)
+    first, last = byte_range.split("-", 1)
+    return int(first), int(last), int(size)
+
+
+class GoogleObjectReader(StorageReader):
+    def __init__(self, session: aiohttp.ClientSession, response: aiohttp.ClientResponse,
+                 size: int, start: int, end: int):
+        super().__init__(size, start, end)
+        self._session = session
+        self._response = response
+
+    async def _read_chunk(self) -> bytes:
+        return await self._response.content.read(STREAM_CHUNK_SIZE)
+
+    async def close(self):
+        self._response.release()
+        await self._session.close()
+
+
+class GoogleObjectWriter(StorageWriter):
+    """Streams an object with a resumable upload session. Content smaller than
+    one chunk is stored with a single simple upload instead."""
+
+    def __init__(self, storage: "GoogleStorage", object_name: str):
+        super().__init__()
+        self.storage = storage
+        self.object_name = object_name
+        self.chunk_size = max(
+            RESUMABLE_CHUNK_MULTIPLE,
+            storage.transfer_config.part_size // RESUMABLE_CHUNK_MULTIPLE
+            * RESUMABLE_CHUNK_MULTIPLE,
+        )
+        self._buffer = bytearray()
+        self._offset = 0
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_uri: Optional[str] = None
+
+    def _client_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=self.storage.connector, connector_owner=False
+            )
+        return self._session
+
+    async def _write(self, data: bytes):
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            await self._put_chunk(self.chunk_size, final=False)
+
+    async def _start_session(self):
+        # https://cloud.google.com/storage/docs/performing-resumable-uploads
+        url = f"{API_ROOT}/upload/storage/v1/b/{self.storage.bucket_name}/o"
+        async with self._client_session().post(
+            url,
+            params={"uploadType": "resumable", "name": self.object_name},
+            headers=await self.storage._auth_headers(),
+            json={"name": self.object_name},
+        ) as response:
+            response.raise_for_status()
+            self._session_uri = response.headers["Location"]
+
+    async def _put_chunk(self, length: int, final: bool) -> Optional[Dict[str, Any]]:
+        if self._session_uri is None:
+            await self._start_session()
+        chunk = bytes(self._buffer[:length])
+        total = str(self._offset + length) if final else "*"
+        if length > 0:
+            content_range = f"bytes {self._offset}-{self._offset + length - 1}/{total}"
+        else:
+            content_range = f"bytes */{total}"
+        headers = await self.storage._auth_headers()
+        headers["Content-Range"] = content_range
+        async with self._client_session().put(
+            self._session_uri, data=chunk, headers=headers  # type: ignore
+        ) as response:
+            # 308 asks for the next chunk
+            if response.status != 308:
+                response.raise_for_status()
+            metadata = await response.json(content_type=None) if final else None
+        del self._buffer[:length]
+        self._offset += length
+        return metadata
+
+    async def close(self):
+        try:
+            if self._session_uri is None:
+                async with GoogleAioStorage(
+                    session=self._client_session(), token=self.storage.token
+                ) as client:
+                    await _upload(client, self.storage.bucket_name, self.object_name,
+                                  bytes(self._buffer))
+                self._buffer.clear()
+            else:
+                metadata = await self._put_chunk(len(self._buffer), final=True)
+                _remember_metadata(self.storage.bucket_name, self.object_name, metadata)
+        finally:
+            await self._close_session()
+
+    async def abort(self):
+        self._buffer.clear()
+        try:
+            if self._session_uri is not None:
+                # cancels the resumable upload, GCS answers 499
+                async with self._client_session().delete(self._session_uri):
+                    pass
+        except aiohttp.ClientError:
+            logger.warning("could not cancel upload of %s", self.object_name)
+        finally:
+            await self._close_session()
+
+    async def _close_session(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
 class GoogleStorage(Storage):
-    def __init__(self, bucket_name: str, base_path: str):
+    def __init__(
+        self,
+        bucket_name: str,
+        base_path: str,
+        transfer_config: Optional[TransferConfig] = None,
+    ):
         self.bucket_name = bucket_name
         self.base_path = base_path
+        self.transfer_config = transfer_config or TransferConfig.from_env()
         self._token_session: aiohttp.ClientSession | None = None
         self._token: Token | None = None
         self._connector: aiohttp.TCPConnector | None = None
@@ -96,13 +422,161 @@ class GoogleStorage(Storage):
             )
         return self._token
 
+    async def _auth_headers(self) -> Dict[str, str]:
+        if STORAGE_EMULATOR_HOST:
+            return {}
+        return {"Authorization": f"Bearer {await self.token.get()}"}
+
     async def write_file(self, file_path: str, content: bytes):
         object_name = f"{self.base_path}/{file_path}"
         async with aiohttp.ClientSession(
             connector=self.connector, connector_owner=False
         ) as session:
             async with GoogleAioStorage(session=session, token=self.token) as client:
-                await _upload(client, self.bucket_name, object_name, content)
+                if len(content) < self.transfer_config.threshold:
+                    await _upload(client, self.bucket_name, object_name, content)
+                else:
+                    await self._parallel_upload(session, client, object_name, content)
+
+    async def write_file_if_match(
+        self, file_path: str, content: bytes, etag: Optional[str]
+    ) -> Optional[str]:
+        # the etag of a GCS object is its generation, 0 matches no object;
+        # conditional writes are single uploads whatever their size
+        object_name = f"{self.base_path}/{file_path}"
+        async with aiohttp.ClientSession(
+            connector=self.connector, connector_owner=False
+        ) as session:
+            async with GoogleAioStorage(session=session, token=self.token) as client:
+                try:
+                    metadata = await _upload(
+                        client, self.bucket_name, object_name, content,
+                        parameters={"ifGenerationMatch": etag or "0"},
+                    )
+                except aiohttp.ClientResponseError as e:
+                    if e.status == 412:
+                        raise PreconditionFailedError(
+                            f"{file_path} is not at generation {etag}"
+                        )
+                    raise
+        return metadata.get("generation")
+
+    async def _parallel_upload(self, session, client, object_name: str, content: bytes):
+        """Uploads the parts of content as temporary objects in parallel and
+        composes them into object_name."""
+        part_size = max(self.transfer_config.part_size,
+                        math.ceil(len(content) / MAX_COMPOSE_PARTS))
+        view = memoryview(content)
+        parts_prefix = f"{object_name}.__parts__/{uuid.uuid4().hex}"
+        part_names = [f"{parts_prefix}/{index:05d}"
+                      for index in range(math.ceil(len(content) / part_size))]
+        semaphore = asyncio.Semaphore(self.transfer_config.max_concurrency)
+
+        async def _part(index: int, part_name: str):
+            async with semaphore:
+                part = view[index * part_size:(index + 1) * part_size].tobytes()
+                await _upload_part(client, self.bucket_name, part_name, part)
+
+        try:
+            await asyncio.gather(
+                *(_part(index, name) for index, name in enumerate(part_names))
+            )
+            # https://cloud.google.com/storage/docs/json_api/v1/objects/compose
+            url = (f"{API_ROOT}/storage/v1/b/{self.bucket_name}/o/"
+                   f"{quote(object_name, safe='')}/compose")
+            body = {"sourceObjects": [{"name": name} for name in part_names]}
+            async with session.post(url, headers=await self._auth_headers(),
+                                    json=body) as response:
+                response.raise_for_status()
+                metadata = await response.json()
+            if int(metadata["size"]) != len(content):
+                raise IOError(f"composed {object_name} has {metadata['size']} bytes, "
+                              f"expected {len(content)}")
+            _remember_metadata(self.bucket_name, object_name, metadata)
+        finally:
+            results = await asyncio.gather(
+                *(client.delete(self.bucket_name, name) for name in part_names),
+                return_exceptions=True,
+            )
+            for name, result in zip(part_names, results):
+                if isinstance(result, Exception):
+                    logger.warning("could not delete upload part %s: %s", name, result)
+
+    async def read_into(self, file_path: str, target: ReadTarget) -> int:
+        object_name = f"{self.base_path}/{file_path}"
+        metadata = await self._object_metadata(object_name)
+        if metadata is None:
+            raise FileNotFoundError(f"file {file_path} not found")
+        size = int(metadata["size"])
+        if size < self.transfer_config.threshold:
+            return await super().read_into(file_path, target)
+
+        part_size = self.transfer_config.part_size
+        ranges = [
+            (start, min(start + part_size, size) - 1)
+            for start in range(0, size, part_size)
+        ]
+        semaphore = asyncio.Semaphore(self.transfer_config.max_concurrency)
+        url = (
+            f"{API_ROOT}/storage/v1/b/{self.bucket_name}"
+            f"/o/{quote(object_name, safe='')}"
+        )
+        fd: Optional[int] = None
+        temp_path = ""
+        if isinstance(target, str):
+            fd, temp_path = create_temp_file(target)
+        elif len(memoryview(target)) < size:
+            raise ValueError(
+                f"buffer of {len(memoryview(target))} bytes is too small "
+                f"for {file_path} ({size} bytes)"
+            )
+
+        try:
+            try:
+                if fd is not None:
+                    os.ftruncate(fd, size)
+                async with aiohttp.ClientSession(
+                    connector=self.connector, connector_owner=False
+                ) as session:
+                    async def _part(start: int, end: int):
+                        async with semaphore:
+                            content = await _download_range(
+                                session,
+                                url,
+                                await self._auth_headers(),
+                                metadata.get("generation"),
+                                start,
+                                end,
+                            )
+                        if fd is not None:
+                            await asyncio.to_thread(os.pwrite, fd, content, start)
+                        else:
+                            write_into_buffer(target, start, content)
+
+                    await asyncio.gather(*(_part(start, end) for start, end in ranges))
+            except aiohttp.ClientResponseError as e:
+                if e.status == 412:
+                    _forget_metadata(self.bucket_name, object_name)
+                    raise IOError(f"{file_path} changed while downloading") from e
+                raise
+            finally:
+                if fd is not None:
+                    os.close(fd)
+
+            chunks = (
+                _file_chunks(temp_path)
+                if fd is not None
+                else _buffer_chunks(memoryview(target)[:size])
+            )
+            if not await asyncio.to_thread(_checksum_matches, metadata, chunks):
+                raise IOError(f"checksum mismatch downloading {file_path}")
+            if fd is not None:
+                os.replace(temp_path, target)
+        except BaseException:
+            if fd is not None:
+                await remove_temp_file(temp_path)
+            raise
+        return size
 
     @retry(
         wait=wait_random_exponential(multiplier=1, max=60),
@@ -123,6 +597,51 @@ class GoogleStorage(Storage):
                     else:
                         raise
 
+    async def open_read(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> StorageReader:
+        if start < 0 or (end is not None and end < start):
+            raise ValueError(f"invalid byte range {start}-{end}")
+        if end == start:
+            size = (await self.stat(file_path)).size or 0
+            start, end = resolve_range(size, start, end)
+            return EmptyRangeReader(size, start)
+
+        object_name = f"{self.base_path}/{file_path}"
+        url = (
+            f"{API_ROOT}/storage/v1/b/{self.bucket_name}/o/"
+            f"{quote(object_name, safe='')}"
+        )
+        headers = await self._auth_headers()
+        if start > 0 or end is not None:
+            last = "" if end is None else str(end - 1)
+            headers["Range"] = f"bytes={start}-{last}"
+
+        session = aiohttp.ClientSession(connector=self.connector, connector_owner=False)
+        try:
+            response = await session.get(url, params={"alt": "media"}, headers=headers)
+            if response.status == 404:
+                raise FileNotFoundError(f"file {file_path} not found")
+            if response.status == 416:
+                raise ValueError(
+                    f"byte range {start}-{end} not satisfiable for {file_path}"
+                )
+            response.raise_for_status()
+        except BaseException:
+            await session.close()
+            raise
+
+        if response.status == 206:
+            first, last, size = _parse_content_range(response.headers["Content-Range"])
+            return GoogleObjectReader(session, response, size, first, last + 1)
+        size = int(response.headers.get("Content-Length", 0))
+        return GoogleObjectReader(session, response, size, 0, size)
+
+    async def open_write(self, file_path: str) -> StorageWriter:
+        object_name = f"{self.base_path}/{file_path}"
+        _forget_metadata(self.bucket_name, object_name)
+        return GoogleObjectWriter(self, object_name)
+
     def _relative_path(self, path_suffix: str):
         if self.base_path is None or self.base_path == "":
             return path_suffix
@@ -178,46 +697,109 @@ class GoogleStorage(Storage):
 
                     page_token = data["nextPageToken"]
 
+    async def list_entries(
+        self, folder_path: str, recursive: bool = True
+    ) -> AsyncIterator[StorageEntry]:
+        prefix = f"{self._relative_path(folder_path)}/"
+        async with aiohttp.ClientSession(
+            connector=self.connector, connector_owner=False
+        ) as session:
+            async with GoogleAioStorage(session=session, token=self.token) as client:
+                params = {"maxResults": "1000", "prefix": prefix}
+                if not recursive:
+                    params["delimiter"] = "/"
+                while True:
+                    data = await _list_objects(client, self.bucket_name, params)
+                    for metadata in data.get("items", []):
+                        # the listing carries the full object resource
+                        _remember_metadata(self.bucket_name, metadata["name"], metadata)
+                        yield _storage_entry(metadata["name"][len(prefix):], metadata)
+                    if "nextPageToken" not in data:
+                        return
+                    params["pageToken"] = data["nextPageToken"]
+
+    async def exists_many(self, file_paths: Iterable[str]) -> Dict[str, bool]:
+        result = await super().exists_many(file_paths)
+        for file_path, exists in result.items():
+            if not exists:
+                _remember_metadata(
+                    self.bucket_name, f"{self.base_path}/{file_path}", None
+                )
+        return result
+
     async def make_public(self, file_path: str) -> str:
         blob_name = f"{self.base_path}/{file_path}"
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(self.bucket_name)
-        blob = bucket.blob(blob_name)
-        try:
-            blob.make_public()
-            return blob.public_url
-        except aiohttp.ClientResponseError as e:
-            if e.status == 404:
-                raise FileNotFoundError(f"file {file_path} not found")
-            else:
-                raise
+        # https://cloud.google.com/storage/docs/json_api/v1/objectAccessControls/insert
+        url = (f"{API_ROOT}/storage/v1/b/{self.bucket_name}/o/"
+               f"{quote(blob_name, safe='')}/acl")
+        async with aiohttp.ClientSession(
+            connector=self.connector, connector_owner=False
+        ) as session:
+            async with session.post(
+                url,
+                headers=await self._auth_headers(),
+                json={"entity": "allUsers", "role": "READER"},
+            ) as response:
+                if response.status == 404:
+                    raise FileNotFoundError(f"file {file_path} not found")
+                response.raise_for_status()
+        return await self.public_url(file_path)
 
     async def public_url(self, file_path: str) -> str:
-        # simple approach, but does not provide public url
-        # see https://cloud.google.com/storage/docs/access-public-data
-        # full_file_path = f"{self.base_path}/{file_path}"
-        # return (
-        #     "https://storage.googleapis.com/"
-        #     f"{self.bucket_name}/{urllib.parse.quote(full_file_path)}"
-        # )
-
-        # synchronous method for getting public_url, throws exception if not available
+        # same url as google.cloud.storage.Blob.public_url, it is only readable
+        # once the object has been made public
         blob_name = f"{self.base_path}/{file_path}"
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(self.bucket_name)
-        blob = bucket.blob(blob_name)
-        return blob.public_url
+        return (
+            "https://storage.googleapis.com/"
+            f"{self.bucket_name}/{quote(blob_name, safe='/~')}"
+        )
 
     async def file_exists(self, file_path: str) -> bool:
         blob_name = f"{self.base_path}/{file_path}"
-        client = storage.Client()
-        bucket = client.get_bucket(self.bucket_name)
-        blob = bucket.blob(blob_name)
-        return blob.exists()
+        return await self._cached_object_metadata(blob_name) is not None
+
+    @retry(
+        wait=wait_random_exponential(multiplier=1, max=60),
+        retry=retry_if_not_exception_type(FileNotFoundError),
+    )
+    async def _object_metadata(self, object_name: str) -> Optional[Dict[str, Any]]:
+        async with aiohttp.ClientSession(
+            connector=self.connector, connector_owner=False
+        ) as session:
+            async with GoogleAioStorage(session=session, token=self.token) as client:
+                try:
+                    metadata = await client.download_metadata(
+                        self.bucket_name, object_name
+                    )
+                except aiohttp.ClientResponseError as e:
+                    if e.status == 404:
+                        metadata = None
+                    else:
+                        raise
+        _remember_metadata(self.bucket_name, object_name, metadata)
+        return metadata
+
+    async def _cached_object_metadata(
+        self, object_name: str
+    ) -> Optional[Dict[str, Any]]:
+        key = (self.bucket_name, object_name)
+        if key in _missing_cache:
+            return None
+        metadata = _metadata_cache.get(key)
+        if metadata is None:
+            metadata = await self._object_metadata(object_name)
+        return metadata
+
+    async def stat(self, file_path: str) -> StorageEntry:
+        # always asks GCS, callers use stat to detect changed objects
+        metadata = await self._object_metadata(f"{self.base_path}/{file_path}")
+        if metadata is None:
+            raise FileNotFoundError(f"file {file_path} not found")
+        return _storage_entry(file_path, metadata)
 
     def new_store(self, folder_suffix: str) -> "GoogleStorage":
         folder_path = self._relative_path(folder_suffix)
-        return GoogleStorage(self.bucket_name, folder_path)
+        return GoogleStorage(self.bucket_name, folder_path, self.transfer_config)
 
     async def list_subfolders(
         self, folder_path: str, start_offset: str = "", end_offset: str = ""
@@ -261,15 +843,120 @@ class GoogleStorage(Storage):
                     page_token = data["nextPageToken"]
 
     async def remove_file(self, file_path: str):
-        full_file_path = self._relative_path(file_path)
+        # removes every object starting with file_path, on all pages of the listing
+        result = await self._delete_matching(self._relative_path(file_path))
+        if not result.ok:
+            raise IOError(
+                f"could not delete {len(result.failures)} objects under {file_path}"
+            )
+
+    def _store_path(self, object_name: str) -> str:
+        if self.base_path:
+            return object_name[len(self.base_path) + 1:]
+        return object_name
+
+    async def _object_names(self, client, prefix: str) -> AsyncIterator[str]:
+        params = {"maxResults": "1000", "prefix": prefix}
+        while True:
+            data = await _list_objects(client, self.bucket_name, params)
+            for item in data.get("items", []):
+                yield item["name"]
+            if "nextPageToken" not in data:
+                return
+            params["pageToken"] = data["nextPageToken"]
+
+    async def _batch_delete(
+        self, session: aiohttp.ClientSession, object_names: List[str]
+    ) -> Dict[str, str]:
+        """Deletes the objects with one batch request, returns the failures."""
+        boundary = uuid.uuid4().hex
+        headers = await self._auth_headers()
+        headers["Content-Type"] = f"multipart/mixed; boundary={boundary}"
+        async with session.post(
+            f"{API_ROOT}/batch/storage/v1",
+            data=_batch_delete_body(self.bucket_name, object_names, boundary),
+            headers=headers,
+        ) as response:
+            response.raise_for_status()
+            statuses = _batch_statuses(
+                response.headers["Content-Type"], await response.text()
+            )
+
+        failures = {}
+        for index, object_name in enumerate(object_names):
+            _forget_metadata(self.bucket_name, object_name)
+            status = statuses.get(index)
+            # an object that is already gone counts as deleted
+            if status not in (200, 204, 404):
+                failures[object_name] = f"delete failed with status {status}"
+        return failures
+
+    async def _delete_matching(self, prefix: str) -> BulkOperationResult:
+        result = BulkOperationResult()
+        # every batch request carries up to MAX_BATCH_CALLS deletes
+        semaphore = asyncio.Semaphore(max(1, BULK_CONCURRENCY // 8))
+
+        async with aiohttp.ClientSession(
+            connector=self.connector, connector_owner=False
+        ) as session:
+            async def _delete(object_names: List[str]):
+                try:
+                    failures = await self._batch_delete(session, object_names)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    failures = {object_name: str(e) or type(e).__name__
+                                for object_name in object_names}
+                finally:
+                    semaphore.release()
+                for object_name in object_names:
+                    file_path = self._store_path(object_name)
+                    if object_name in failures:
+                        result.failures[file_path] = failures[object_name]
+                    else:
+                        result.processed.append(file_path)
+
+            async with GoogleAioStorage(session=session, token=self.token) as client:
+                async with asyncio.TaskGroup() as task_group:
+                    batch: List[str] = []
+                    async for object_name in self._object_names(client, prefix):
+                        batch.append(object_name)
+                        if len(batch) == MAX_BATCH_CALLS:
+                            await semaphore.acquire()
+                            task_group.create_task(_delete(batch))
+                            batch = []
+                    if batch:
+                        await semaphore.acquire()
+                        task_group.create_task(_delete(batch))
+        return result
+
+    async def delete_prefix(self, folder_path: str) -> BulkOperationResult:
+        return await self._delete_matching(f"{self._relative_path(folder_path)}/")
+
+    async def copy_prefix(
+        self, folder_path: str, target_folder_path: str
+    ) -> BulkOperationResult:
+        prefix = f"{self._relative_path(folder_path)}/"
         async with aiohttp.ClientSession(
             connector=self.connector, connector_owner=False
         ) as session:
             async with GoogleAioStorage(session=session, token=self.token) as client:
-                objects = await client.list_objects(self.bucket_name,
-                                                    params={"prefix": full_file_path})
-                for blob in objects['items']:
-                    await client.delete(self.bucket_name, blob['name'])
+                async def _file_paths() -> AsyncIterator[str]:
+                    async for object_name in self._object_names(client, prefix):
+                        yield self._store_path(object_name)
+
+                async def _copy(file_path: str):
+                    relative_path = file_path[len(folder_path):].lstrip("/")
+                    target_name = self._relative_path(
+                        join_path(target_folder_path, relative_path)
+                    )
+                    await client.copy(
+                        self.bucket_name,
+                        self._relative_path(file_path),
+                        self.bucket_name,
+                        new_name=target_name,
+                    )
+                    _forget_metadata(self.bucket_name, target_name)
+
+                return await bulk_apply(_file_paths(), _copy)
 
     async def list_all_files(self, folder_path: str):
         prefix = f"{self._relative_path(folder_path)}/"
@@ -317,6 +1004,7 @@ class GoogleStorage(Storage):
                     target_bucket,
                     new_name=target_file_path,
                 )
+        _forget_metadata(target_bucket, target_file_path)
 
     @classmethod
     def new_gcs_file_adapter(cls, base_path: str) -> Self:
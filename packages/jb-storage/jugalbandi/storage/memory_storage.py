@@ -0,0 +1,209 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+from .storage import (
+    BufferedWriter,
+    BulkOperationResult,
+    BytesReader,
+    PreconditionFailedError,
+    Storage,
+    StorageEntry,
+    StorageReader,
+    StorageWriter,
+    join_path,
+)
+
+
+@dataclass
+class _MemoryObject:
+    content: bytes
+    generation: int
+    updated: datetime
+    public: bool = False
+
+
+@dataclass
+class MemoryBucket:
+    """Objects of the InMemoryStorage objects created from one another with
+    new_store, keyed by their full name."""
+
+    objects: Dict[str, _MemoryObject] = field(default_factory=dict)
+    generation: int = 0
+
+    def put(self, name: str, content: bytes):
+        self.generation += 1
+        self.objects[name] = _MemoryObject(
+            bytes(content), self.generation, datetime.now(tz=timezone.utc)
+        )
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(len(obj.content) for obj in self.objects.values())
+
+
+class InMemoryStorage(Storage):
+    """Fully functional store keeping the files in memory, for tests and
+    benchmarks. Stores created with new_store share the bucket, like folders
+    of one cloud bucket. The etag of a file is its generation, which changes
+    on every write."""
+
+    def __init__(
+        self,
+        base_path: str = "",
+        bucket: Optional[MemoryBucket] = None,
+        base_url: str = "memory://",
+    ):
+        self.base_path = base_path
+        self.bucket = bucket if bucket is not None else MemoryBucket()
+        self.base_url = base_url
+
+    def _relative_path(self, path_suffix: str) -> str:
+        if not self.base_path:
+            return path_suffix
+        elif path_suffix == "":
+            return self.base_path
+        return f"{self.base_path}/{path_suffix}"
+
+    def _prefix(self, folder_path: str) -> str:
+        name = self._relative_path(folder_path)
+        return f"{name}/" if name else ""
+
+    def _object(self, file_path: str) -> _MemoryObject:
+        obj = self.bucket.objects.get(self._relative_path(file_path))
+        if obj is None:
+            raise FileNotFoundError(f"file {file_path} not found")
+        return obj
+
+    def _objects_under(self, folder_path: str) -> Iterator[Tuple[str, _MemoryObject]]:
+        """(name relative to the folder, object), ordered by name."""
+        prefix = self._prefix(folder_path)
+        # a snapshot, the bucket may change while the caller iterates
+        for name, obj in sorted(self.bucket.objects.items()):
+            if name.startswith(prefix):
+                yield name[len(prefix):], obj
+
+    def path(self, path_suffix: str) -> str:
+        return self._relative_path(path_suffix)
+
+    async def write_file(self, file_path: str, file_content: bytes):
+        if isinstance(file_content, str):
+            file_content = file_content.encode("utf-8")
+        self.bucket.put(self._relative_path(file_path), file_content)
+
+    async def read_file(self, file_path: str) -> bytes:
+        return self._object(file_path).content
+
+    async def read_file_versioned(self, file_path: str) -> Tuple[bytes, Optional[str]]:
+        obj = self._object(file_path)
+        return obj.content, str(obj.generation)
+
+    async def write_file_if_match(
+        self, file_path: str, file_content: bytes, etag: Optional[str]
+    ) -> Optional[str]:
+        if isinstance(file_content, str):
+            file_content = file_content.encode("utf-8")
+        name = self._relative_path(file_path)
+        obj = self.bucket.objects.get(name)
+        current = str(obj.generation) if obj is not None else None
+        if current != etag:
+            raise PreconditionFailedError(
+                f"{file_path} is at version {current}, not {etag}"
+            )
+        self.bucket.put(name, file_content)
+        return str(self.bucket.generation)
+
+    async def open_read(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> StorageReader:
+        return BytesReader(self._object(file_path).content, start, end)
+
+    async def open_write(self, file_path: str) -> StorageWriter:
+        return BufferedWriter(self, file_path)
+
+    async def list_files(
+        self, folder_path: str, start_offset: str = "", end_offset: str = ""
+    ) -> AsyncIterator[str]:
+        for name, _ in self._objects_under(folder_path):
+            if "/" in name or name < start_offset:
+                continue
+            if end_offset != "" and name >= end_offset:
+                return
+            yield name
+
+    async def list_subfolders(
+        self, folder_path: str, start_offset: str = "", end_offset: str = ""
+    ) -> AsyncIterator[str]:
+        previous = None
+        for name, _ in self._objects_under(folder_path):
+            subfolder, separator, _ = name.partition("/")
+            if not separator or subfolder == previous or subfolder < start_offset:
+                continue
+            if end_offset != "" and subfolder >= end_offset:
+                return
+            previous = subfolder
+            yield subfolder
+
+    async def list_entries(
+        self, folder_path: str, recursive: bool = True
+    ) -> AsyncIterator[StorageEntry]:
+        for name, obj in list(self._objects_under(folder_path)):
+            if recursive or "/" not in name:
+                yield StorageEntry(
+                    name=name,
+                    size=len(obj.content),
+                    etag=str(obj.generation),
+                    updated=obj.updated,
+                )
+
+    async def remove_file(self, file_path: str):
+        if self.bucket.objects.pop(self._relative_path(file_path), None) is None:
+            raise FileNotFoundError(f"file {file_path} not found")
+
+    async def delete_prefix(self, folder_path: str) -> BulkOperationResult:
+        result = BulkOperationResult()
+        for name, _ in list(self._objects_under(folder_path)):
+            file_path = join_path(folder_path, name)
+            self.bucket.objects.pop(self._relative_path(file_path), None)
+            result.processed.append(file_path)
+        return result
+
+    async def copy_prefix(
+        self, folder_path: str, target_folder_path: str
+    ) -> BulkOperationResult:
+        result = BulkOperationResult()
+        for name, obj in list(self._objects_under(folder_path)):
+            target_path = join_path(target_folder_path, name)
+            self.bucket.put(self._relative_path(target_path), obj.content)
+            result.processed.append(join_path(folder_path, name))
+        return result
+
+    async def make_public(self, file_path: str) -> str:
+        self._object(file_path).public = True
+        return await self.public_url(file_path)
+
+    async def public_url(self, file_path: str) -> str:
+        return f"{self.base_url}{quote(self._relative_path(file_path), safe='/~')}"
+
+    def is_public(self, file_path: str) -> bool:
+        return self._object(file_path).public
+
+    async def file_exists(self, file_name: str) -> bool:
+        return self._relative_path(file_name) in self.bucket.objects
+
+    async def stat(self, file_path: str) -> StorageEntry:
+        obj = self._object(file_path)
+        return StorageEntry(
+            name=file_path,
+            size=len(obj.content),
+            etag=str(obj.generation),
+            updated=obj.updated,
+        )
+
+    def new_store(self, folder_suffix: str) -> "InMemoryStorage":
+        return InMemoryStorage(
+            self._relative_path(folder_suffix), self.bucket, self.base_url
+        )
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,255 @@
+import asyncio
+import random
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+from .storage import (
+    STREAM_CHUNK_SIZE,
+    BulkOperationResult,
+    ReadTarget,
+    Storage,
+    StorageEntry,
+    StorageReader,
+    StorageWrapper,
+    StorageWriter,
+)
+
+
+class InjectedFaultError(ConnectionError):
+    """Failure of a request injected by SimulatedStorage."""
+
+
+@dataclass
+class SimulationProfile:
+    # seconds added to every request
+    latency: float = 0.0
+    # up to this many seconds of random extra latency per request
+    jitter: float = 0.0
+    # latency of single operations (e.g. "list_entries"), instead of latency
+    operation_latency: Dict[str, float] = field(default_factory=dict)
+    # bytes per second of a transfer, None for unlimited
+    bandwidth: Optional[float] = None
+    # probability of a request failing with InjectedFaultError
+    error_rate: float = 0.0
+    operation_error_rate: Dict[str, float] = field(default_factory=dict)
+    # makes the jitter and the injected failures reproducible
+    seed: Optional[int] = None
+
+
+@dataclass
+class SimulationStats:
+    # operation -> number of requests
+    requests: Dict[str, int] = field(default_factory=dict)
+    faults: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    # seconds spent in simulated latency and transfers
+    delay: float = 0.0
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+
+class SimulatedStorage(StorageWrapper):
+    """Makes a (local or in-memory) store behave like a remote one, by adding
+    latency and bandwidth limits to its operations and failing a share of the
+    requests. Requests are counted per operation, so that e.g. caching
+    strategies can be compared by the requests they save.
+
+    Failures are injected before the wrapped operation runs, so a failed
+    request never has a partial effect.
+    """
+
+    def __init__(
+        self,
+        store: Storage,
+        profile: Optional[SimulationProfile] = None,
+        stats: Optional[SimulationStats] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        super().__init__(store)
+        self.profile = profile or SimulationProfile()
+        self._stats = stats if stats is not None else SimulationStats()
+        self._random = rng or random.Random(self.profile.seed)
+
+    async def _delay(self, seconds: float):
+        if seconds > 0:
+            self._stats.delay += seconds
+            await asyncio.sleep(seconds)
+
+    async def _request(self, operation: str):
+        self._stats.requests[operation] = self._stats.requests.get(operation, 0) + 1
+        latency = self.profile.operation_latency.get(operation, self.profile.latency)
+        await self._delay(latency + self.profile.jitter * self._random.random())
+        error_rate = self.profile.operation_error_rate.get(
+            operation, self.profile.error_rate
+        )
+        if error_rate > 0 and self._random.random() < error_rate:
+            self._stats.faults += 1
+            raise InjectedFaultError(f"injected failure of {operation}")
+
+    async def _transfer(self, size: int):
+        if self.profile.bandwidth:
+            await self._delay(size / self.profile.bandwidth)
+
+    async def _read(self, size: int):
+        self._stats.bytes_read += size
+        await self._transfer(size)
+
+    async def _written(self, size: int):
+        self._stats.bytes_written += size
+        await self._transfer(size)
+
+    async def write_file(self, file_path: str, file_content: bytes):
+        await self._request("write_file")
+        await self._written(len(file_content))
+        await self.store.write_file(file_path, file_content)
+
+    async def read_file(self, file_path: str) -> bytes:
+        await self._request("read_file")
+        content = await self.store.read_file(file_path)
+        await self._read(len(content))
+        return content
+
+    async def read_file_versioned(self, file_path: str) -> Tuple[bytes, Optional[str]]:
+        # one request, as with stores that return the version with the content
+        await self._request("read_file_versioned")
+        content, etag = await self.store.read_file_versioned(file_path)
+        await self._read(len(content))
+        return content, etag
+
+    async def write_file_if_match(
+        self, file_path: str, file_content: bytes, etag: Optional[str]
+    ) -> Optional[str]:
+        await self._request("write_file_if_match")
+        await self._written(len(file_content))
+        return await self.store.write_file_if_match(file_path, file_content, etag)
+
+    async def open_read(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> StorageReader:
+        await self._request("open_read")
+        return _SimulatedReader(await self.store.open_read(file_path, start, end), self)
+
+    async def open_write(self, file_path: str) -> StorageWriter:
+        await self._request("open_write")
+        return _SimulatedWriter(await self.store.open_write(file_path), self)
+
+    async def read_into(self, file_path: str, target: ReadTarget) -> int:
+        await self._request("read_into")
+        size = await self.store.read_into(file_path, target)
+        await self._read(size)
+        return size
+
+    async def list_files(
+        self, folder_path: str, start_offset: str = "", end_offset: str = ""
+    ) -> AsyncIterator[str]:
+        await self._request("list_files")
+        async for file_name in self.store.list_files(
+            folder_path, start_offset, end_offset
+        ):
+            yield file_name
+
+    async def list_subfolders(
+        self, folder_path: str, start_offset: str = "", end_offset: str = ""
+    ) -> AsyncIterator[str]:
+        await self._request("list_subfolders")
+        async for folder_name in self.store.list_subfolders(
+            folder_path, start_offset, end_offset
+        ):
+            yield folder_name
+
+    async def list_entries(
+        self, folder_path: str, recursive: bool = True
+    ) -> AsyncIterator[StorageEntry]:
+        await self._request("list_entries")
+        async for entry in self.store.list_entries(folder_path, recursive):
+            yield entry
+
+    async def exists_many(self, file_paths: Iterable[str]) -> Dict[str, bool]:
+        await self._request("exists_many")
+        return await self.store.exists_many(file_paths)
+
+    async def delete_prefix(self, folder_path: str) -> BulkOperationResult:
+        await self._request("delete_prefix")
+        return await self.store.delete_prefix(folder_path)
+
+    async def copy_prefix(
+        self, folder_path: str, target_folder_path: str
+    ) -> BulkOperationResult:
+        await self._request("copy_prefix")
+        return await self.store.copy_prefix(folder_path, target_folder_path)
+
+    async def remove_file(self, file_path: str):
+        await self._request("remove_file")
+        await super().remove_file(file_path)
+
+    async def make_public(self, file_path: str) -> str:
+        await self._request("make_public")
+        return await self.store.make_public(file_path)
+
+    async def public_url(self, file_path: str) -> str:
+        await self._request("public_url")
+        return await self.store.public_url(file_path)
+
+    async def file_exists(self, file_name: str) -> bool:
+        await self._request("file_exists")
+        return await self.store.file_exists(file_name)
+
+    async def stat(self, file_path: str) -> StorageEntry:
+        await self._request("stat")
+        return await self.store.stat(file_path)
+
+    def new_store(self, folder_suffix: str) -> "SimulatedStorage":
+        # the stores of one simulation share the statistics
+        return SimulatedStorage(
+            self.store.new_store(folder_suffix), self.profile, self._stats, self._random
+        )
+
+    def stats(self) -> SimulationStats:
+        return SimulationStats(
+            requests=dict(self._stats.requests),
+            faults=self._stats.faults,
+            bytes_read=self._stats.bytes_read,
+            bytes_written=self._stats.bytes_written,
+            delay=self._stats.delay,
+        )
+
+    def reset_stats(self):
+        self._stats.requests.clear()
+        self._stats.faults = 0
+        self._stats.bytes_read = 0
+        self._stats.bytes_written = 0
+        self._stats.delay = 0.0
+
+
+class _SimulatedReader(StorageReader):
+    def __init__(self, reader: StorageReader, storage: SimulatedStorage):
+        super().__init__(reader.size, reader.start, reader.end)
+        self.reader = reader
+        self.storage = storage
+
+    async def _read_chunk(self) -> bytes:
+        chunk = await self.reader.read(STREAM_CHUNK_SIZE)
+        await self.storage._read(len(chunk))
+        return chunk
+
+    async def close(self):
+        await self.reader.close()
+
+
+class _SimulatedWriter(StorageWriter):
+    def __init__(self, writer: StorageWriter, storage: SimulatedStorage):
+        super().__init__()
+        self.writer = writer
+        self.storage = storage
+
+    async def _write(self, data: bytes):
+        await self.storage._written(len(data))
+        await self.writer.write(data)
+
+    async def close(self):
+        await self.writer.close()
+
+    async def abort(self):
+        await self.writer.abort()
@@ -1,6 +1,23 @@
 from abc import ABC, abstractmethod
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 import os
-from typing import AsyncIterator, Self
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Self,
+    Tuple,
+    Union,
+)
+import shutil
+import tempfile
 from aiofiles import os as aiofiles_os
 import aiofiles
 import logging
@@ -8,6 +25,288 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class StorageEntry:
+    name: str
+    size: Optional[int] = None
+    # changes whenever the content changes (ETag, generation or mtime based)
+    etag: Optional[str] = None
+    updated: Optional[datetime] = None
+
+
+class PreconditionFailedError(Exception):
+    """A conditional write found the file changed since the version it was
+    conditioned on."""
+
+
+@dataclass
+class BulkOperationResult:
+    # store relative paths of the files that were deleted or copied
+    processed: List[str] = field(default_factory=list)
+    # path -> error message
+    failures: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return len(self.failures) == 0
+
+
+# concurrent requests of delete_prefix and copy_prefix
+BULK_CONCURRENCY = int(os.getenv("STORAGE_BULK_CONCURRENCY", "32"))
+
+
+async def bulk_apply(
+    file_paths: AsyncIterator[str],
+    operation: Callable[[str], Awaitable[Any]],
+    concurrency: int = BULK_CONCURRENCY,
+) -> BulkOperationResult:
+    """Runs operation for every path with at most concurrency operations in
+    flight, collecting failures instead of stopping at the first one."""
+    result = BulkOperationResult()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _apply(file_path: str):
+        try:
+            await operation(file_path)
+            result.processed.append(file_path)
+        except Exception as e:
+            result.failures[file_path] = str(e) or type(e).__name__
+        finally:
+            semaphore.release()
+
+    async with asyncio.TaskGroup() as task_group:
+        async for file_path in file_paths:
+            await semaphore.acquire()
+            task_group.create_task(_apply(file_path))
+    return result
+
+
+def join_path(folder_path: str, name: str) -> str:
+    return f"{folder_path}/{name}" if folder_path else name
+
+
+# a local file path or a preallocated writable buffer (bytearray, memoryview)
+ReadTarget = Union[str, bytearray, memoryview]
+
+
+@dataclass
+class TransferConfig:
+    part_size: int = 8 * 1024 * 1024
+    max_concurrency: int = 8
+    # objects smaller than this are transferred in a single request
+    threshold: int = 16 * 1024 * 1024
+
+    @classmethod
+    def from_env(cls) -> "TransferConfig":
+        return cls(
+            part_size=int(os.getenv("STORAGE_TRANSFER_PART_SIZE", str(cls.part_size))),
+            max_concurrency=int(
+                os.getenv("STORAGE_TRANSFER_CONCURRENCY", str(cls.max_concurrency))
+            ),
+            threshold=int(os.getenv("STORAGE_TRANSFER_THRESHOLD", str(cls.threshold))),
+        )
+
+
+def create_temp_file(file_path: str) -> Tuple[int, str]:
+    """Creates a uniquely named temporary file next to file_path, to be
+    renamed into place once complete, and returns its descriptor and path.
+    Concurrent writers of the same file each get their own; the name ends in
+    ``.part`` so listings skip it."""
+    dirname = os.path.dirname(file_path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        dir=dirname or ".", prefix=f"{os.path.basename(file_path)}.", suffix=".part"
+    )
+    os.fchmod(fd, 0o644)
+    return fd, temp_path
+
+
+async def remove_temp_file(temp_path: str):
+    try:
+        await aiofiles_os.remove(temp_path)
+    except FileNotFoundError:
+        pass
+
+
+async def write_local_file(file_path: str, content: bytes):
+    """Writes content to a temporary file next to file_path and renames it
+    into place, so that readers never see a partially written file."""
+    fd, temp_path = create_temp_file(file_path)
+    try:
+        async with aiofiles.open(fd, "wb") as f:
+            await f.write(content)
+        await aiofiles_os.replace(temp_path, file_path)
+    except BaseException:
+        await remove_temp_file(temp_path)
+        raise
+
+
+def write_into_buffer(
+    buffer: Union[bytearray, memoryview], offset: int, content: bytes
+):
+    view = memoryview(buffer)
+    if offset + len(content) > len(view):
+        raise ValueError(
+            f"buffer of {len(view)} bytes is too small "
+            f"for {offset + len(content)} bytes"
+        )
+    view[offset:offset + len(content)] = content
+
+
+# chunk size of the streams returned by open_read
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def resolve_range(
+    size: int, start: int = 0, end: Optional[int] = None
+) -> Tuple[int, int]:
+    """Clamps the byte range [start, end) to a file of the given size."""
+    end = size if end is None else min(end, size)
+    if start < 0 or start > end:
+        raise ValueError(f"byte range {start}-{end} not satisfiable for {size} bytes")
+    return start, end
+
+
+class StorageReader(ABC):
+    """Async stream over the bytes [start, end) of a stored file. ``size`` is
+    the size of the whole file. Use as ``async with await store.open_read(...)``
+    or iterate it with ``async for chunk in reader``."""
+
+    def __init__(self, size: int, start: int, end: int):
+        self.size = size
+        self.start = start
+        self.end = end
+        self._pending = b""
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+    @abstractmethod
+    async def _read_chunk(self) -> bytes:
+        """Next chunk of the stream, b"" at the end."""
+        pass
+
+    async def read(self, size: int = -1) -> bytes:
+        chunks: List[bytes] = [self._pending]
+        available = len(self._pending)
+        while size < 0 or available < size:
+            chunk = await self._read_chunk()
+            if not chunk:
+                break
+            chunks.append(chunk)
+            available += len(chunk)
+        content = b"".join(chunks)
+        if size < 0:
+            self._pending = b""
+            return content
+        self._pending = content[size:]
+        return content[:size]
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self._pending:
+            chunk, self._pending = self._pending, b""
+            yield chunk
+        while chunk := await self._read_chunk():
+            yield chunk
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class BytesReader(StorageReader):
+    def __init__(self, content: bytes, start: int = 0, end: Optional[int] = None):
+        start, end = resolve_range(len(content), start, end)
+        super().__init__(len(content), start, end)
+        self._view = memoryview(content)[start:end]
+
+    async def _read_chunk(self) -> bytes:
+        chunk = self._view[:STREAM_CHUNK_SIZE].tobytes()
+        self._view = self._view[len(chunk):]
+        return chunk
+
+
+class EmptyRangeReader(StorageReader):
+    """Reader of an empty byte range, which can not be requested from remote
+    stores with a Range header."""
+
+    def __init__(self, size: int, position: int):
+        super().__init__(size, position, position)
+
+    async def _read_chunk(self) -> bytes:
+        return b""
+
+
+class StorageWriter(ABC):
+    """Async sink for a stored file. The file only appears (or is replaced)
+    when the writer is closed; abort() discards what was written. Used as an
+    async context manager it closes on success and aborts on error."""
+
+    def __init__(self):
+        self.bytes_written = 0
+
+    async def write(self, data: bytes):
+        await self._write(data)
+        self.bytes_written += len(data)
+
+    @abstractmethod
+    async def _write(self, data: bytes):
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def abort(self):
+        pass
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            await self.close()
+        else:
+            await self.abort()
+
+
+class BufferedWriter(StorageWriter):
+    """Collects the content in memory and stores it with write_file on close,
+    for stores without a native streaming upload."""
+
+    def __init__(self, store: "Storage", file_path: str):
+        super().__init__()
+        self.store = store
+        self.file_path = file_path
+        self._chunks: List[bytes] = []
+
+    async def _write(self, data: bytes):
+        self._chunks.append(bytes(data))
+
+    async def close(self):
+        await self.store.write_file(self.file_path, b"".join(self._chunks))
+        self._chunks = []
+
+    async def abort(self):
+        self._chunks = []
+
+
+async def write_into_target(target: ReadTarget, content: bytes) -> int:
+    if isinstance(target, str):
+        await write_local_file(target, content)
+    else:
+        write_into_buffer(target, 0, content)
+    return len(content)
+
+
 class Storage(ABC):
     @abstractmethod
     async def write_file(self, file_path: str, file_content: bytes):
@@ -17,6 +316,36 @@ class Storage(ABC):
     async def read_file(self, file_path: str) -> bytes:
         pass
 
+    async def read_file_versioned(self, file_path: str) -> Tuple[bytes, Optional[str]]:
+        """Content of a file with the version to pass to write_file_if_match.
+        Raises FileNotFoundError if it does not exist."""
+        # stat first: a change between the two calls fails the conditional
+        # write instead of passing it with the older content
+        entry = await self.stat(file_path)
+        return await self.read_file(file_path), entry.etag
+
+    async def write_file_if_match(
+        self, file_path: str, file_content: bytes, etag: Optional[str]
+    ) -> Optional[str]:
+        """Writes a file only if it is still at version etag (or, for None,
+        does not exist), raises PreconditionFailedError otherwise. Returns the
+        version written.
+
+        Stores with write preconditions (GCS generations, Azure ETags, memory)
+        check and write atomically; this default checks then writes, which only
+        narrows the window of a lost update.
+        """
+        try:
+            current: Optional[str] = (await self.stat(file_path)).etag
+        except FileNotFoundError:
+            current = None
+        if current != etag:
+            raise PreconditionFailedError(
+                f"{file_path} is at version {current}, not {etag}"
+            )
+        await self.write_file(file_path, file_content)
+        return (await self.stat(file_path)).etag
+
     @abstractmethod
     def path(self, path_suffix: str) -> str:
         pass
@@ -33,6 +362,55 @@ class Storage(ABC):
     ) -> AsyncIterator[str]:
         pass
 
+    @abstractmethod
+    def list_entries(
+        self, folder_path: str, recursive: bool = True
+    ) -> AsyncIterator[StorageEntry]:
+        """Files under folder_path with their metadata, from a single (paged)
+        listing. Names are relative to folder_path."""
+        pass
+
+    async def exists_many(self, file_paths: Iterable[str]) -> Dict[str, bool]:
+        """Resolves the existence of many files with one listing of their
+        deepest common folder instead of a request per file."""
+        file_paths = list(dict.fromkeys(file_paths))
+        if len(file_paths) == 1:
+            return {file_paths[0]: await self.file_exists(file_paths[0])}
+        if len(file_paths) == 0:
+            return {}
+
+        folders = [file_path.split("/")[:-1] for file_path in file_paths]
+        common: List[str] = []
+        for parts in zip(*folders):
+            if any(part != parts[0] for part in parts):
+                break
+            common.append(parts[0])
+        folder_path = "/".join(common)
+        prefix_length = len(folder_path) + 1 if folder_path else 0
+        relative_paths = {
+            file_path[prefix_length:]: file_path for file_path in file_paths
+        }
+
+        result = {file_path: False for file_path in file_paths}
+        async for entry in self.list_entries(folder_path):
+            file_path = relative_paths.get(entry.name)
+            if file_path is not None:
+                result[file_path] = True
+        return result
+
+    @abstractmethod
+    async def delete_prefix(self, folder_path: str) -> BulkOperationResult:
+        """Deletes every file under folder_path (all pages of the listing)."""
+        pass
+
+    @abstractmethod
+    async def copy_prefix(
+        self, folder_path: str, target_folder_path: str
+    ) -> BulkOperationResult:
+        """Copies every file under folder_path to the same relative path under
+        target_folder_path in this store."""
+        pass
+
     @abstractmethod
     async def make_public(self, file_path: str) -> str:
         pass
@@ -45,6 +423,57 @@ class Storage(ABC):
     async def file_exists(self, file_name: str) -> bool:
         pass
 
+    @abstractmethod
+    async def stat(self, file_path: str) -> StorageEntry:
+        """Metadata of a file, raises FileNotFoundError if it does not exist."""
+        pass
+
+    @abstractmethod
+    async def open_read(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> StorageReader:
+        """Streams the bytes [start, end) of a file, raises FileNotFoundError
+        if it does not exist and ValueError for a range outside of the file."""
+        pass
+
+    @abstractmethod
+    async def open_write(self, file_path: str) -> StorageWriter:
+        pass
+
+    async def read_into(self, file_path: str, target: ReadTarget) -> int:
+        """Reads a file straight into a local file or a preallocated buffer and
+        returns the number of bytes read. Remote stores override this with
+        parallel ranged downloads."""
+        async with await self.open_read(file_path) as reader:
+            if not isinstance(target, str):
+                offset = 0
+                async for chunk in reader:
+                    write_into_buffer(target, offset, chunk)
+                    offset += len(chunk)
+                return offset
+
+            fd, temp_path = create_temp_file(target)
+            try:
+                async with aiofiles.open(fd, "wb") as f:
+                    async for chunk in reader:
+                        await f.write(chunk)
+                await aiofiles_os.replace(temp_path, target)
+            except BaseException:
+                await remove_temp_file(temp_path)
+                raise
+            return reader.length
+
+    async def read_derived(self, file_path: str, name: str) -> Optional[bytes]:
+        """Artifact (e.g. extracted text) derived from the content of a file,
+        None unless the store shares artifacts between files of the same
+        content (ContentAddressedStorage) and has this one."""
+        return None
+
+    async def write_derived(self, file_path: str, name: str, content: bytes) -> bool:
+        """Stores an artifact derived from the content of a file, returns False
+        if the store does not keep artifacts for it."""
+        return False
+
     @abstractmethod
     def new_store(self, folder_suffix: str) -> Self:
         pass
@@ -75,6 +504,21 @@ class LocalStorage(Storage):
         async with aiofiles.open(self.path(file_suffix), "rb") as f:
             return await f.read()
 
+    async def open_read(
+        self, file_suffix: str, start: int = 0, end: Optional[int] = None
+    ) -> StorageReader:
+        file_path = self.path(file_suffix)
+        size = (await aiofiles_os.stat(file_path)).st_size
+        start, end = resolve_range(size, start, end)
+        f = await aiofiles.open(file_path, "rb")
+        await f.seek(start)
+        return LocalFileReader(f, size, start, end)
+
+    async def open_write(self, file_suffix: str) -> StorageWriter:
+        file_path = self.path(file_suffix)
+        fd, temp_path = create_temp_file(file_path)
+        return LocalFileWriter(await aiofiles.open(fd, "wb"), temp_path, file_path)
+
     def path(self, path_suffix: str):
         return f"{self.base_dir}/{path_suffix}"
 
@@ -91,6 +535,36 @@ class LocalStorage(Storage):
     ) -> AsyncIterator[str]:
         raise NotImplementedError("method make_public not implemented")
 
+    async def list_entries(
+        self, folder_path: str, recursive: bool = True
+    ) -> AsyncIterator[StorageEntry]:
+        root = self.path(folder_path).rstrip("/")
+        entries = await asyncio.to_thread(_scan_local_entries, root, recursive)
+        for entry in entries:
+            yield entry
+
+    async def _file_paths(self, folder_path: str) -> AsyncIterator[str]:
+        async for entry in self.list_entries(folder_path):
+            yield join_path(folder_path, entry.name)
+
+    async def delete_prefix(self, folder_path: str) -> BulkOperationResult:
+        return await bulk_apply(
+            self._file_paths(folder_path),
+            lambda file_path: aiofiles_os.remove(self.path(file_path)),
+        )
+
+    async def copy_prefix(
+        self, folder_path: str, target_folder_path: str
+    ) -> BulkOperationResult:
+        async def _copy(file_path: str):
+            target_path = self.path(
+                join_path(target_folder_path, file_path[len(folder_path):].lstrip("/"))
+            )
+            await self._make_dir_for_file(target_path)
+            await asyncio.to_thread(shutil.copy2, self.path(file_path), target_path)
+
+        return await bulk_apply(self._file_paths(folder_path), _copy)
+
     async def make_public(self, file_path: str) -> str:
         raise NotImplementedError("method make_public not implemented")
 
@@ -100,6 +574,15 @@ class LocalStorage(Storage):
     async def file_exists(self, file_name: str) -> bool:
         return await aiofiles_os.path.exists(self.path(file_name))
 
+    async def stat(self, file_path: str) -> StorageEntry:
+        stat_result = await aiofiles_os.stat(self.path(file_path))
+        return StorageEntry(
+            name=file_path,
+            size=stat_result.st_size,
+            etag=f"{stat_result.st_mtime_ns}-{stat_result.st_size}",
+            updated=datetime.fromtimestamp(stat_result.st_mtime, tz=timezone.utc),
+        )
+
     def new_store(self, folder_suffix: str) -> "LocalStorage":
         folder_path = self.path(folder_suffix)
         return LocalStorage(folder_path)
@@ -108,6 +591,76 @@ class LocalStorage(Storage):
         pass
 
 
+def _scan_local_entries(root: str, recursive: bool) -> List[StorageEntry]:
+    entries = []
+    folders = [root]
+    while folders:
+        folder = folders.pop()
+        try:
+            dir_iterator = os.scandir(folder)
+        except FileNotFoundError:
+            continue
+        with dir_iterator:
+            for dir_entry in dir_iterator:
+                if dir_entry.is_dir():
+                    if recursive:
+                        folders.append(dir_entry.path)
+                    continue
+                if not dir_entry.is_file() or dir_entry.name.endswith(".part"):
+                    continue
+                stat_result = dir_entry.stat()
+                updated = datetime.fromtimestamp(
+                    stat_result.st_mtime, tz=timezone.utc
+                )
+                entries.append(
+                    StorageEntry(
+                        name=os.path.relpath(dir_entry.path, root),
+                        size=stat_result.st_size,
+                        etag=f"{stat_result.st_mtime_ns}-{stat_result.st_size}",
+                        updated=updated,
+                    )
+                )
+    return entries
+
+
+class LocalFileReader(StorageReader):
+    def __init__(self, f, size: int, start: int, end: int):
+        super().__init__(size, start, end)
+        self._file = f
+        self._remaining = end - start
+
+    async def _read_chunk(self) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        chunk = await self._file.read(min(STREAM_CHUNK_SIZE, self._remaining))
+        self._remaining -= len(chunk)
+        return chunk
+
+    async def close(self):
+        await self._file.close()
+
+
+class LocalFileWriter(StorageWriter):
+    """Writes to a temporary file that is renamed into place on close."""
+
+    def __init__(self, f, temp_path: str, file_path: str):
+        super().__init__()
+        self._file = f
+        self.temp_path = temp_path
+        self.file_path = file_path
+
+    async def _write(self, data: bytes):
+        await self._file.write(data)
+
+    async def close(self):
+        await self._file.close()
+        await aiofiles_os.replace(self.temp_path, self.file_path)
+
+    async def abort(self):
+        await self._file.close()
+        await remove_temp_file(self.temp_path)
+
+
 class NullStorage(Storage):
     async def write_file(self, file_path: str, file_content: bytes):
         pass
@@ -115,13 +668,40 @@ class NullStorage(Storage):
     async def read_file(self, file_path: str) -> bytes:
         return b""
 
+    async def open_read(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> StorageReader:
+        return BytesReader(b"", start, end)
+
+    async def open_write(self, file_path: str) -> StorageWriter:
+        return BufferedWriter(self, file_path)
+
     def path(self, path_suffix: str):
         return path_suffix
 
-    def list_files(
+    async def list_files(
         self, folder_path: str, start_offset: str = "", end_offset: str = ""
     ):
-        yield from ()
+        for file_name in ():
+            yield file_name
+
+    async def list_subfolders(
+        self, folder_path: str, start_offset: str = "", end_offset: str = ""
+    ):
+        for folder_name in ():
+            yield folder_name
+
+    async def list_entries(self, folder_path: str, recursive: bool = True):
+        for entry in ():
+            yield entry
+
+    async def delete_prefix(self, folder_path: str) -> BulkOperationResult:
+        return BulkOperationResult()
+
+    async def copy_prefix(
+        self, folder_path: str, target_folder_path: str
+    ) -> BulkOperationResult:
+        return BulkOperationResult()
 
     async def make_public(self, file_path: str) -> str:
         return file_path
@@ -134,3 +714,103 @@ class NullStorage(Storage):
 
     async def file_exists(self, file_name: str) -> bool:
         return False
+
+    async def write_file_if_match(
+        self, file_path: str, file_content: bytes, etag: Optional[str]
+    ) -> Optional[str]:
+        return None
+
+    async def stat(self, file_path: str) -> StorageEntry:
+        raise FileNotFoundError(f"file {file_path} not found")
+
+    def new_store(self, folder_suffix: str) -> "NullStorage":
+        return NullStorage()
+
+
+class StorageWrapper(Storage):
+    """Base class for stores that add behaviour around another store. Every
+    operation of Storage, and remove_file, is delegated to the wrapped store;
+    subclasses override the ones they change and implement new_store. Other
+    provider specific operations are not passed through, so that they cannot
+    bypass the wrapper."""
+
+    def __init__(self, store: Storage):
+        self.store = store
+
+    async def write_file(self, file_path: str, file_content: bytes):
+        await self.store.write_file(file_path, file_content)
+
+    async def read_file(self, file_path: str) -> bytes:
+        return await self.store.read_file(file_path)
+
+    async def read_file_versioned(self, file_path: str) -> Tuple[bytes, Optional[str]]:
+        return await self.store.read_file_versioned(file_path)
+
+    async def write_file_if_match(
+        self, file_path: str, file_content: bytes, etag: Optional[str]
+    ) -> Optional[str]:
+        return await self.store.write_file_if_match(file_path, file_content, etag)
+
+    def path(self, path_suffix: str) -> str:
+        return self.store.path(path_suffix)
+
+    def list_files(
+        self, folder_path: str, start_offset: str = "", end_offset: str = ""
+    ) -> AsyncIterator[str]:
+        return self.store.list_files(folder_path, start_offset, end_offset)
+
+    def list_subfolders(
+        self, folder_path: str, start_offset: str = "", end_offset: str = ""
+    ) -> AsyncIterator[str]:
+        return self.store.list_subfolders(folder_path, start_offset, end_offset)
+
+    def list_entries(
+        self, folder_path: str, recursive: bool = True
+    ) -> AsyncIterator[StorageEntry]:
+        return self.store.list_entries(folder_path, recursive)
+
+    async def exists_many(self, file_paths: Iterable[str]) -> Dict[str, bool]:
+        return await self.store.exists_many(file_paths)
+
+    async def delete_prefix(self, folder_path: str) -> BulkOperationResult:
+        return await self.store.delete_prefix(folder_path)
+
+    async def copy_prefix(
+        self, folder_path: str, target_folder_path: str
+    ) -> BulkOperationResult:
+        return await self.store.copy_prefix(folder_path, target_folder_path)
+
+    async def make_public(self, file_path: str) -> str:
+        return await self.store.make_public(file_path)
+
+    async def public_url(self, file_path: str) -> str:
+        return await self.store.public_url(file_path)
+
+    async def file_exists(self, file_name: str) -> bool:
+        return await self.store.file_exists(file_name)
+
+    async def stat(self, file_path: str) -> StorageEntry:
+        return await self.store.stat(file_path)
+
+    async def open_read(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> StorageReader:
+        return await self.store.open_read(file_path, start, end)
+
+    async def open_write(self, file_path: str) -> StorageWriter:
+        return await self.store.open_write(file_path)
+
+    async def read_into(self, file_path: str, target: ReadTarget) -> int:
+        return await self.store.read_into(file_path, target)
+
+    async def remove_file(self, file_path: str):
+        await self.store.remove_file(file_path)  # type: ignore[attr-defined]
+
+    async def read_derived(self, file_path: str, name: str) -> Optional[bytes]:
+        return await self.store.read_derived(file_path, name)
+
+    async def write_derived(self, file_path: str, name: str, content: bytes) -> bool:
+        return await self.store.write_derived(file_path, name, content)
+
+    async def shutdown(self):
+        await self.store.shutdown()
@@ -0,0 +1,18 @@
+import inspect
+import pytest
+import pytest_asyncio
+
+from jugalbandi.storage import InMemoryStorage
+
+
+@pytest_asyncio.fixture()
+async def memory_store():
+    store = InMemoryStorage("testing")
+    yield store
+    await store.shutdown()
+
+
+def pytest_collection_modifyitems(config, items):
+    for item in items:
+        if inspect.iscoroutinefunction(item.function):
+            item.add_marker(pytest.mark.asyncio)
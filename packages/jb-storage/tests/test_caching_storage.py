@@ -0,0 +1,87 @@
+import os
+import time
+from jugalbandi.storage import (
+    CachingStorage,
+    DiskCache,
+    InMemoryStorage,
+    SimulatedStorage,
+)
+
+
+async def test_read_into_uses_the_ranged_download(
+    memory_store: InMemoryStorage, tmp_path
+):
+    remote = SimulatedStorage(memory_store)
+    await remote.write_file("index/index.faiss", b"i" * 2048)
+    await remote.write_file("doc/metadata.json", b"{}")
+    store = CachingStorage(remote, DiskCache(str(tmp_path / "cache"), 1024))
+    remote.reset_stats()
+
+    # larger than the cache, downloaded by the wrapped store each time
+    for _ in range(2):
+        target = str(tmp_path / "index.faiss")
+        assert await store.read_into("index/index.faiss", target) == 2048
+    assert remote.stats().requests == {"stat": 1, "read_into": 2}
+
+    # a cached copy is served without download
+    assert await store.read_file("doc/metadata.json") == b"{}"
+    remote.reset_stats()
+    buffer = bytearray(2)
+    assert await store.read_into("doc/metadata.json", buffer) == 2
+    assert buffer == b"{}"
+    assert remote.stats().requests == {}
+
+
+async def test_processes_share_the_size_of_the_directory(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    # one per worker process on the same directory
+    caches = [DiskCache(cache_dir, 250), DiskCache(cache_dir, 250)]
+
+    for index in range(6):
+        cache = caches[index % 2]
+        await cache.put(cache.key(f"file-{index}"), "1", b"x" * 100)
+    assert caches[0].stats().size_bytes == caches[1].stats().size_bytes == 200
+    # the most recent ones, whichever process wrote them
+    assert await caches[0].read(caches[0].key("file-5"), "1") == b"x" * 100
+    assert await caches[1].read(caches[1].key("file-4"), "1") == b"x" * 100
+    assert await caches[0].read(caches[0].key("file-3"), "1") is None
+
+
+async def test_read_entries_are_evicted_last(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), 250)
+    await cache.put(cache.key("a"), "1", b"x" * 100)
+    await cache.put(cache.key("b"), "1", b"x" * 100)
+    # a is older than b
+    for name, age in [("a", 60), ("b", 30)]:
+        written = time.time() - age
+        os.utime(cache._versions(cache.key(name))[0], (written, written))
+
+    assert await cache.read(cache.key("a"), "1") is not None
+    await cache.put(cache.key("c"), "1", b"x" * 100)
+    assert await cache.read(cache.key("b"), "1") is None
+    assert await cache.read(cache.key("a"), "1") is not None
+    assert cache.stats().evictions == 1
+
+
+async def test_new_etag_replaces_the_cached_copy(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), 1024)
+    key = cache.key("a")
+    await cache.put(key, "1", b"old")
+    await cache.put(key, "2", b"new")
+
+    assert await cache.read(key, "1") is None
+    assert await cache.read(key, "2") == b"new"
+    assert (cache.stats().stale, cache.stats().entries) == (1, 1)
+
+
+async def test_only_abandoned_temp_files_are_removed(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    abandoned, in_progress = cache_dir / "a-1.x.tmp", cache_dir / "b-1.y.tmp"
+    abandoned.write_bytes(b"x")
+    in_progress.write_bytes(b"x")
+    two_hours_ago = time.time() - 7200
+    os.utime(abandoned, (two_hours_ago, two_hours_ago))
+
+    DiskCache(str(cache_dir), 1024)
+    assert sorted(os.listdir(cache_dir)) == ["b-1.y.tmp"]
@@ -0,0 +1,81 @@
+from jugalbandi.storage import CompressedStorage, InMemoryStorage, SimulatedStorage
+from jugalbandi.storage.compressed_storage import is_compressed
+
+TEXT = ("Section 302. Punishment for murder. " * 200).encode("utf-8")
+
+
+async def test_files_are_compressed(memory_store: InMemoryStorage):
+    store = CompressedStorage(memory_store)
+    await store.write_file("doc/content.txt", TEXT)
+    await store.write_file("doc/small.json", b"{}")
+    await store.write_file("doc/act.pdf", TEXT)
+
+    assert is_compressed(await memory_store.read_file("doc/content.txt"))
+    assert await memory_store.read_file("doc/small.json") == b"{}"
+    assert await memory_store.read_file("doc/act.pdf") == TEXT
+    assert await store.read_file("doc/content.txt") == TEXT
+    async with await store.open_read("doc/content.txt", 8, 12) as reader:
+        assert await reader.read() == TEXT[8:12]
+    assert store.stats().read_ratio < 0.1
+
+    _, etag = await store.read_file_versioned("doc/content.txt")
+    await store.write_file_if_match("doc/content.txt", TEXT + b"!", etag)
+    content, _ = await store.read_file_versioned("doc/content.txt")
+    assert content == TEXT + b"!"
+    assert is_compressed(await memory_store.read_file("doc/content.txt"))
+
+
+async def test_open_write_streams_compressed_content(memory_store: InMemoryStorage):
+    store = CompressedStorage(memory_store)
+    async with await store.open_write("doc/content.txt") as writer:
+        for start in range(0, len(TEXT), 100):
+            await writer.write(TEXT[start:start + 100])
+    async with await store.open_write("doc/small.txt") as writer:
+        await writer.write(b"small")
+
+    stored = await memory_store.read_file("doc/content.txt")
+    assert is_compressed(stored) and len(stored) < len(TEXT) // 10
+    assert await store.read_file("doc/content.txt") == TEXT
+    assert await memory_store.read_file("doc/small.txt") == b"small"
+    assert store.stats().bytes_written == len(TEXT) + 5
+
+
+async def test_stat_does_not_read_the_object(memory_store: InMemoryStorage):
+    remote = SimulatedStorage(memory_store)
+    store = CompressedStorage(remote)
+    await store.write_file("doc/content.txt", TEXT)
+    await store.write_file("doc/act.pdf", TEXT)
+    remote.reset_stats()
+
+    entry = await store.stat("doc/content.txt")
+    stored = await memory_store.stat("doc/content.txt")
+    # the stored size is not the size of the content
+    assert (entry.etag, entry.size) == (stored.etag, None)
+    assert (await store.stat("doc/act.pdf")).size == len(TEXT)
+    assert remote.stats().requests == {"stat": 2}
+
+
+async def test_public_markers_are_listed_once(memory_store: InMemoryStorage):
+    remote = SimulatedStorage(memory_store)
+    store = CompressedStorage(remote)
+    for index in range(3):
+        await store.new_store("lib").write_file(f"doc/{index}.txt", TEXT)
+    assert remote.stats().requests == {"list_entries": 1, "write_file": 3}
+
+
+async def test_public_files_stay_uncompressed(memory_store: InMemoryStorage):
+    store = CompressedStorage(memory_store).new_store("lib")
+    await store.write_file("doc/content.txt", TEXT)
+    await store.make_public("doc/content.txt")
+    assert await memory_store.read_file("lib/doc/content.txt") == TEXT
+
+    await store.write_file("doc/content.txt", TEXT + b"!")
+    assert await memory_store.read_file("lib/doc/content.txt") == TEXT + b"!"
+
+    # written by another process, which lists the markers on its first write
+    other = CompressedStorage(memory_store).new_store("lib")
+    async with await other.open_write("doc/content.txt") as writer:
+        await writer.write(TEXT)
+    assert await memory_store.read_file("lib/doc/content.txt") == TEXT
+    await other.write_file("doc/other.txt", TEXT)
+    assert is_compressed(await memory_store.read_file("lib/doc/other.txt"))
@@ -0,0 +1,197 @@
+import asyncio
+import pytest
+from jugalbandi.storage import (
+    ContentAddressedStorage,
+    InMemoryStorage,
+    PreconditionFailedError,
+)
+from jugalbandi.storage import content_addressed_storage
+from jugalbandi.storage.content_addressed_storage import content_digest
+
+CONTENT = b"%PDF" + bytes(range(256)) * 20
+OTHER = b"%PDF" + bytes(range(255, -1, -1)) * 20
+
+
+async def _files(store: InMemoryStorage, folder: str):
+    return [entry.name async for entry in store.list_entries(folder)]
+
+
+async def _blobs(store: InMemoryStorage):
+    return [
+        name for name in await _files(store, "__cas__") if name.endswith("/blob")
+    ]
+
+
+async def test_same_content_is_stored_once(memory_store: InMemoryStorage):
+    store = ContentAddressedStorage(memory_store)
+    await store.write_file("a/act.pdf", CONTENT)
+    await store.new_store("b").write_file("act.pdf", CONTENT)
+    await store.write_file("small.json", b"{}")
+
+    assert len(await _blobs(memory_store)) == 1
+    assert await store.read_file("b/act.pdf") == CONTENT
+    assert (await store.stat("a/act.pdf")).size == len(CONTENT)
+    assert await store.digest_of("a/act.pdf") == content_digest(CONTENT)
+    assert await store.digest_of("small.json") is None
+    assert await memory_store.read_file("small.json") == b"{}"
+
+
+async def test_blob_is_deleted_with_the_last_reference(memory_store: InMemoryStorage):
+    store = ContentAddressedStorage(memory_store)
+    for name in ("a", "b", "c", "d"):
+        await store.write_file(f"docs/{name}.pdf", CONTENT)
+    assert await store.write_derived("docs/a.pdf", "text.txt", b"text")
+
+    # removed, overwritten with small content and deleted with its folder
+    await store.remove_file("docs/a.pdf")
+    await store.write_file("docs/b.pdf", b"small")
+    await store.copy_prefix("docs", "copies")
+    await store.delete_prefix("copies")
+    assert len(await _blobs(memory_store)) == 1
+    assert await store.read_derived("docs/c.pdf", "text.txt") == b"text"
+
+    async with await store.open_write("docs/c.pdf") as writer:
+        await writer.write(OTHER)
+    await store.write_file("docs/d.pdf", OTHER)
+    assert await store.read_file("docs/c.pdf") == OTHER
+    # the blob, its references and derived artifacts
+    digest = content_digest(CONTENT)
+    assert await _files(memory_store, f"__cas__/{digest[:2]}/{digest}") == []
+    assert len(await _blobs(memory_store)) == 1
+
+
+async def test_derived_artifacts_are_shared(memory_store: InMemoryStorage):
+    store = ContentAddressedStorage(memory_store)
+    await store.write_file("a.pdf", CONTENT)
+    await store.write_file("b.pdf", CONTENT)
+    await store.write_file("small.txt", b"small")
+
+    assert await store.read_derived("b.pdf", "text.txt") is None
+    assert await store.write_derived("a.pdf", "text.txt", b"text")
+    assert await store.read_derived("b.pdf", "text.txt") == b"text"
+    assert not await store.write_derived("small.txt", "text.txt", b"text")
+    assert await store.read_derived("small.txt", "text.txt") is None
+
+
+async def test_failed_conditional_write_releases_its_reference(
+    memory_store: InMemoryStorage,
+):
+    store = ContentAddressedStorage(memory_store)
+    await store.write_file("a.pdf", CONTENT)
+    _, etag = await store.read_file_versioned("a.pdf")
+    await store.write_file("a.pdf", OTHER)
+
+    with pytest.raises(PreconditionFailedError):
+        await store.write_file_if_match("a.pdf", CONTENT + b"new", etag)
+    assert await store.read_file("a.pdf") == OTHER
+    assert len(await _blobs(memory_store)) == 1
+
+    # the winning write points to the same blob, which is kept
+    with pytest.raises(PreconditionFailedError):
+        await store.write_file_if_match("a.pdf", OTHER, etag)
+    assert await store.read_file("a.pdf") == OTHER
+    assert len(await _blobs(memory_store)) == 1
+
+    _, etag = await store.read_file_versioned("a.pdf")
+    etag = await store.write_file_if_match("a.pdf", CONTENT, etag)
+    assert await store.read_file("a.pdf") == CONTENT
+    await store.write_file_if_match("a.pdf", b"small", etag)
+    assert await _blobs(memory_store) == []
+
+
+async def _stream(store: ContentAddressedStorage, file_path: str, content: bytes):
+    async with await store.open_write(file_path) as writer:
+        for offset in range(0, len(content), 1000):
+            await writer.write(content[offset:offset + 1000])
+
+
+async def test_streamed_content_is_stored_once(memory_store: InMemoryStorage):
+    store = ContentAddressedStorage(memory_store)
+    await _stream(store, "a/act.pdf", CONTENT)
+    await _stream(store.new_store("b"), "act.pdf", CONTENT)
+    await _stream(store, "small.json", b"{}")
+
+    assert len(await _blobs(memory_store)) == 1
+    assert await store.read_file("b/act.pdf") == CONTENT
+    assert await store.digest_of("a/act.pdf") == content_digest(CONTENT)
+    assert await memory_store.read_file("small.json") == b"{}"
+
+    await _stream(store, "a/act.pdf", OTHER)
+    await _stream(store, "b/act.pdf", OTHER)
+    assert await _blobs(memory_store) == [
+        f"{content_digest(OTHER)[:2]}/{content_digest(OTHER)}/blob"
+    ]
+    with pytest.raises(RuntimeError):
+        async with await store.open_write("c.pdf") as writer:
+            await writer.write(CONTENT)
+            raise RuntimeError("upload failed")
+    assert not await memory_store.file_exists("c.pdf")
+
+
+def _before(memory_store: InMemoryStorage, operation: str, path_suffix: str, hook):
+    """Runs hook before the first operation on a path ending in path_suffix."""
+    original = getattr(memory_store, operation)
+
+    async def _operation(file_path, *args):
+        if file_path.endswith(path_suffix):
+            setattr(memory_store, operation, original)
+            await hook()
+        return await original(file_path, *args)
+
+    setattr(memory_store, operation, _operation)
+
+
+async def test_release_keeps_a_blob_referenced_meanwhile(memory_store: InMemoryStorage):
+    # two processes sharing the bucket
+    releasing = ContentAddressedStorage(memory_store)
+    writing = ContentAddressedStorage(memory_store)
+    await releasing.write_file("a.pdf", CONTENT)
+    tasks = []
+
+    async def _write_other():
+        tasks.append(asyncio.create_task(writing.write_file("b.pdf", CONTENT)))
+        await asyncio.sleep(0.01)
+
+    # the other process references the blob after the release listed none
+    _before(memory_store, "write_file_if_match", "/releasing", _write_other)
+    await releasing.remove_file("a.pdf")
+    await asyncio.gather(*tasks)
+
+    assert len(tasks) == 1
+    assert await writing.read_file("b.pdf") == CONTENT
+    assert len(await _blobs(memory_store)) == 1
+
+
+async def test_blob_is_uploaded_again_after_a_release(memory_store: InMemoryStorage):
+    releasing = ContentAddressedStorage(memory_store)
+    writing = ContentAddressedStorage(memory_store)
+    await releasing.write_file("a.pdf", CONTENT)
+    tasks = []
+
+    async def _write_other():
+        tasks.append(asyncio.create_task(writing.write_file("b.pdf", CONTENT)))
+        await asyncio.sleep(0.01)
+
+    # the other process references the blob while it is being deleted
+    _before(memory_store, "remove_file", "/blob", _write_other)
+    await releasing.remove_file("a.pdf")
+    await asyncio.gather(*tasks)
+
+    assert len(tasks) == 1
+    assert await writing.read_file("b.pdf") == CONTENT
+    assert len(await _blobs(memory_store)) == 1
+
+
+async def test_abandoned_tombstone_is_removed(
+    memory_store: InMemoryStorage, monkeypatch
+):
+    monkeypatch.setattr(content_addressed_storage, "RELEASE_TIMEOUT", 0.05)
+    store = ContentAddressedStorage(memory_store)
+    digest = content_digest(CONTENT)
+    tombstone_path = f"__cas__/{digest[:2]}/{digest}/releasing"
+    # left by a process that died while releasing the blob
+    await memory_store.write_file(tombstone_path, b"")
+
+    await store.write_file("a.pdf", CONTENT)
+    assert await store.read_file("a.pdf") == CONTENT
+    assert not await memory_store.file_exists(tombstone_path)
@@ -0,0 +1,156 @@
+import base64
+import os
+import aiohttp
+import google_crc32c
+import pytest
+from jugalbandi.storage import GoogleStorage, PreconditionFailedError, TransferConfig
+from jugalbandi.storage import google_storage
+
+
+class _FakeClient:
+    """Stands in for gcloud.aio's Storage, recording the uploads."""
+
+    def __init__(self, error_status=None):
+        self.error_status = error_status
+        self.uploads = []
+
+    def __call__(self, session=None, token=None):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def upload(self, bucket_name, object_name, content, parameters=None):
+        self.uploads.append((object_name, parameters))
+        if self.error_status is not None:
+            raise aiohttp.ClientResponseError(
+                None, (), status=self.error_status, message="Precondition Failed"
+            )
+        return {"name": object_name, "size": str(len(content)), "generation": "42"}
+
+
+@pytest.fixture()
+def fake_client(monkeypatch):
+    def _install(error_status=None):
+        client = _FakeClient(error_status)
+        monkeypatch.setattr(google_storage, "GoogleAioStorage", client)
+        monkeypatch.setattr(GoogleStorage, "token", None)
+        return client
+
+    return _install
+
+
+async def test_conditional_write_returns_generation(fake_client):
+    client = fake_client()
+    store = GoogleStorage("bucket", "lib")
+
+    assert await store.write_file_if_match("doc/metadata.json", b"{}", "41") == "42"
+    assert await store.write_file_if_match("doc/new.json", b"{}", None) == "42"
+    assert client.uploads == [
+        ("lib/doc/metadata.json", {"ifGenerationMatch": "41"}),
+        ("lib/doc/new.json", {"ifGenerationMatch": "0"}),
+    ]
+    await store.shutdown()
+
+
+async def test_failed_precondition_is_not_retried(fake_client):
+    client = fake_client(error_status=412)
+    store = GoogleStorage("bucket", "lib")
+
+    with pytest.raises(PreconditionFailedError):
+        await store.write_file_if_match("doc/metadata.json", b"{}", "41")
+    assert len(client.uploads) == 1
+    await store.shutdown()
+
+
+CONTENT = bytes(range(256)) * 40
+
+
+class _FakeRanges:
+    """Serves CONTENT as a composite object, which has a crc32c but no
+    md5Hash, recording the ranged downloads."""
+
+    def __init__(self):
+        self.requested = []
+        self.first_range = None
+        self.error_status = None
+
+    async def download_range(self, session, url, headers, generation, start, end):
+        self.requested.append((generation, start, end))
+        if self.error_status is not None:
+            raise aiohttp.ClientResponseError(None, (), status=self.error_status)
+        if start == 0 and self.first_range is not None:
+            return self.first_range
+        return CONTENT[start:end + 1]
+
+    async def object_metadata(self, object_name):
+        checksum = google_crc32c.Checksum(CONTENT).digest()
+        return {
+            "size": str(len(CONTENT)),
+            "generation": "7",
+            "crc32c": base64.b64encode(checksum).decode("ascii"),
+        }
+
+
+@pytest.fixture()
+def ranges(monkeypatch):
+    ranges = _FakeRanges()
+    monkeypatch.setattr(google_storage, "_download_range", ranges.download_range)
+    monkeypatch.setattr(GoogleStorage, "token", None)
+    monkeypatch.setattr(GoogleStorage, "_object_metadata", ranges.object_metadata)
+    monkeypatch.setattr(GoogleStorage, "_auth_headers", _no_auth_headers)
+    return ranges
+
+
+async def _no_auth_headers(self):
+    return {}
+
+
+def _store() -> GoogleStorage:
+    return GoogleStorage(
+        "bucket", "lib", TransferConfig(part_size=1024, threshold=1024)
+    )
+
+
+async def test_read_into_pins_the_generation(ranges, tmp_path):
+    store = _store()
+    target = str(tmp_path / "index" / "index.faiss")
+
+    assert await store.read_into("index.faiss", target) == len(CONTENT)
+    with open(target, "rb") as f:
+        assert f.read() == CONTENT
+    assert os.listdir(tmp_path / "index") == ["index.faiss"]
+    assert len(ranges.requested) == 10
+    assert {generation for generation, _, _ in ranges.requested} == {"7"}
+
+    buffer = bytearray(len(CONTENT))
+    assert await store.read_into("index.faiss", buffer) == len(CONTENT)
+    assert buffer == CONTENT
+    await store.shutdown()
+
+
+async def test_read_into_verifies_crc32c(ranges, tmp_path):
+    store = _store()
+    ranges.first_range = b"\0" * 1024
+
+    with pytest.raises(IOError, match="checksum"):
+        await store.read_into("index.faiss", str(tmp_path / "index.faiss"))
+    with pytest.raises(IOError, match="checksum"):
+        await store.read_into("index.faiss", bytearray(len(CONTENT)))
+    assert os.listdir(tmp_path) == []
+    await store.shutdown()
+
+
+async def test_read_into_fails_when_the_object_changes(ranges, tmp_path):
+    store = _store()
+    ranges.error_status = 412
+
+    with pytest.raises(IOError, match="changed"):
+        await store.read_into("index.faiss", str(tmp_path / "index.faiss"))
+    # a failed precondition is not retried
+    assert len(ranges.requested) == 10
+    assert os.listdir(tmp_path) == []
+    await store.shutdown()
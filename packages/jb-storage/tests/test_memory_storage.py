@@ -0,0 +1,115 @@
+import pytest
+from jugalbandi.storage import InMemoryStorage, PreconditionFailedError
+
+
+async def test_read_write(memory_store: InMemoryStorage):
+    await memory_store.write_file("doc/a.txt", b"hello")
+    await memory_store.write_file("doc/b.txt", "world")
+
+    assert await memory_store.read_file("doc/a.txt") == b"hello"
+    assert await memory_store.read_file("doc/b.txt") == b"world"
+    assert await memory_store.file_exists("doc/a.txt")
+    assert not await memory_store.file_exists("doc/c.txt")
+    with pytest.raises(FileNotFoundError):
+        await memory_store.read_file("doc/c.txt")
+
+    await memory_store.remove_file("doc/a.txt")
+    assert not await memory_store.file_exists("doc/a.txt")
+    with pytest.raises(FileNotFoundError):
+        await memory_store.remove_file("doc/a.txt")
+
+
+async def test_stat_changes_with_content(memory_store: InMemoryStorage):
+    await memory_store.write_file("a.txt", b"one")
+    first = await memory_store.stat("a.txt")
+    await memory_store.write_file("a.txt", b"three")
+    second = await memory_store.stat("a.txt")
+
+    assert first.size == 3 and second.size == 5
+    assert first.etag != second.etag
+    with pytest.raises(FileNotFoundError):
+        await memory_store.stat("b.txt")
+
+
+async def test_conditional_write(memory_store: InMemoryStorage):
+    created = await memory_store.write_file_if_match("a.json", b"1", None)
+    with pytest.raises(PreconditionFailedError):
+        await memory_store.write_file_if_match("a.json", b"2", None)
+
+    content, etag = await memory_store.read_file_versioned("a.json")
+    assert content == b"1" and etag == created
+    updated = await memory_store.write_file_if_match("a.json", b"2", etag)
+    assert updated == (await memory_store.stat("a.json")).etag
+    with pytest.raises(PreconditionFailedError):
+        await memory_store.write_file_if_match("a.json", b"3", etag)
+    assert await memory_store.read_file("a.json") == b"2"
+
+
+async def test_listing(memory_store: InMemoryStorage):
+    for file_path in ["lib/b.txt", "lib/a.txt", "lib/doc1/m.json", "lib/doc2/m.json",
+                      "lib/doc2/sub/x.txt", "other/c.txt"]:
+        await memory_store.write_file(file_path, b"x")
+
+    assert [f async for f in memory_store.list_files("lib")] == ["a.txt", "b.txt"]
+    assert [f async for f in memory_store.list_files("lib", "b")] == ["b.txt"]
+    assert [f async for f in memory_store.list_subfolders("lib")] == ["doc1", "doc2"]
+    subfolders = [f async for f in memory_store.list_subfolders("lib", "", "doc2")]
+    assert subfolders == ["doc1"]
+    assert [e.name async for e in memory_store.list_entries("lib/doc2")] == [
+        "m.json", "sub/x.txt"
+    ]
+    entries = memory_store.list_entries("lib", recursive=False)
+    assert [e.name async for e in entries] == ["a.txt", "b.txt"]
+    exists = await memory_store.exists_many(
+        ["lib/a.txt", "lib/doc1/m.json", "lib/z.txt"]
+    )
+    assert exists == {"lib/a.txt": True, "lib/doc1/m.json": True, "lib/z.txt": False}
+
+
+async def test_streaming(memory_store: InMemoryStorage):
+    content = bytes(range(256)) * 10
+    async with await memory_store.open_write("big.bin") as writer:
+        await writer.write(content[:1000])
+        await writer.write(content[1000:])
+
+    async with await memory_store.open_read("big.bin", 10, 20) as reader:
+        assert await reader.read() == content[10:20]
+    buffer = bytearray(len(content))
+    assert await memory_store.read_into("big.bin", buffer) == len(content)
+    assert bytes(buffer) == content
+
+    with pytest.raises(ValueError):
+        await memory_store.open_read("big.bin", len(content) + 1)
+
+
+async def test_bulk_operations(memory_store: InMemoryStorage):
+    for name in ["a.txt", "sub/b.txt"]:
+        await memory_store.write_file(f"src/{name}", name.encode())
+
+    result = await memory_store.copy_prefix("src", "dst")
+    assert result.ok and sorted(result.processed) == ["src/a.txt", "src/sub/b.txt"]
+    assert await memory_store.read_file("dst/sub/b.txt") == b"sub/b.txt"
+
+    result = await memory_store.delete_prefix("src")
+    assert sorted(result.processed) == ["src/a.txt", "src/sub/b.txt"]
+    assert [e async for e in memory_store.list_entries("src")] == []
+    assert await memory_store.file_exists("dst/a.txt")
+
+
+async def test_new_store_shares_bucket(memory_store: InMemoryStorage):
+    sub_store = memory_store.new_store("lib/__tasks__")
+    await sub_store.write_file("state.json", b"{}")
+
+    assert await memory_store.read_file("lib/__tasks__/state.json") == b"{}"
+    assert sub_store.path("state.json") == "testing/lib/__tasks__/state.json"
+
+
+async def test_public_url(memory_store: InMemoryStorage):
+    await memory_store.write_file("doc/a b.pdf", b"%PDF")
+
+    assert not memory_store.is_public("doc/a b.pdf")
+    url = await memory_store.make_public("doc/a b.pdf")
+    assert url == "memory://testing/doc/a%20b.pdf"
+    assert memory_store.is_public("doc/a b.pdf")
+    with pytest.raises(FileNotFoundError):
+        await memory_store.make_public("doc/missing.pdf")
@@ -0,0 +1,109 @@
+import tempfile
+import pytest
+from jugalbandi.storage import (
+    CachingStorage,
+    DiskCache,
+    InjectedFaultError,
+    InMemoryStorage,
+    SimulatedStorage,
+    SimulationProfile,
+    StorageWrapper,
+)
+
+
+async def test_counts_requests_and_bytes(memory_store: InMemoryStorage):
+    store = SimulatedStorage(memory_store)
+    await store.write_file("a.txt", b"hello")
+    await store.read_file("a.txt")
+    await store.read_file("a.txt")
+    assert [e.name async for e in store.list_entries("")] == ["a.txt"]
+
+    stats = store.stats()
+    assert stats.requests == {"write_file": 1, "read_file": 2, "list_entries": 1}
+    assert stats.bytes_written == 5 and stats.bytes_read == 10
+
+    store.reset_stats()
+    assert store.stats().total_requests == 0
+
+
+async def test_latency_and_bandwidth(memory_store: InMemoryStorage):
+    profile = SimulationProfile(
+        latency=0.01, operation_latency={"stat": 0.0}, bandwidth=100_000
+    )
+    store = SimulatedStorage(memory_store, profile)
+    await store.write_file("a.bin", bytes(1000))
+    async with await store.open_read("a.bin") as reader:
+        assert len(await reader.read()) == 1000
+    await store.stat("a.bin")
+
+    # two requests of 10 ms, two transfers of 1000 bytes at 100 kB/s
+    assert store.stats().delay == pytest.approx(0.04)
+
+
+async def test_injected_faults_are_reproducible(memory_store: InMemoryStorage):
+    async def failures(seed: int):
+        store = SimulatedStorage(
+            memory_store, SimulationProfile(error_rate=0.5, seed=seed)
+        )
+        failed = []
+        for i in range(20):
+            try:
+                await store.write_file(f"{i}.txt", b"x")
+            except InjectedFaultError:
+                failed.append(i)
+        return failed
+
+    first = await failures(7)
+    assert 0 < len(first) < 20
+    assert await failures(7) == first
+    # a failed request has no effect
+    assert [i for i in first if await memory_store.file_exists(f"{i}.txt")] == []
+
+
+async def test_operation_error_rate(memory_store: InMemoryStorage):
+    store = SimulatedStorage(
+        memory_store, SimulationProfile(operation_error_rate={"read_file": 1.0})
+    )
+    await store.write_file("a.txt", b"x")
+    with pytest.raises(InjectedFaultError):
+        await store.read_file("a.txt")
+    assert store.stats().faults == 1
+
+
+async def test_caching_saves_reads(memory_store: InMemoryStorage):
+    remote = SimulatedStorage(memory_store)
+    await remote.write_file("doc/metadata.json", b"{}" * 100)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        store = CachingStorage(remote, DiskCache(cache_dir, 1024 * 1024))
+        for _ in range(5):
+            assert await store.read_file("doc/metadata.json") == b"{}" * 100
+
+    requests = remote.stats().requests
+    assert requests["read_file"] == 1
+    assert requests["stat"] == 1
+
+
+async def test_removed_files_are_not_served_from_cache(memory_store: InMemoryStorage):
+    remote = SimulatedStorage(memory_store)
+    await remote.write_file("doc/metadata.json", b"{}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        store = CachingStorage(remote, DiskCache(cache_dir, 1024 * 1024))
+        assert await store.read_file("doc/metadata.json") == b"{}"
+        await store.remove_file("doc/metadata.json")
+
+        with pytest.raises(FileNotFoundError):
+            await store.read_file("doc/metadata.json")
+    assert remote.stats().requests["remove_file"] == 1
+
+
+async def test_wrappers_implement_new_store(memory_store: InMemoryStorage):
+    with pytest.raises(TypeError):
+        StorageWrapper(memory_store)
+
+
+async def test_new_store_shares_stats(memory_store: InMemoryStorage):
+    store = SimulatedStorage(memory_store)
+    await store.new_store("lib").write_file("a.txt", b"x")
+
+    assert store.stats().requests == {"write_file": 1}
+    assert await memory_store.file_exists("lib/a.txt")
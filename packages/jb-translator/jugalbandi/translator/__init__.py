@@ -5,6 +5,15 @@ from .translator import (
     AzureTranslator,
     CompositeTranslator,
 )
+from .cache import (
+    CachingTranslator,
+    TranslationCacheStats,
+    TranslationKey,
+    TranslationStore,
+    SqliteTranslationStore,
+    PostgresTranslationStore,
+    translation_store_from_env,
+)
 
 __all__ = [
     "Translator",
@@ -12,4 +21,11 @@ __all__ = [
     "GoogleTranslator",
     "AzureTranslator",
     "CompositeTranslator",
+    "CachingTranslator",
+    "TranslationCacheStats",
+    "TranslationKey",
+    "TranslationStore",
+    "SqliteTranslationStore",
+    "PostgresTranslationStore",
+    "translation_store_from_env",
 ]
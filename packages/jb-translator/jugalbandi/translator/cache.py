@@ -0,0 +1,381 @@
+import asyncio
+import hashlib
+import logging
+import operator
+import sqlite3
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import asyncpg
+from cachetools import LRUCache
+from jugalbandi.core import Language, aiocachedmethod
+from .translator import Translator
+from .translation_cache_settings import (
+    TranslationCacheSettings,
+    get_translation_cache_settings,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TranslationKey(NamedTuple):
+    text_hash: str
+    source_language: str
+    target_language: str
+    provider: str
+
+    @classmethod
+    def create(
+        cls,
+        text: str,
+        source_language: Language,
+        destination_language: Language,
+        provider: str,
+    ) -> "TranslationKey":
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return cls(text_hash, source_language.name, destination_language.name, provider)
+
+
+@dataclass
+class TranslationCacheStats:
+    memory_hits: int = 0
+    store_hits: int = 0
+    misses: int = 0
+    memory_size: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.memory_hits + self.store_hits + self.misses
+        if total == 0:
+            return 0.0
+        return (self.memory_hits + self.store_hits) / total
+
+
+class TranslationStore(ABC):
+    @abstractmethod
+    async def get_many(
+        self, keys: List[TranslationKey]
+    ) -> Dict[TranslationKey, str]:
+        pass
+
+    @abstractmethod
+    async def put_many(self, items: Dict[TranslationKey, str]):
+        pass
+
+    @abstractmethod
+    async def shutdown(self):
+        pass
+
+
+class SqliteTranslationStore(TranslationStore):
+    """Translation store in a local SQLite file, shared by the workers of a host."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        if not self._initialized:
+            # WAL lets several worker processes read while one writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS translation_cache (
+                    text_hash TEXT,
+                    source_language TEXT,
+                    target_language TEXT,
+                    provider TEXT,
+                    translated_text TEXT,
+                    PRIMARY KEY (text_hash, source_language, target_language, provider)
+                )
+                """
+            )
+            connection.commit()
+            self._initialized = True
+        return connection
+
+    def _get_many(self, keys: List[TranslationKey]) -> Dict[TranslationKey, str]:
+        result: Dict[TranslationKey, str] = {}
+        connection = self._connect()
+        try:
+            for key in keys:
+                row = connection.execute(
+                    """
+                    SELECT translated_text FROM translation_cache
+                    WHERE text_hash = ? AND source_language = ?
+                    AND target_language = ? AND provider = ?
+                    """,
+                    key,
+                ).fetchone()
+                if row is not None:
+                    result[key] = row[0]
+        finally:
+            connection.close()
+        return result
+
+    def _put_many(self, items: Dict[TranslationKey, str]):
+        connection = self._connect()
+        try:
+            connection.executemany(
+                """
+                INSERT OR REPLACE INTO translation_cache
+                (text_hash, source_language, target_language, provider, translated_text)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [(*key, value) for key, value in items.items()],
+            )
+            connection.commit()
+        finally:
+            connection.close()
+
+    async def get_many(
+        self, keys: List[TranslationKey]
+    ) -> Dict[TranslationKey, str]:
+        if len(keys) == 0:
+            return {}
+        return await asyncio.to_thread(self._get_many, keys)
+
+    async def put_many(self, items: Dict[TranslationKey, str]):
+        if len(items) == 0:
+            return
+        await asyncio.to_thread(self._put_many, items)
+
+    async def shutdown(self):
+        pass
+
+
+class PostgresTranslationStore(TranslationStore):
+    """Translation store in a Postgres table, shared across hosts and restarts."""
+
+    def __init__(self, settings: Optional[TranslationCacheSettings] = None) -> None:
+        self.settings = settings or get_translation_cache_settings()
+        self.engine_cache: Dict[str, asyncpg.Pool] = {}
+
+    @aiocachedmethod(operator.attrgetter("engine_cache"))
+    async def _get_engine(self) -> asyncpg.Pool:
+        engine = await self._create_engine()
+        await self._create_schema(engine)
+        return engine
+
+    async def _create_engine(self, timeout=5):
+        engine = await asyncpg.create_pool(
+            host=self.settings.translation_cache_database_ip,
+            port=self.settings.translation_cache_database_port,
+            user=self.settings.translation_cache_database_username,
+            password=self.settings.translation_cache_database_password,
+            database=self.settings.translation_cache_database_name,
+            max_inactive_connection_lifetime=timeout,
+        )
+        return engine
+
+    async def _create_schema(self, engine):
+        async with engine.acquire() as connection:
+            await connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS translation_cache (
+                    text_hash TEXT,
+                    source_language TEXT,
+                    target_language TEXT,
+                    provider TEXT,
+                    translated_text TEXT,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    PRIMARY KEY (text_hash, source_language, target_language, provider)
+                );
+                """
+            )
+
+    async def get_many(
+        self, keys: List[TranslationKey]
+    ) -> Dict[TranslationKey, str]:
+        if len(keys) == 0:
+            return {}
+        engine = await self._get_engine()
+        async with engine.acquire() as connection:
+            rows = await connection.fetch(
+                """
+                SELECT text_hash, source_language, target_language, provider,
+                translated_text FROM translation_cache
+                WHERE (text_hash, source_language, target_language, provider) IN (
+                    SELECT * FROM unnest($1::text[], $2::text[], $3::text[], $4::text[])
+                )
+                """,
+                *[list(column) for column in zip(*keys)],
+            )
+        return {
+            TranslationKey(
+                row["text_hash"],
+                row["source_language"],
+                row["target_language"],
+                row["provider"],
+            ): row["translated_text"]
+            for row in rows
+        }
+
+    async def put_many(self, items: Dict[TranslationKey, str]):
+        if len(items) == 0:
+            return
+        engine = await self._get_engine()
+        async with engine.acquire() as connection:
+            await connection.executemany(
+                """
+                INSERT INTO translation_cache
+                (text_hash, source_language, target_language, provider, translated_text)
+                VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT (text_hash, source_language, target_language, provider)
+                DO UPDATE SET translated_text = EXCLUDED.translated_text
+                """,
+                [(*key, value) for key, value in items.items()],
+            )
+
+    async def shutdown(self):
+        for engine in self.engine_cache.values():
+            await engine.close()
+        self.engine_cache.clear()
+
+
+def translation_store_from_env() -> Optional[TranslationStore]:
+    settings = get_translation_cache_settings()
+    if settings.translation_cache_database_ip:
+        return PostgresTranslationStore(settings)
+    if settings.translation_cache_path:
+        return SqliteTranslationStore(settings.translation_cache_path)
+    return None
+
+
+class CachingTranslator(Translator):
+    """Wraps a translator with an in-process LRU tier and an optional
+    persistent tier keyed by (text hash, source, target, provider)."""
+
+    def __init__(
+        self,
+        translator: Translator,
+        store: Optional[TranslationStore] = None,
+        maxsize: Optional[int] = None,
+        provider: Optional[str] = None,
+    ):
+        self.translator = translator
+        self.store = store
+        self.provider = provider or type(translator).__name__
+        self._memory: LRUCache = LRUCache(
+            maxsize=maxsize or get_translation_cache_settings().translation_cache_size
+        )
+        self._stats = TranslationCacheStats()
+
+    def _key(
+        self, text: str, source_language: Language, destination_language: Language
+    ) -> TranslationKey:
+        return TranslationKey.create(
+            text, source_language, destination_language, self.provider
+        )
+
+    async def _lookup(self, keys: List[TranslationKey]) -> Dict[TranslationKey, str]:
+        found: Dict[TranslationKey, str] = {}
+        store_keys = []
+        for key in keys:
+            value = self._memory.get(key)
+            if value is not None:
+                found[key] = value
+                self._stats.memory_hits += 1
+            else:
+                store_keys.append(key)
+
+        if self.store is not None and len(store_keys) > 0:
+            try:
+                stored = await self.store.get_many(store_keys)
+            except Exception:
+                logger.exception("translation cache store lookup failed")
+                stored = {}
+            for key, value in stored.items():
+                self._memory[key] = value
+                found[key] = value
+            self._stats.store_hits += len(stored)
+
+        self._stats.misses += len(keys) - len(found)
+        return found
+
+    async def _remember(self, items: Dict[TranslationKey, str]):
+        for key, value in items.items():
+            self._memory[key] = value
+        if self.store is not None:
+            try:
+                await self.store.put_many(items)
+            except Exception:
+                logger.exception("translation cache store update failed")
+
+    async def translate_text(
+        self, text: str, source_language: Language, destination_language: Language
+    ) -> str:
+        if source_language.value == destination_language.value:
+            return text
+
+        key = self._key(text, source_language, destination_language)
+        found = await self._lookup([key])
+        if key in found:
+            return found[key]
+
+        translated_text = await self.translator.translate_text(
+            text, source_language, destination_language
+        )
+        await self._remember({key: translated_text})
+        return translated_text
+
+    async def translate_batch(
+        self,
+        texts: Sequence[str],
+        source_language: Language,
+        destination_language: Language,
+        return_exceptions: bool = False,
+    ) -> List:
+        if source_language.value == destination_language.value:
+            return list(texts)
+
+        keys = [self._key(text, source_language, destination_language) for text in texts]
+        found = await self._lookup(list(dict.fromkeys(keys)))
+
+        # only the distinct misses go to the wrapped translator
+        missing: Dict[TranslationKey, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if len(missing) > 0:
+            translated = await self.translator.translate_batch(
+                list(missing.values()), source_language, destination_language,
+                return_exceptions=True,
+            )
+            items = {}
+            for key, translated_text in zip(missing.keys(), translated):
+                found[key] = translated_text
+                if not isinstance(translated_text, Exception):
+                    items[key] = translated_text
+            await self._remember(items)
+
+        results = [found[key] for key in keys]
+        if not return_exceptions:
+            excs = [result for result in results if isinstance(result, Exception)]
+            if excs:
+                raise ExceptionGroup("CachingTranslator batch translation failed", excs)
+        return results
+
+    async def seed(self, entries: Iterable[Tuple[str, Language, Language, str]]):
+        """Pre-populate the cache with known (text, source, target, translation)
+        entries, e.g. the translated_data stored in a library catalog."""
+        items = {
+            self._key(text, source_language, destination_language): translated_text
+            for text, source_language, destination_language, translated_text in entries
+            if text and translated_text
+        }
+        await self._remember(items)
+
+    def stats(self) -> TranslationCacheStats:
+        return TranslationCacheStats(
+            memory_hits=self._stats.memory_hits,
+            store_hits=self._stats.store_hits,
+            misses=self._stats.misses,
+            memory_size=len(self._memory),
+        )
+
+    async def shutdown(self):
+        if self.store is not None:
+            await self.store.shutdown()
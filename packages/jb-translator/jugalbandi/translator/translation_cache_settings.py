@@ -0,0 +1,32 @@
+from typing import Annotated, Optional
+from cachetools import cached
+from pydantic import BaseSettings, Field
+
+
+class TranslationCacheSettings(BaseSettings):
+    translation_cache_path: Annotated[
+        Optional[str], Field(..., env="TRANSLATION_CACHE_PATH")
+    ] = None
+    translation_cache_size: Annotated[
+        int, Field(..., env="TRANSLATION_CACHE_SIZE")
+    ] = 10000
+    translation_cache_database_ip: Annotated[
+        Optional[str], Field(..., env="TRANSLATION_CACHE_DATABASE_IP")
+    ] = None
+    translation_cache_database_port: Annotated[
+        Optional[str], Field(..., env="TRANSLATION_CACHE_DATABASE_PORT")
+    ] = None
+    translation_cache_database_username: Annotated[
+        Optional[str], Field(..., env="TRANSLATION_CACHE_DATABASE_USERNAME")
+    ] = None
+    translation_cache_database_password: Annotated[
+        Optional[str], Field(..., env="TRANSLATION_CACHE_DATABASE_PASSWORD")
+    ] = None
+    translation_cache_database_name: Annotated[
+        Optional[str], Field(..., env="TRANSLATION_CACHE_DATABASE_NAME")
+    ] = None
+
+
+@cached(cache={})
+def get_translation_cache_settings():
+    return TranslationCacheSettings()
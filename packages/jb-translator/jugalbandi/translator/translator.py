@@ -1,25 +1,127 @@
+import asyncio
 import httpx
 import os
 from abc import ABC, abstractmethod
+from typing import List, Sequence
 from google.cloud.translate import TranslationServiceAsyncClient
 from jugalbandi.core import (
     Language,
     InternalServerException,
+    client_registry,
+    client_pool_size,
+    client_keepalive_timeout,
 )
 import json
 import uuid
 import aiohttp
 
 
+def _create_dhruva_client() -> httpx.AsyncClient:
+    pool_size = client_pool_size("dhruva-translator")
+    return httpx.AsyncClient(limits=httpx.Limits(max_connections=pool_size,
+                                                 max_keepalive_connections=pool_size,
+                                                 keepalive_expiry=client_keepalive_timeout()))
+
+
+def _create_azure_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(ssl=False,
+                                     limit=client_pool_size("azure-translator"),
+                                     keepalive_timeout=client_keepalive_timeout())
+    return aiohttp.ClientSession(connector=connector)
+
+
+client_registry.register("dhruva-translator", _create_dhruva_client,
+                         lambda client: client.aclose(),
+                         pool_size=client_pool_size("dhruva-translator"))
+client_registry.register("azure-translator", _create_azure_session,
+                         lambda session: session.close(),
+                         pool_size=client_pool_size("azure-translator"))
+client_registry.register("google-translator", TranslationServiceAsyncClient,
+                         lambda client: client.transport.close())
+
+
+def _pack_texts(texts: Sequence[str], max_items: int, max_chars: int) -> List[List[int]]:
+    """Group text indices into packs within a provider's request limits,
+    keeping the original order. A single oversized text gets its own pack."""
+    packs: List[List[int]] = []
+    current: List[int] = []
+    current_chars = 0
+    for index, text in enumerate(texts):
+        if current and (len(current) >= max_items or current_chars + len(text) > max_chars):
+            packs.append(current)
+            current = []
+            current_chars = 0
+        current.append(index)
+        current_chars += len(text)
+    if current:
+        packs.append(current)
+    return packs
+
+
 class Translator(ABC):
+    # request limits used to pack translate_batch calls
+    max_batch_items: int = 1
+    max_batch_chars: int = 5000
+    max_batch_concurrency: int = 4
+
     @abstractmethod
     async def translate_text(
         self, text: str, source_language: Language, destination_language: Language
     ) -> str:
         pass
 
+    async def _translate_pack(
+        self, texts: List[str], source_language: Language, destination_language: Language
+    ) -> List[str]:
+        return [
+            await self.translate_text(text, source_language, destination_language)
+            for text in texts
+        ]
+
+    async def translate_batch(
+        self,
+        texts: Sequence[str],
+        source_language: Language,
+        destination_language: Language,
+        return_exceptions: bool = False,
+    ) -> List:
+        """Translate many texts, packing them into as few provider requests as the
+        provider allows and running the packs concurrently. Results keep the order
+        of texts. With return_exceptions, a failed item holds its exception instead
+        of failing the whole batch."""
+        results: List = [None] * len(texts)
+        semaphore = asyncio.Semaphore(self.max_batch_concurrency)
+
+        async def _run_pack(indices: List[int]):
+            async with semaphore:
+                try:
+                    translated = await self._translate_pack(
+                        [texts[i] for i in indices], source_language, destination_language
+                    )
+                    if len(translated) != len(indices):
+                        raise InternalServerException(
+                            f"Expected {len(indices)} translations, got {len(translated)}"
+                        )
+                    for i, translated_text in zip(indices, translated):
+                        results[i] = translated_text
+                except Exception as exc:
+                    for i in indices:
+                        results[i] = exc
+
+        packs = _pack_texts(texts, self.max_batch_items, self.max_batch_chars)
+        await asyncio.gather(*(_run_pack(pack) for pack in packs))
+
+        if not return_exceptions:
+            excs = [result for result in results if isinstance(result, Exception)]
+            if excs:
+                raise ExceptionGroup(f"{type(self).__name__} batch translation failed", excs)
+        return results
+
 
 class DhruvaTranslator(Translator):
+    max_batch_items = 25
+    max_batch_chars = 5000
+
     def __init__(self):
         self.bhashini_user_id = os.getenv('BHASHINI_USER_ID')
         self.bhashini_api_key = os.getenv('BHASHINI_API_KEY')
@@ -70,7 +172,7 @@ class DhruvaTranslator(Translator):
             'Content-Type': 'application/json'
         }
 
-        async with httpx.AsyncClient() as client:
+        async with client_registry.acquire("dhruva-translator") as client:
             response = await client.post(url, headers=headers, data=payload)  # type: ignore
 
         return response.json()
@@ -78,6 +180,11 @@ class DhruvaTranslator(Translator):
     async def translate_text(
         self, text: str, source_language: Language, destination_language: Language
     ) -> str:
+        return (await self._translate_pack([text], source_language, destination_language))[0]
+
+    async def _translate_pack(
+        self, texts: List[str], source_language: Language, destination_language: Language
+    ) -> List[str]:
         source = source_language.name.lower()
         destination = destination_language.name.lower()
 
@@ -104,6 +211,7 @@ class DhruvaTranslator(Translator):
                     {
                         "source": text
                     }
+                    for text in texts
                 ]
             }
         })
@@ -115,7 +223,7 @@ class DhruvaTranslator(Translator):
             'Content-Type': 'application/json'
         }
 
-        async with httpx.AsyncClient() as client:
+        async with client_registry.acquire("dhruva-translator") as client:
             response = await client.post(url=self.bhashini_inference_url,
                                          headers=headers,
                                          data=payload)  # type: ignore
@@ -124,11 +232,14 @@ class DhruvaTranslator(Translator):
                 f"Request failed with response.text: {response.text} and "
                   f"status_code: {response.status_code}")
 
-        indicText = response.json()['pipelineResponse'][0]['output'][0]['target']
-        return indicText
+        return [output['target'] for output in response.json()['pipelineResponse'][0]['output']]
 
 
 class AzureTranslator(Translator):
+    # Translator v3 accepts up to 1000 array elements and 50,000 characters
+    max_batch_items = 1000
+    max_batch_chars = 50000
+
     def __init__(self):
         self.subscription_key = os.getenv('AZURE_TRANSLATION_KEY')
         self.resource_location = os.getenv('AZURE_TRANSLATION_RESOURCE_LOCATION')
@@ -137,6 +248,11 @@ class AzureTranslator(Translator):
     async def translate_text(
             self, text: str, source_language: Language, destination_language: Language
     ) -> str:
+        return (await self._translate_pack([text], source_language, destination_language))[0]
+
+    async def _translate_pack(
+        self, texts: List[str], source_language: Language, destination_language: Language
+    ) -> List[str]:
         path = '/translate'
         constructed_url = self.endpoint + path
 
@@ -161,33 +277,42 @@ class AzureTranslator(Translator):
             'Content-type': 'application/json',
             'X-ClientTraceId': str(uuid.uuid4())
         }
-        body = [{'text': text}]
+        body = [{'text': text} for text in texts]
 
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as session:
+        async with client_registry.acquire("azure-translator") as session:
             async with session.post(constructed_url, params=params, headers=headers, json=body) as response:
                 response = await response.json()
-                return response[0]['translations'][0]['text']
+                return [item['translations'][0]['text'] for item in response]
 
 
 class GoogleTranslator(Translator):
+    # Cloud Translation v3 allows 1024 strings and recommends < 30k codepoints
+    max_batch_items = 1024
+    max_batch_chars = 30000
+
     async def translate_text(
         self, text: str, source_language: Language, destination_language: Language
     ) -> str:
-        client = TranslationServiceAsyncClient()
+        return (await self._translate_pack([text], source_language, destination_language))[0]
+
+    async def _translate_pack(
+        self, texts: List[str], source_language: Language, destination_language: Language
+    ) -> List[str]:
         location = "global"
         # TODO: make the project_id versatile
         project_id = "indian-legal-bert"
         parent = f"projects/{project_id}/locations/{location}"
-        response = await client.translate_text(
-            request={
-                "parent": parent,
-                "contents": [text],
-                "mime_type": "text/plain",
-                "source_language_code": source_language.name.lower(),
-                "target_language_code": destination_language.name.lower(),
-            }
-        )
-        return response.translations[0].translated_text
+        async with client_registry.acquire("google-translator") as client:
+            response = await client.translate_text(
+                request={
+                    "parent": parent,
+                    "contents": texts,
+                    "mime_type": "text/plain",
+                    "source_language_code": source_language.name.lower(),
+                    "target_language_code": destination_language.name.lower(),
+                }
+            )
+        return [translation.translated_text for translation in response.translations]
 
 
 class CompositeTranslator(Translator):
@@ -211,3 +336,45 @@ class CompositeTranslator(Translator):
                 excs.append(exc)
 
         raise ExceptionGroup("CompositeTranslator translation failed", excs)
+
+    async def translate_batch(
+        self,
+        texts: Sequence[str],
+        source_language: Language,
+        destination_language: Language,
+        return_exceptions: bool = False,
+    ) -> List:
+        if source_language.value == destination_language.value:
+            return list(texts)
+
+        results: List = [None] * len(texts)
+        item_excs: List[List[Exception]] = [[] for _ in texts]
+        pending = list(range(len(texts)))
+        for translator in self.translators:
+            if not pending:
+                break
+            try:
+                translated = await translator.translate_batch(
+                    [texts[i] for i in pending], source_language, destination_language,
+                    return_exceptions=True,
+                )
+            except Exception as exc:
+                translated = [exc] * len(pending)
+
+            # items that failed with this translator fall back to the next one
+            still_pending = []
+            for i, translated_text in zip(pending, translated):
+                if isinstance(translated_text, Exception):
+                    item_excs[i].append(translated_text)
+                    still_pending.append(i)
+                else:
+                    results[i] = translated_text
+            pending = still_pending
+
+        for i in pending:
+            results[i] = ExceptionGroup("CompositeTranslator translation failed", item_excs[i])
+
+        if pending and not return_exceptions:
+            raise ExceptionGroup("CompositeTranslator batch translation failed",
+                                 [results[i] for i in pending])
+        return results
@@ -1,6 +1,7 @@
 import pytest
 import os
-from jugalbandi.translator.translator import DhruvaTranslator, GoogleTranslator, AzureTranslator
+from jugalbandi.translator.translator import DhruvaTranslator, GoogleTranslator, AzureTranslator, Translator
+from jugalbandi.translator import CachingTranslator, CompositeTranslator, SqliteTranslationStore
 from jugalbandi.core.language import Language
 from dotenv import load_dotenv
 
@@ -69,3 +70,85 @@ async def test_google_translator(google_translator: GoogleTranslator):
         english_text
         == "Who is a civil servant as per Karnataka State Civil Services Act"
     )
+
+
+class CountingTranslator(Translator):
+    def __init__(self):
+        self.calls = 0
+
+    async def translate_text(
+        self, text: str, source_language: Language, destination_language: Language
+    ) -> str:
+        self.calls += 1
+        return f"{text} ({destination_language.value})"
+
+
+@pytest.mark.asyncio
+async def test_caching_translator(tmp_path):
+    store = SqliteTranslationStore(str(tmp_path / "translations.db"))
+    inner = CountingTranslator()
+    translator = CachingTranslator(inner, store=store)
+    assert await translator.translate_text("hello", Language.EN, Language.HI) == "hello (Hindi)"
+    assert await translator.translate_text("hello", Language.EN, Language.HI) == "hello (Hindi)"
+    assert inner.calls == 1
+
+    # a new process only sees the persistent tier
+    restarted = CachingTranslator(CountingTranslator(), store=store, provider="CountingTranslator")
+    assert await restarted.translate_text("hello", Language.EN, Language.HI) == "hello (Hindi)"
+    assert restarted.translator.calls == 0
+    stats = restarted.stats()
+    assert stats.store_hits == 1 and stats.misses == 0
+
+    await translator.seed([("title", Language.EN, Language.KN, "seeded")])
+    assert await translator.translate_text("title", Language.EN, Language.KN) == "seeded"
+    assert inner.calls == 1
+
+
+class PackingTranslator(CountingTranslator):
+    max_batch_items = 2
+    max_batch_chars = 100
+
+    def __init__(self, failing=()):
+        super().__init__()
+        self.packs = []
+        self.failing = failing
+
+    async def _translate_pack(self, texts, source_language, destination_language):
+        self.packs.append(texts)
+        if any(text in self.failing for text in texts):
+            raise ValueError("provider failure")
+        return [f"{text} ({destination_language.value})" for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_translate_batch():
+    inner = PackingTranslator()
+    translator = CachingTranslator(inner)
+    texts = ["a", "b", "a", "c", "d"]
+    translated = await translator.translate_batch(texts, Language.EN, Language.HI)
+    assert translated == [f"{text} (Hindi)" for text in texts]
+    # duplicates are translated once and packs respect max_batch_items
+    assert sorted(inner.packs) == [["a", "b"], ["c", "d"]]
+
+    translated = await translator.translate_batch(["a", "e"], Language.EN, Language.HI)
+    assert translated == ["a (Hindi)", "e (Hindi)"]
+    assert inner.packs[-1] == ["e"]
+
+
+@pytest.mark.asyncio
+async def test_composite_translate_batch_fallback():
+    primary = PackingTranslator(failing=("b",))
+    fallback = PackingTranslator()
+    translator = CompositeTranslator(primary, fallback)
+    translated = await translator.translate_batch(["a", "b", "c"], Language.EN, Language.KN)
+    assert translated == ["a (Kannada)", "b (Kannada)", "c (Kannada)"]
+    # the whole failed pack falls back, the successful one does not
+    assert fallback.packs == [["a", "b"]]
+
+    broken = CompositeTranslator(PackingTranslator(failing=("x",)))
+    results = await broken.translate_batch(["x", "y", "z"], Language.EN, Language.KN,
+                                           return_exceptions=True)
+    assert isinstance(results[0], Exception) and isinstance(results[1], Exception)
+    assert results[2] == "z (Kannada)"
+    with pytest.raises(ExceptionGroup):
+        await broken.translate_batch(["x", "y"], Language.EN, Language.KN)